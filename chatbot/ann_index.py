@@ -0,0 +1,340 @@
+# chatbot/ann_index.py
+"""
+Search backends for a restaurant's menu vectors.
+
+- ExactSearchBackend: scores every row (best for small menus).
+- IVFSearchBackend: inverted-file index in pure NumPy. Rows are grouped
+  around `nlist` k-means centroids; a query only scores the rows of its
+  `nprobe` closest lists, trading a little recall for much less work on
+  large catalogs.
+
+The IVF structure is built by generate_embeddings and saved next to the
+vectors as menu_ann_ivf.npz, tagged with the vector file's build_id so a
+stale file is never paired with new vectors.
+
+Kernel: builds store L2-normalized rows (header "normalized": true), so
+cosine similarity is one matrix-vector product against the mapped rows,
+with no per-query renormalization of the corpus; top-k is argpartition
+plus a sort of the k winners. search_batch() scores many queries with
+one matrix-matrix product. Rows may be stored as float16 (half the
+memory); they are then upcast to float32 block by block while scoring,
+which costs several times the CPU of float32 rows (NumPy has no fast
+half-precision matmul), so float16 is for memory-bound nodes only.
+`manage.py bench_menu_search` measures both. Older unnormalized files
+get their inverse row norms computed once at load instead.
+
+Both backends take an optional boolean row mask (structured filters,
+see search_filters.py): only allowed rows are scored and returned.
+
+Tuning (env):
+    MENU_ANN_BACKEND   "ivf" (default) or "exact"
+    MENU_ANN_MIN_ROWS  partitions smaller than this always use exact search
+    MENU_ANN_NLIST     number of lists (default ~4*sqrt(rows))
+    MENU_ANN_NPROBE    lists scanned per query (higher = better recall, slower)
+"""
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# ============================================
+# Configuration
+# ============================================
+ANN_BACKEND = os.getenv("MENU_ANN_BACKEND", "ivf").lower()
+ANN_MIN_ROWS = int(os.getenv("MENU_ANN_MIN_ROWS", "5000"))
+ANN_NLIST = int(os.getenv("MENU_ANN_NLIST", "0"))  # 0 = derive from row count
+ANN_NPROBE = int(os.getenv("MENU_ANN_NPROBE", "8"))
+ANN_KMEANS_ITERATIONS = 20
+ANN_KMEANS_SAMPLE = 50_000
+# Rows converted to float32 at a time when scoring float16 vectors or
+# assigning rows to IVF lists
+SCORE_BLOCK_ROWS = 16384
+# Masks allowing fewer rows than this fraction gather just those rows;
+# denser masks score everything and drop the rest
+MASK_GATHER_FRACTION = 0.5
+
+IVF_FILENAME = "menu_ann_ivf.npz"
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _normalize_query(query: np.ndarray) -> np.ndarray:
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(query)
+    return query / norm if norm else query
+
+
+def _normalize_queries(queries: np.ndarray) -> np.ndarray:
+    queries = np.asarray(queries, dtype=np.float32)
+    return _normalize_rows(queries.reshape(-1, queries.shape[-1]))
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the top_k scores, best first (O(n) selection + O(k log k))."""
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    best = np.argpartition(-scores, top_k - 1)[:top_k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def score_matrix(vectors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """
+    vectors @ queries for a (rows, dim) matrix and a (dim,) or (dim, m)
+    right-hand side; float16 rows are upcast block by block.
+    """
+    if vectors.dtype == np.float32:
+        return vectors @ queries
+    out = np.empty((len(vectors),) + queries.shape[1:], dtype=np.float32)
+    for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+        block = np.asarray(vectors[start: start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        out[start: start + len(block)] = block @ queries
+    return out
+
+
+def inverse_row_norms(vectors: np.ndarray) -> np.ndarray:
+    """1 / ||row|| (1 for zero rows), computed block by block."""
+    norms = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+        block = np.asarray(vectors[start: start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        norms[start: start + len(block)] = np.linalg.norm(block, axis=1)
+    norms[norms == 0] = 1.0
+    return 1.0 / norms
+
+
+class ExactSearchBackend:
+    """
+    Cosine similarity against every row.
+    """
+    name = "exact"
+
+    def __init__(self, vectors: np.ndarray, normalized: bool = False):
+        self.vectors = vectors
+        # Legacy unnormalized rows: scale scores by 1/||row||, computed once
+        self.inv_norms = None if normalized or len(vectors) == 0 else inverse_row_norms(vectors)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine scores for normalized query column(s): (rows,) or (rows, m)."""
+        scores = score_matrix(self.vectors, queries)
+        if self.inv_norms is not None:
+            scores *= self.inv_norms if scores.ndim == 1 else self.inv_norms[:, None]
+        return scores
+
+    def search(
+        self, query: np.ndarray, top_k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self.vectors) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        q = _normalize_query(query)
+        if mask is not None:
+            allowed = np.flatnonzero(mask)
+            if len(allowed) < MASK_GATHER_FRACTION * len(self.vectors):
+                scores = self.score_subset(q, allowed)
+                order = _top_k(scores, top_k)
+                return allowed[order], scores[order]
+
+        scores = self.scores(q)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(np.count_nonzero(mask)))
+        order = _top_k(scores, top_k)
+        return order, scores[order]
+
+    def score_subset(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine scores of a normalized query against the given rows only."""
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ q
+        if self.inv_norms is not None:
+            scores *= self.inv_norms[rows]
+        return scores
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for many queries with one matrix-matrix product."""
+        queries = _normalize_queries(queries)
+        if len(self.vectors) == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(queries)
+
+        scores = self.scores(queries.T)
+        results = []
+        for j in range(scores.shape[1]):
+            column = scores[:, j]
+            order = _top_k(column, top_k)
+            results.append((order, column[order]))
+        return results
+
+
+class IVFSearchBackend:
+    """
+    Inverted-file (IVF-Flat) index over cosine similarity.
+
+    list_rows holds row ids grouped by list; list i owns
+    list_rows[list_offsets[i]:list_offsets[i + 1]].
+    """
+    name = "ivf"
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        nprobe: int = ANN_NPROBE,
+        normalized: bool = False,
+    ):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.nprobe = max(1, min(nprobe, len(centroids)))
+        self.normalized = normalized
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def search(
+        self, query: np.ndarray, top_k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        q = _normalize_query(query)
+
+        # 1) Closest lists
+        centroid_scores = self.centroids @ q
+        probe = np.argpartition(-centroid_scores, self.nprobe - 1)[: self.nprobe]
+
+        # 2) Candidate rows from those lists only
+        candidates = np.concatenate(
+            [self.list_rows[self.list_offsets[i]: self.list_offsets[i + 1]] for i in probe]
+        )
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+            if len(candidates) < top_k:
+                # A selective filter leaves the probed lists (nearly) empty:
+                # scan every allowed row instead
+                candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # 3) Exact cosine on the candidates
+        candidate_vectors = np.asarray(self.vectors[candidates], dtype=np.float32)
+        scores = candidate_vectors @ q
+        if not self.normalized:
+            norms = np.linalg.norm(candidate_vectors, axis=1)
+            norms[norms == 0] = 1.0
+            scores /= norms
+
+        order = _top_k(scores, top_k)
+        return candidates[order], scores[order]
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # Each query probes different lists, so there is no shared matmul
+        return [self.search(q, top_k) for q in _normalize_queries(queries)]
+
+
+def train_ivf(
+    vectors: np.ndarray,
+    nlist: Optional[int] = None,
+    iterations: int = ANN_KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Spherical k-means over the (normalized) rows.
+    Returns (centroids, list_offsets, list_rows).
+
+    `vectors` may be the build's memory-mapped rows: only the k-means
+    sample (at most ANN_KMEANS_SAMPLE rows) is read into memory, and
+    rows are assigned to lists SCORE_BLOCK_ROWS at a time.
+    """
+    n_rows = len(vectors)
+    if nlist is None or nlist <= 0:
+        nlist = ANN_NLIST or int(4 * np.sqrt(n_rows))
+    nlist = max(1, min(nlist, n_rows))
+
+    rng = np.random.default_rng(seed)
+    if n_rows > ANN_KMEANS_SAMPLE:
+        # Sorted, so a mapped file is read front to back
+        sample = _normalize_rows(vectors[np.sort(rng.choice(n_rows, ANN_KMEANS_SAMPLE, replace=False))])
+    else:
+        sample = _normalize_rows(vectors)
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=nlist)
+
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random rows so every list stays useful
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+
+    # A row's norm doesn't change its best centroid: no need to normalize
+    assignment = np.empty(n_rows, dtype=np.int64)
+    for start in range(0, n_rows, SCORE_BLOCK_ROWS):
+        block = np.asarray(vectors[start: start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        assignment[start: start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+    counts = np.bincount(assignment, minlength=nlist)
+    list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return centroids.astype(np.float32), list_offsets, list_rows
+
+
+def write_ivf_file(index_dir: Path, vectors: np.ndarray, build_id: str) -> Optional[Path]:
+    """
+    Train and persist the IVF structure for a partition, if it is large
+    enough to benefit. Returns the written path, or None.
+    """
+    path = Path(index_dir) / IVF_FILENAME
+    if len(vectors) < ANN_MIN_ROWS:
+        # Small partition: exact search is faster; drop any old IVF file.
+        path.unlink(missing_ok=True)
+        return None
+
+    centroids, list_offsets, list_rows = train_ivf(vectors)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            centroids=centroids,
+            list_offsets=list_offsets,
+            list_rows=list_rows,
+            build_id=np.array(build_id),
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_search_backend(
+    index_dir: Path, vectors: np.ndarray, build_id: Optional[str], normalized: bool = False
+):
+    """
+    Pick the backend for one partition: IVF when enabled, large enough
+    and persisted for this exact build; exact search otherwise.
+    `normalized` says the rows are stored unit-length (vector file header).
+    """
+    if ANN_BACKEND != "ivf" or len(vectors) < ANN_MIN_ROWS:
+        return ExactSearchBackend(vectors, normalized=normalized)
+
+    path = Path(index_dir) / IVF_FILENAME
+    if not path.exists():
+        return ExactSearchBackend(vectors, normalized=normalized)
+
+    with np.load(path, allow_pickle=False) as data:
+        if str(data["build_id"]) != str(build_id):
+            print(f"[RAG] Ignoring stale ANN index at {path}")
+            return ExactSearchBackend(vectors, normalized=normalized)
+        return IVFSearchBackend(
+            vectors,
+            centroids=data["centroids"],
+            list_offsets=data["list_offsets"],
+            list_rows=data["list_rows"],
+            normalized=normalized,
+        )
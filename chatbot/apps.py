@@ -1,6 +1,15 @@
+import os
+
 from django.apps import AppConfig
 
 
 class ChatbotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot'
+
+    def ready(self):
+        # Opt-in eager warm-up for web workers (e.g. set it in the gunicorn env).
+        # Management commands leave it unset and never load the embedding model.
+        if os.getenv("CHATBOT_WARM_UP_ON_START", "False") == "True":
+            from .engine import start_warm_up
+            start_warm_up()
@@ -0,0 +1,245 @@
+# chatbot/embedders.py
+"""
+Embedding model backends for the chatbot and the generate_embeddings command.
+
+    EMBEDDING_BACKEND=torch   (default) full sentence-transformers model
+    EMBEDDING_BACKEND=onnx    exported ONNX graph run with onnxruntime
+
+The ONNX backend only needs `onnxruntime` + `tokenizers` at runtime, so a
+worker never imports torch/transformers. Export it once with:
+
+    python manage.py export_onnx_model [--quantize]
+
+which also runs a parity check against the torch model. The export
+records which model it came from, and loading it for any other model
+name fails instead of labelling its vectors with the wrong model id.
+"""
+import os
+import json
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+# ============================================
+# Configuration
+# ============================================
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_DIR = Path(os.getenv("EMBEDDING_ONNX_DIR", "models/onnx/all-mpnet-base-v2"))
+EMBEDDING_ONNX_QUANTIZED = os.getenv("EMBEDDING_ONNX_QUANTIZED", "False") == "True"
+
+ONNX_MODEL_FILENAME = "model.onnx"
+ONNX_QUANTIZED_FILENAME = "model.int8.onnx"
+ONNX_CONFIG_FILENAME = "embedder_config.json"
+TOKENIZER_FILENAME = "tokenizer.json"
+
+PARITY_SENTENCES = [
+    "butter naan",
+    "something sweet for dessert",
+    "spicy chicken biryani",
+    "vegetarian starters under 200",
+    "Category: Breads. Item: Garlic Naan. Price: 60.00",
+    "Category: Desserts. Item: Gulab Jamun. Price: 90.00",
+]
+
+
+def embedding_model_id(model_name: str) -> str:
+    """
+    Identifier of the vectors a backend produces (used in cache keys and
+    index headers). Quantized ONNX vectors differ slightly from torch ones.
+    """
+    if EMBEDDING_BACKEND == "onnx":
+        suffix = "onnx-int8" if EMBEDDING_ONNX_QUANTIZED else "onnx"
+        return f"{model_name}@{suffix}"
+    return model_name
+
+
+class OnnxSentenceEncoder:
+    """
+    Drop-in replacement for SentenceTransformer.encode() backed by an
+    exported ONNX graph: tokenize -> transformer -> mean pooling -> L2 norm.
+
+    With `model_name`, the export must be of that model (its config records
+    what export_onnx_model exported); otherwise vectors from one model would
+    be labelled with another's embedding_model_id().
+    """
+
+    def __init__(
+        self,
+        model_dir: Path = EMBEDDING_ONNX_DIR,
+        quantized: bool = EMBEDDING_ONNX_QUANTIZED,
+        model_name: Optional[str] = None,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / (ONNX_QUANTIZED_FILENAME if quantized else ONNX_MODEL_FILENAME)
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"ONNX model not found at {model_path}. "
+                "Run: python manage.py export_onnx_model"
+            )
+
+        with open(model_dir / ONNX_CONFIG_FILENAME, "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        if model_name and self.config.get("model") != model_name:
+            raise ValueError(
+                f"ONNX model at {model_dir} is an export of {self.config.get('model')!r}, "
+                f"not {model_name!r}. Run: python manage.py export_onnx_model --model {model_name}"
+            )
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(
+            pad_id=self.config.get("pad_token_id", 1),
+            pad_token=self.config.get("pad_token", "<pad>"),
+        )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens (same as the sentence-transformers Pooling module)
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.config.get("normalize", True):
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            pooled = pooled / np.clip(norms, 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.config["dim"]), dtype=np.float32)
+
+        batches = [
+            self._encode_batch(texts[i: i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]
+        embeddings = np.concatenate(batches, axis=0)
+        return embeddings[0] if single else embeddings
+
+
+def load_embedding_model(model_name: str, backend: Optional[str] = None):
+    """
+    Build the configured embedding backend. Anything returned here has an
+    .encode(texts, convert_to_numpy=True, ...) compatible with SentenceTransformer.
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "onnx":
+        print(f"[RAG] Loading ONNX embedding model from {EMBEDDING_ONNX_DIR}...")
+        return OnnxSentenceEncoder(model_name=model_name)
+
+    # Imported lazily: pulls in torch + transformers
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def export_onnx_model(model_name: str, output_dir: Path, quantize: bool = False) -> Path:
+    """
+    Export a sentence-transformers model's transformer to ONNX (plus the
+    tokenizer and pooling config), optionally with an int8-quantized copy.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    model_path = output_dir / ONNX_MODEL_FILENAME
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[n] for n in input_names),
+            str(model_path),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+    tokenizer.save_pretrained(str(output_dir))  # writes tokenizer.json
+    config = {
+        "model": model_name,
+        "dim": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+        "normalize": any(type(m).__name__ == "Normalize" for m in st_model),
+    }
+    with open(output_dir / ONNX_CONFIG_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            str(model_path),
+            str(output_dir / ONNX_QUANTIZED_FILENAME),
+            weight_type=QuantType.QInt8,
+        )
+
+    return model_path
+
+
+def check_parity(
+    model_name: str,
+    model_dir: Path,
+    quantized: bool = False,
+    sentences: Optional[List[str]] = None,
+    tolerance: float = 0.02,
+) -> dict:
+    """
+    Compare pairwise cosine scores from the ONNX model against the torch
+    model. Returns {"max_abs_diff", "tolerance", "ok"}.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    sentences = sentences or PARITY_SENTENCES
+    reference = SentenceTransformer(model_name, device="cpu").encode(
+        sentences, convert_to_numpy=True, normalize_embeddings=True
+    )
+    candidate = OnnxSentenceEncoder(model_dir, quantized=quantized, model_name=model_name).encode(sentences)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+
+    diff = np.abs(reference @ reference.T - candidate @ candidate.T)
+    max_abs_diff = float(diff.max())
+    return {
+        "max_abs_diff": max_abs_diff,
+        "tolerance": tolerance,
+        "ok": max_abs_diff <= tolerance,
+    }
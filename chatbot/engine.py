@@ -1,54 +1,107 @@
 import os
 import json
+import time
+import hashlib
+import queue
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import Optional, List, Dict
+from typing import Optional, Iterator, List, Dict, Tuple
 from pathlib import Path
 import re
 
 from dotenv import load_dotenv
-from groq import Groq
-from sentence_transformers import SentenceTransformer, util
 
+# Load .env before the local modules read their configuration
 load_dotenv()
 
+from .embedders import embedding_model_id, load_embedding_model
+from .intent_classifier import rank_intents, train_intent_classifier
+from .llm_gateway import LLMUnavailable, get_llm_gateway
+from .index_events import IndexListener, get_generation_store
+from .index_manager import MENU_INDEX_MEMORY_BUDGET_MB, IndexManager
+from .menu_index import (
+    COMMON_TYPO_MAP,
+    RestaurantIndex,
+    load_restaurant_index,
+)
+from .search_filters import SearchFilters, parse_search_filters
+
 # ============================================
 # Configuration
 # ============================================
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-EMBEDDINGS_PATH = Path("menu_embeddings.npy")
-CHUNKS_PATH = Path("text_chunks.json")
 MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+# torch / onnx backend (+ quantization) is part of the vector identity
+EMBED_MODEL_ID = embedding_model_id(MODEL_NAME)
+
+# Query-embedding cache (short terms like "dessert", "naan" repeat constantly)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "3600"))
+
+# LLM used for intent classification / conversational replies.
+# Bump INTENT_PROMPT_VERSION whenever the classifier prompt changes so
+# cached classifications from the old prompt are ignored.
+INTENT_LLM_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct"
+INTENT_PROMPT_VERSION = "v2"
+INTENT_CACHE_MAX_SIZE = int(os.getenv("INTENT_CACHE_MAX_SIZE", "10000"))
+INTENT_CACHE_TTL = int(os.getenv("INTENT_CACHE_TTL", "86400"))
+
+# Local embedding classifier: skip the LLM when the top intent wins by this
+# probability margin (also the primary classifier when the LLM is down)
+LOCAL_INTENT_MIN_MARGIN = float(os.getenv("LOCAL_INTENT_MIN_MARGIN", "0.5"))
+
+# Semantic cache for conversational (HELP fallback) replies
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+RESPONSE_CACHE_MAX_PER_RESTAURANT = int(os.getenv("RESPONSE_CACHE_MAX_PER_RESTAURANT", "256"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "21600"))
+
+# Fuse BM25 / trigram name matching with vector search (and skip the
+# embedding entirely for exact / near-exact dish names)
+HYBRID_SEARCH = os.getenv("MENU_HYBRID_SEARCH", "True") == "True"
+
+# Listen for published index rebuilds (chatbot/index_events.py)
+INDEX_LISTENER_ENABLED = os.getenv("INDEX_LISTENER_ENABLED", "True") == "True"
+
+# Cross-request micro-batching of query encodes
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "True") == "True"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
 
 # ============================================
 # Global state (loaded once)
 # ============================================
 _embed_model = None
-_embeddings = None
-_text_chunks = None
-_groq_client = None
+_intent_classifier = None
 
+# Lazy initialization state (see load_rag_system / warm_up)
+_init_lock = threading.RLock()
+_rag_ready = threading.Event()
+_warm_up_thread: Optional[threading.Thread] = None
+
+_index_listener: Optional[IndexListener] = None
+_index_listener_lock = threading.Lock()
+
+
+class RagWarmingUp(Exception):
+    """
+    The turn needs the embedding model, which is still loading, and the
+    caller asked not to wait for it (parse_message(wait_for_model=False)).
+    """
 
-# Common restaurant typos / aliases
-COMMON_TYPO_MAP = {
-    "desert": "dessert",
-    "deserts": "desserts",
-    # you can add more later here...
-}
-COMMON_TYPO_MAP = {
-    "desert": "dessert",
-    "deserts": "desserts",
-    # you can add more later here...
-}
 
 def build_search_items_reply(
     user_query: str,
     normalized_term: str,
     retrieved_items: List[Dict[str, any]],
+    heading: Optional[str] = None,
 ) -> str:
     """
     Build a clean, bullet-style reply for SEARCH_ITEM queries
-    using the semantic search results.
+    using the semantic search results. `heading` (the active filters,
+    e.g. "vegan desserts under ₹200") replaces the "<category> options"
+    heading derived from them.
     """
     # Try to find a primary category from the results
     primary_category = None
@@ -63,7 +116,9 @@ def build_search_items_reply(
     heading_term = primary_category or (normalized_term.title() if normalized_term else None)
 
     lines: List[str] = []
-    if heading_term:
+    if heading:
+        lines.append(f"Here are some {heading} from our menu:")
+    elif heading_term:
         lines.append(f"Here are some {heading_term} options from our menu:")
     else:
         lines.append("Here are some items from our menu:")
@@ -130,177 +185,559 @@ def normalize_search_term(term: str) -> str:
     return t
 
 
-# Track last-known modification times so we can hot-reload embeddings
-_emb_last_mtime: Optional[float] = None
-_chunks_last_mtime: Optional[float] = None
-
-
 def load_rag_system():
     """
-    Load embeddings, chunks, and models (called once on startup
-    or after a forced reload).
+    Load the embedding model (the LLM gateway is created separately,
+    see chatbot/llm_gateway.py).
+
+    Nothing is loaded at import time: this runs on first use (or from
+    warm_up()), so migrate / createsuperuser / Celery boot never import
+    sentence_transformers or torch.
+
+    Menu embeddings are NOT loaded here: each restaurant has its own
+    index which is loaded lazily by get_restaurant_index().
     """
-    global _embed_model, _embeddings, _text_chunks, _groq_client
-    global _emb_last_mtime, _chunks_last_mtime
+    global _embed_model
 
     # If everything is already loaded, don't do the work again.
-    if _embed_model is not None and _embeddings is not None and _text_chunks is not None:
+    if _embed_model is not None:
         return
 
-    print("[RAG] Loading embedding model and data...")
+    with _init_lock:
+        if _embed_model is None:
+            print("[RAG] Loading embedding model...")
+            # Torch or ONNX backend (see chatbot/embedders.py); kept in memory,
+            # doesn't change when menus change
+            _embed_model = load_embedding_model(MODEL_NAME)
+            _rag_ready.set()
 
-    # 1) Load sentence transformer (kept in memory; doesn't change when files change)
-    if _embed_model is None:
-        _embed_model = SentenceTransformer(MODEL_NAME)
-
-    # 2) Load embeddings from disk
-    if EMBEDDINGS_PATH.exists():
-        _embeddings = np.load(EMBEDDINGS_PATH)
-        _emb_last_mtime = EMBEDDINGS_PATH.stat().st_mtime
-        print(f"[RAG] Loaded embeddings: {_embeddings.shape}")
-    else:
-        raise FileNotFoundError(f"Embeddings not found at {EMBEDDINGS_PATH}")
-
-    # 3) Load text chunks from disk
-    if CHUNKS_PATH.exists():
-        with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-            _text_chunks = json.load(f)
-        _chunks_last_mtime = CHUNKS_PATH.stat().st_mtime
-        print(f"[RAG] Loaded {len(_text_chunks)} text chunks")
-    else:
-        raise FileNotFoundError(f"Text chunks not found at {CHUNKS_PATH}")
-
-    # 4) Initialize Groq client
-    if GROQ_API_KEY:
-        if _groq_client is None:
-            _groq_client = Groq(api_key=GROQ_API_KEY)
-        print("[RAG] Groq client initialized")
-    else:
+    if get_llm_gateway() is None:
         print("[RAG] Warning: GROQ_API_KEY not set. LLM features disabled.")
 
 
-def reload_rag_system():
+def is_rag_ready() -> bool:
     """
-    Force reload of embeddings and chunks from disk
-    in *this* process.
-
-    Used by Celery or manually when you know the files changed.
+    True once the embedding model is loaded in this process,
+    i.e. a search won't pay the model startup cost. The chat views
+    don't wait for it: until then, turns that need the model get a
+    "warming up" reply (see RagWarmingUp).
     """
-    global _embed_model, _embeddings, _text_chunks
-    global _emb_last_mtime, _chunks_last_mtime
+    return _rag_ready.is_set()
 
-    # We keep the model object (it's big, doesn't depend on menu)
-    # and only force re-load of embeddings + chunks.
-    _embeddings = None
-    _text_chunks = None
-    _emb_last_mtime = None
-    _chunks_last_mtime = None
 
+def warm_up(warm_terms: Optional[List[str]] = None):
+    """
+    Explicit warm-up hook: load the model, run a first forward pass and
+    optionally pre-fill the query-embedding cache. Blocks until done.
+    """
     load_rag_system()
+    _embed_model.encode(["warm up"], convert_to_numpy=True)
+    get_intent_classifier()
+    if warm_terms:
+        warm_query_cache(warm_terms)
+    print("[RAG] Ready")
 
 
-def ensure_latest_embeddings():
+def start_warm_up():
     """
-    Ensure this process has the latest version of embeddings / text chunks.
-
-    Called at the start of semantic_search(). If Celery has regenerated
-    menu_embeddings.npy / text_chunks.json, this will detect the changed
-    modification times and reload the arrays into the Django process.
+    Non-blocking warm-up: start warm_up() in a background thread once per
+    process. Safe to call on every request.
     """
-    global _embed_model, _embeddings, _text_chunks
-    global _emb_last_mtime, _chunks_last_mtime
+    global _warm_up_thread
 
-    # Make sure we have at least one load
-    if _embed_model is None or _embeddings is None or _text_chunks is None:
-        load_rag_system()
+    if _rag_ready.is_set():
         return
+    with _init_lock:
+        if _warm_up_thread is not None and _warm_up_thread.is_alive():
+            return
+
+        def _run():
+            try:
+                warm_up()
+            except Exception as e:
+                print(f"[RAG] Warning: Could not load RAG system: {e}")
+                print("[RAG] Chatbot will use fallback mode.")
+
+        _warm_up_thread = threading.Thread(target=_run, name="rag-warm-up", daemon=True)
+        _warm_up_thread.start()
+
+
+def reload_rag_system(restaurant_id: Optional[int] = None):
+    """
+    Force reload of menu indexes from disk in *this* process.
 
-    # If files are missing, nothing to do
-    if not EMBEDDINGS_PATH.exists() or not CHUNKS_PATH.exists():
+    With a restaurant_id only that restaurant's index is re-read; every
+    other tenant keeps its in-memory index untouched. Other processes are
+    notified through publish_index_update() (see chatbot/index_events.py).
+    """
+    # We keep the model object (it's big, doesn't depend on menu)
+    # and only force re-load of the per-restaurant indexes.
+    if restaurant_id is None:
+        _index_manager.clear()
+        _response_cache.invalidate()
         return
 
-    current_emb_mtime = EMBEDDINGS_PATH.stat().st_mtime
-    current_chunks_mtime = CHUNKS_PATH.stat().st_mtime
+    _swap_restaurant_index(int(restaurant_id))
+
+
+def _read_index(restaurant_id: int, generation: Optional[int] = None) -> Tuple[Optional[RestaurantIndex], int]:
+    """
+    IndexManager loader: read one restaurant's index from disk, together
+    with the generation it corresponds to.
+    """
+    if generation is None:
+        # Read before loading: a bump that races with the load is
+        # delivered afterwards and triggers another swap.
+        try:
+            generation = get_generation_store().get(restaurant_id)
+        except Exception as e:
+            print(f"[RAG] Could not read index generation: {e}")
+            generation = 0
+
+    # An index encoded with another model / backend counts as missing
+    index = load_restaurant_index(restaurant_id, model_id=EMBED_MODEL_ID)
+    if index is not None:
+        print(
+            f"[RAG] Mapped index for restaurant_id={restaurant_id}: "
+            f"{index.embeddings.shape}, rows: {len(index)}, "
+            f"build: {index.build_id}, generation: {generation}"
+        )
+    return index, generation
+
+
+# restaurant_id -> RestaurantIndex for the tenants active in this process
+# (each tenant only ever searches its own rows); LRU under a memory budget
+_index_manager = IndexManager(_read_index, MENU_INDEX_MEMORY_BUDGET_MB)
 
-    # First time we see mtimes – just record and continue
-    if _emb_last_mtime is None or _chunks_last_mtime is None:
-        _emb_last_mtime = current_emb_mtime
-        _chunks_last_mtime = current_chunks_mtime
+
+def _swap_restaurant_index(restaurant_id: int, generation: Optional[int] = None):
+    _index_manager.reload(restaurant_id, generation)
+    _response_cache.invalidate(restaurant_id)
+
+
+def _on_index_update(restaurant_id: int, generation: int):
+    """
+    Listener callback: swap in a rebuilt index. Restaurants that aren't
+    resident (never loaded, or evicted) are ignored; they'll be read
+    fresh on first use.
+    """
+    known = _index_manager.generation(restaurant_id)
+    if known is None or generation <= known:
         return
+    print(f"[RAG] Index generation {generation} for restaurant_id={restaurant_id}; swapping in")
+    _swap_restaurant_index(restaurant_id, generation)
 
-    # If nothing changed, we’re good
-    if (
-        current_emb_mtime == _emb_last_mtime
-        and current_chunks_mtime == _chunks_last_mtime
-    ):
+
+def _resync_index_generations():
+    """
+    Listener safety net: compare the generations of loaded restaurants
+    with the shared store (after reconnects and periodically).
+    """
+    store = get_generation_store()
+    for restaurant_id, known in _index_manager.generations().items():
+        generation = store.get(restaurant_id)
+        if generation > known:
+            _on_index_update(restaurant_id, generation)
+
+
+def start_index_listener():
+    """
+    Start this process's index-invalidation listener (once per process;
+    a forked child starts its own).
+    """
+    global _index_listener
+
+    if not INDEX_LISTENER_ENABLED:
         return
+    if _index_listener is not None and _index_listener.pid == os.getpid():
+        return
+    with _index_listener_lock:
+        if _index_listener is None or _index_listener.pid != os.getpid():
+            _index_listener = IndexListener(_on_index_update, _resync_index_generations).start()
 
-    # Files changed on disk → reload arrays only
-    print("[RAG] Detected updated embeddings on disk; reloading in this process...")
 
-    _embeddings = np.load(EMBEDDINGS_PATH)
-    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-        _text_chunks = json.load(f)
+def get_restaurant_index(restaurant_id: Optional[int]) -> Optional[RestaurantIndex]:
+    """
+    Return the current index for one restaurant, or None if it
+    has never been generated.
+
+    The first call reads the files (one load even if many requests for
+    the restaurant arrive at once); after that this is an LRU lookup
+    until the tenant is evicted. Rebuilt indexes are swapped in by the
+    listener thread when the rebuild is published, so there are no
+    filesystem checks here.
+    """
+    if restaurant_id is None:
+        return None
 
-    _emb_last_mtime = current_emb_mtime
-    _chunks_last_mtime = current_chunks_mtime
+    start_index_listener()
+    return _index_manager.get(int(restaurant_id))
 
-    print(
-        f"[RAG] Reloaded embeddings: {_embeddings.shape}, "
-        f"chunks: {len(_text_chunks)}"
-    )
 
+def index_manager_stats() -> Dict[str, any]:
+    return _index_manager.stats()
 
-def semantic_search(query: str, top_k: int = 5) -> List[Dict[str, any]]:
+
+class LRUCache:
     """
-    Search for menu items using semantic similarity.
-    Returns list of dicts with 'text', 'score', 'parsed' info.
+    Bounded, thread-safe LRU cache with a per-entry TTL and hit/miss counters.
     """
-    # 🔁 Make sure this Django process sees the latest files that Celery wrote
-    ensure_latest_embeddings()
 
-    # By here we know _embed_model, _embeddings, _text_chunks are all loaded
-    query_emb = _embed_model.encode(query, convert_to_numpy=True)
-    scores = util.cos_sim(query_emb, _embeddings)[0]
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl_seconds <= 0 or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def store(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
 
-    # Get top_k results
-    top_indices = scores.argsort(descending=True)[:top_k].tolist()
 
-    results = []
-    for idx in top_indices:
-        text = _text_chunks[idx]
-        score = float(scores[idx])
+class EmbeddingCache(LRUCache):
+    """
+    LRU/TTL cache of query embeddings.
 
-        # Parse the text chunk: "Category: X. Item: Y. Price: Z"
-        parsed = parse_chunk_text(text)
+    Keyed by (model id, normalized term) so a model swap never serves
+    vectors from the old model.
+    """
 
-        results.append(
-            {
-                "text": text,
-                "score": score,
-                "parsed": parsed,
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join((text or "").lower().split())
+
+    def get(self, model_id: str, text: str) -> Optional[np.ndarray]:
+        return self.lookup((model_id, self.normalize(text)))
+
+    def put(self, model_id: str, text: str, vector: np.ndarray):
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)  # shared between requests
+        self.store((model_id, self.normalize(text)), vector)
+
+
+_query_embedding_cache = EmbeddingCache(QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL)
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent single-string encode requests from request threads
+    for up to `max_wait_ms`, runs ONE batched forward pass, and hands each
+    caller its own row back.
+
+    Identical texts inside a batch are encoded once.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int = 32, max_wait_ms: float = 5):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        # Stats
+        self.requests = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_size_histogram: Dict[int, int] = {}
+
+    def _ensure_worker(self):
+        # (Re)start the worker lazily; after a fork the thread doesn't exist
+        # in the child, so key it on the pid.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="embedding-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        with self._lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _collect_batch(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = self.encode_fn(texts)
+                by_text = {text: np.asarray(vec, dtype=np.float32) for text, vec in zip(texts, vectors)}
+                for text, future in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            bucket = 1 << (len(batch) - 1).bit_length()  # 1, 2, 4, 8, ...
+            with self._lock:
+                self.batches += 1
+                self.batch_size_histogram[bucket] = self.batch_size_histogram.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
             }
-        )
 
-    return results
 
-def parse_chunk_text(chunk: str) -> Dict[str, str]:
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    if _embed_model is None:
+        load_rag_system()
+    return _embed_model.encode(texts, convert_to_numpy=True, batch_size=len(texts))
+
+
+_embedding_batcher = EmbeddingBatcher(
+    _encode_batch, EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS
+)
+
+
+def embedding_batcher_stats() -> Dict[str, any]:
+    return _embedding_batcher.stats()
+
+
+def embed_query(text: str, wait_for_model: bool = True) -> np.ndarray:
     """
-    Parse chunk like 'Category: Breads. Item: Butter Naan. Price: 50'
-    Returns dict with 'category', 'name', 'price'
+    Embedding for a search term, served from the in-process LRU cache
+    when possible. Shared by ADD_ITEM, REMOVE_ITEM, SEARCH_ITEM and the
+    HELP fallback (they all go through semantic_search).
+
+    With wait_for_model=False a cache miss raises RagWarmingUp (and starts
+    the background warm-up) instead of loading the model on this thread.
     """
-    parts = {}
-    for segment in chunk.split(". "):
-        if ": " in segment:
-            key, value = segment.split(": ", 1)
-            parts[key.lower()] = value
-    
+    cached = _query_embedding_cache.get(EMBED_MODEL_ID, text)
+    if cached is not None:
+        return cached
+    if not wait_for_model and not is_rag_ready():
+        start_warm_up()
+        raise RagWarmingUp("Embedding model is still loading")
+
+    normalized = EmbeddingCache.normalize(text)
+    if EMBED_BATCHING:
+        # Batched with whatever other request threads are encoding right now
+        vector = _embedding_batcher.encode(normalized)
+    else:
+        vector = np.asarray(_encode_batch([normalized])[0], dtype=np.float32)
+
+    _query_embedding_cache.put(EMBED_MODEL_ID, text, vector)
+    return vector
+
+
+def warm_query_cache(terms: List[str]):
+    """
+    Pre-compute embeddings for frequent terms (e.g. category names or
+    popular dishes) so the first users don't pay the forward pass.
+    """
+    if _embed_model is None:
+        load_rag_system()
+
+    unique_terms = [t for t in dict.fromkeys(EmbeddingCache.normalize(t) for t in terms) if t]
+    if not unique_terms:
+        return
+    vectors = _embed_model.encode(unique_terms, convert_to_numpy=True)
+    for term, vector in zip(unique_terms, vectors):
+        _query_embedding_cache.put(EMBED_MODEL_ID, term, vector)
+    print(f"[RAG] Warmed query-embedding cache with {len(unique_terms)} terms")
+
+
+def query_cache_stats() -> Dict[str, any]:
+    return _query_embedding_cache.stats()
+
+
+# Search terms that name no dish or category ("what vegan dishes do you have")
+GENERIC_SEARCH_TERMS = {"", "dish", "dishes", "item", "items", "food", "options", "something", "anything", "menu"}
+# Rows listed when a search is only filters ("vegan options", "anything
+# under 150"), cheapest first; same cap as SHOW_MENU
+FILTER_LIST_LIMIT = 50
+
+
+def semantic_search(
+    query: str,
+    restaurant_id: Optional[int],
+    top_k: int = 5,
+    filters: Optional[SearchFilters] = None,
+    wait_for_model: bool = True,
+) -> List[Dict[str, any]]:
+    """
+    Search one restaurant's menu items using semantic similarity.
+    Only that restaurant's rows are scored.
+    Returns list of dicts with 'item_id', 'text', 'score', 'match_score', 'parsed' info.
+
+    With HYBRID_SEARCH the vector candidates are merged with the lexical
+    (BM25 + name trigram) candidates; a row's score is the higher of its
+    cosine and its name similarity, so a typo'd dish name can't be
+    outranked by noise. 'score' only ranks: 'match_score' is the cosine
+    (or the similarity of a decisive lexical match) and is what the
+    0.4 / 0.6 cart thresholds compare, since a shared prefix alone
+    ("paneer tikka" vs "Paneer Tikka Masala") must not add a dish.
+
+    `filters` (veg / vegan / price / category) become a row mask that is
+    applied before scoring, so every returned row satisfies them.
+
+    wait_for_model: see embed_query (a decisive lexical match never needs it).
+    """
+    index = get_restaurant_index(restaurant_id)
+    if index is None or len(index) == 0:
+        return []
+
+    mask = index.filter_mask(filters)
+    if mask is not None and not mask.any():
+        return []
+
+    if HYBRID_SEARCH:
+        # 1️⃣ The query names one dish ("butter naan", "buter naan"): no forward pass
+        decisive = index.lexical.decisive_match(query, mask=mask)
+        if decisive is not None:
+            best_row, best_sim = decisive
+            lex_rows, lex_sims = index.lexical.search(query, top_k, mask=mask)
+            results = [build_search_result(index, best_row, best_sim)]
+            # Neighbours of a decisive hit were never confirmed by the model
+            results += [
+                build_search_result(index, int(idx), float(sim), match_score=0.0)
+                for idx, sim in zip(lex_rows, lex_sims)
+                if idx != best_row
+            ]
+            return results[:top_k]
+
+    query_emb = embed_query(query, wait_for_model)
+
+    # Exact scan for small menus, IVF (approximate) for large partitions
+    top_indices, scores = index.search(query_emb, top_k, mask=mask)
+
+    if not HYBRID_SEARCH:
+        return [
+            build_search_result(index, int(idx), float(score))
+            for idx, score in zip(top_indices, scores)
+        ]
+
+    # 2️⃣ Fuse vector and lexical candidates: max(cosine, name similarity)
+    lex_rows, lex_sims = index.lexical.search(query, top_k, mask=mask)
+    name_sims = dict(zip(lex_rows.tolist(), lex_sims.tolist()))
+    candidates = np.array(
+        list(dict.fromkeys(top_indices.tolist() + lex_rows.tolist())), dtype=np.int64
+    )
+    cosine = index.score_rows(query_emb, candidates)
+    fused = np.maximum(
+        cosine,
+        np.array([name_sims.get(int(idx), 0.0) for idx in candidates], dtype=np.float32),
+    )
+    order = np.argsort(-fused, kind="stable")[:top_k]
+    return [
+        build_search_result(index, int(candidates[i]), float(fused[i]), match_score=float(cosine[i]))
+        for i in order
+    ]
+
+
+def build_search_result(
+    index: RestaurantIndex, idx: int, score: float, match_score: Optional[float] = None
+) -> Dict[str, any]:
+    """
+    One search hit straight from the index columns: MenuItem id,
+    the embedded text (LLM context) and the structured 'parsed' fields.
+    match_score defaults to score (see semantic_search).
+    """
+    row = index.row(idx)
     return {
-        "category": parts.get("category", ""),
-        "name": parts.get("item", ""),
-        "price": parts.get("price", "")
+        "item_id": row["id"],
+        "text": index.chunk_text(idx),
+        "score": score,
+        "match_score": score if match_score is None else match_score,
+        "parsed": {
+            "category": row["category"],
+            "name": row["name"],
+            "price": row["price"],
+        },
     }
 
+
+def build_suggestions(retrieved_items: List[Dict[str, any]]) -> List[Dict[str, any]]:
+    """
+    Structured menu suggestions for the frontend (same shape as SHOW_MENU).
+    """
+    suggestions: List[Dict[str, any]] = []
+    for item in retrieved_items:
+        parsed = item.get("parsed") or {}
+        name = parsed.get("name") or ""
+        if not name:
+            continue
+        suggestions.append(
+            {
+                "id": item.get("item_id"),
+                "name": name,
+                "price": parsed.get("price") or "",
+                "category": parsed.get("category") or "",
+            }
+        )
+    return suggestions
+
+
 @dataclass
 class ChatbotResult:
     """
@@ -313,6 +750,247 @@ class ChatbotResult:
     item_name: Optional[str] = None
     confidence: float = 1.0  # New: confidence score
     suggestions: Optional[List[Dict[str, str]]] = None  # NEW: menu suggestions for UI
+    reply_stream: Optional[Iterator[str]] = None  # streamed reply chunks (parse_message(stream=True))
+
+
+# ============================================
+# Rule-based fast path (runs before the LLM)
+# ============================================
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "a couple of": 2, "couple of": 2,
+    "half": 0.5, "half of": 0.5,
+}
+
+KEYWORD_INTENTS = {
+    "SHOW_MENU": {
+        "menu", "show menu", "see menu", "view menu", "the menu", "full menu",
+        "show me the menu", "show the menu", "show me menu", "open menu",
+    },
+    "SHOW_CART": {
+        "cart", "my cart", "show cart", "view cart", "show my cart", "my order",
+        "show order", "show my order", "whats in my cart", "what is in my cart",
+    },
+    "CLEAR_CART": {
+        "clear", "clear cart", "clear my cart", "empty cart", "empty my cart",
+        "clear order", "clear my order", "clear everything", "start over",
+    },
+    "CONFIRM_ORDER": {
+        "confirm", "confirm order", "confirm my order", "place order",
+        "place the order", "place my order", "checkout", "check out",
+    },
+    "HELP": {"help", "hi", "hello", "hey", "what can you do"},
+}
+
+# Words that make "add X" too vague to resolve without the LLM
+VAGUE_ITEM_WORDS = {
+    "something", "anything", "some", "more", "it", "that", "this",
+    "item", "items", "food", "dish", "dishes", "stuff", "all", "everything",
+}
+
+# Quantities the parser can't turn into a number ("a lot of naan", "a few samosas")
+VAGUE_QUANTITY_WORDS = {
+    "lot", "lots", "few", "bunch", "several", "many", "plenty", "dozen",
+    "couple", "bit", "little", "handful", "extra", "double", "triple",
+}
+
+# "remove X" targets that mean the whole cart, not a dish
+CART_WIDE_ITEMS = {
+    "everything", "all", "all items", "all the items", "all of it", "it all",
+    "cart", "my cart", "the cart", "order", "my order", "the order",
+    "whole order", "my whole order", "the whole order", "entire order", "my entire order",
+}
+
+_NUMBER_PATTERN = "|".join(
+    re.escape(w) for w in sorted(NUMBER_WORDS, key=len, reverse=True)
+)
+ADD_REMOVE_RE = re.compile(
+    r"^(?:please\s+)?(?P<verb>add|remove|delete)\s+"
+    rf"(?:(?P<qty>\d+|{_NUMBER_PATTERN})\s+(?:x\s+)?)?"
+    r"(?P<item>.+?)"
+    r"(?:\s+(?:to|from)\s+(?:my\s+|the\s+)?(?:cart|order))?"
+    r"(?:\s+please)?$"
+)
+QTY_X_ITEM_RE = re.compile(r"^(?P<qty>\d+)\s*x\s+(?P<item>.+)$")
+
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.9"))
+
+
+def _normalize_message(text: str) -> str:
+    t = (text or "").strip().lower().replace("’", "'")
+    t = re.sub(r"[^a-z0-9\s']", " ", t)
+    t = t.replace("'", "")
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def fast_parse_intent(message: str) -> Optional[Dict[str, any]]:
+    """
+    Deterministic local parser for the unambiguous message forms:
+    'menu', 'cart', 'clear', 'confirm', 'add 2 butter naan',
+    'remove one paneer tikka', '3 x garlic naan'.
+
+    Returns a dict shaped like classify_intent_with_llm()'s result with
+    a confidence, or None if the message isn't one of those forms.
+    """
+    text = _normalize_message(message)
+    if not text:
+        return None
+
+    for intent, phrases in KEYWORD_INTENTS.items():
+        if text in phrases:
+            return {"intent": intent, "item_name": None, "quantity": 1, "confidence": 0.99}
+
+    match = ADD_REMOVE_RE.match(text)
+    verb = match.group("verb") if match else None
+    if match is None:
+        match = QTY_X_ITEM_RE.match(text)
+        verb = "add" if match else None
+    if match is None:
+        return None
+
+    item_name = match.group("item").strip()
+    qty_raw = match.group("qty")
+    if qty_raw is None:
+        quantity = 1
+    elif qty_raw.isdigit():
+        quantity = int(qty_raw)
+    else:
+        quantity = NUMBER_WORDS[qty_raw]
+
+    # "remove everything", "delete my order" empty the cart
+    if verb != "add" and quantity == 1 and item_name in CART_WIDE_ITEMS:
+        return {"intent": "CLEAR_CART", "item_name": None, "quantity": 1, "confidence": 0.95}
+
+    words = item_name.split()
+    # No dish named ("add 2"), or a quantity we can't read ("add a lot of
+    # naan"): not a parse at all, so a fallback never acts on it
+    if (
+        not words
+        or all(w.isdigit() or w in NUMBER_WORDS for w in words)
+        or words[0] in VAGUE_QUANTITY_WORDS
+        or (len(words) > 1 and words[1] == "of")
+    ):
+        return None
+
+    intent = "ADD_ITEM" if verb == "add" else "REMOVE_ITEM"
+    confidence = 0.95
+
+    # Multiple items, vague targets, zero or fractions when adding -> let the LLM decide
+    if (
+        " and " in f" {item_name} "
+        or words[0] in VAGUE_ITEM_WORDS
+        or quantity < 1
+        or (intent == "ADD_ITEM" and quantity != int(quantity))
+    ):
+        confidence = 0.5
+
+    return {
+        "intent": intent,
+        "item_name": item_name,
+        "quantity": quantity,
+        "confidence": confidence,
+    }
+
+
+# ============================================
+# Intent classification cache
+# ============================================
+class IntentCache:
+    """
+    LLM intent classifications keyed by normalized message text plus the
+    prompt/model version.
+
+    A small in-process LRU sits in front of the shared Django cache
+    ("chatbot" alias, Redis when CHATBOT_CACHE_URL is set), so the same
+    message from any session or worker skips the Groq round trip. Without
+    Django (standalone scripts) only the local layer is used.
+    """
+
+    def __init__(self, version: str, max_size: int, ttl_seconds: float, alias: str = "chatbot"):
+        self.version = version
+        self.ttl_seconds = ttl_seconds
+        self.alias = alias
+        self.local = LRUCache(max_size, ttl_seconds)
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self._lock = threading.Lock()
+
+    def key(self, message: str) -> str:
+        digest = hashlib.sha1(
+            f"{self.version}|{_normalize_message(message)}".encode("utf-8")
+        ).hexdigest()
+        return f"chatbot:intent:{digest}"
+
+    def _shared(self):
+        try:
+            from django.conf import settings
+            if not settings.configured:
+                return None
+            from django.core.cache import caches
+            return caches[self.alias]
+        except Exception:
+            return None
+
+    def get(self, message: str) -> Optional[Dict[str, any]]:
+        key = self.key(message)
+        value = self.local.lookup(key)
+        if value is None:
+            shared = self._shared()
+            if shared is not None:
+                try:
+                    value = shared.get(key)
+                except Exception as e:
+                    # Cache outage must never break chat
+                    with self._lock:
+                        self.shared_errors += 1
+                    print(f"[RAG] Intent cache read error: {e}")
+                if value is not None:
+                    self.local.store(key, value)
+                    with self._lock:
+                        self.shared_hits += 1
+        return dict(value) if value is not None else None
+
+    def set(self, message: str, result: Dict[str, any]):
+        key = self.key(message)
+        value = dict(result)
+        self.local.store(key, value)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(key, value, timeout=self.ttl_seconds)
+            except Exception as e:
+                with self._lock:
+                    self.shared_errors += 1
+                print(f"[RAG] Intent cache write error: {e}")
+
+    def stats(self) -> Dict[str, any]:
+        local = self.local.stats()
+        with self._lock:
+            shared_hits = self.shared_hits
+            shared_errors = self.shared_errors
+        lookups = local["hits"] + local["misses"]
+        hits = local["hits"] + shared_hits
+        return {
+            "version": self.version,
+            "lookups": lookups,
+            "hits": hits,
+            "local_hits": local["hits"],
+            "shared_hits": shared_hits,
+            "misses": lookups - hits,
+            "hit_ratio": (hits / lookups) if lookups else 0.0,
+            "local_size": local["size"],
+            "shared_errors": shared_errors,
+        }
+
+
+_intent_cache = IntentCache(
+    f"{INTENT_PROMPT_VERSION}:{INTENT_LLM_MODEL}", INTENT_CACHE_MAX_SIZE, INTENT_CACHE_TTL
+)
+
+
+def intent_cache_stats() -> Dict[str, any]:
+    return _intent_cache.stats()
 
 
 def classify_intent_with_llm(message: str) -> Dict[str, any]:
@@ -320,12 +998,16 @@ def classify_intent_with_llm(message: str) -> Dict[str, any]:
     Use Groq LLM to classify user intent and extract entities.
     Returns dict with: intent, item_name, quantity, confidence
     """
-    if _groq_client is None:
-        load_rag_system()
+    cached = _intent_cache.get(message)
+    if cached is not None:
+        print(f"[RAG] Cached intent: {cached['intent']}, item: {cached.get('item_name')}, qty: {cached.get('quantity')}")
+        return cached
+
+    gateway = get_llm_gateway()
     
-    if not _groq_client:
+    if not gateway:
         # Fallback to rule-based if no LLM
-        return {"intent": "HELP", "confidence": 0.5}
+        return {"intent": "HELP", "confidence": 0.5, "llm_unavailable": True}
     
     prompt = f"""You are an intelligent restaurant ordering assistant. Your task is to analyze the user's message and extract their intent and any relevant details.
 
@@ -342,7 +1024,7 @@ AVAILABLE INTENTS:
 CRITICAL DISTINCTION:
 - "show menu" / "menu" = SHOW_MENU (wants to see everything)
 - "what do you have in desserts?" = SEARCH_ITEM with item_name="desserts"
-- "what vegetarian dishes?" = SEARCH_ITEM with item_name="vegetarian"
+- "what vegetarian dishes?" = SEARCH_ITEM with filters={{"vegetarian": true}}
 - "what's in your breads section?" = SEARCH_ITEM with item_name="breads"
 - "do you have biryani?" = SEARCH_ITEM with item_name="biryani"
 
@@ -352,6 +1034,7 @@ INSTRUCTIONS:
 - Be smart: "I want biryani" is ADD_ITEM, but "what desserts do you have?" is SEARCH_ITEM
 - For greetings or unclear messages, use HELP
 - If asking ABOUT items/categories (not requesting to add), use SEARCH_ITEM
+- For SEARCH_ITEM, put diet and price constraints in "filters" (vegetarian, vegan, min_price, max_price, category) and keep them out of item_name; omit "filters" when there are none
 
 USER MESSAGE: "{message}"
 
@@ -384,7 +1067,13 @@ Input: "tell me about your breads"
 Output: {{"intent": "SEARCH_ITEM", "item_name": "breads", "quantity": 1}}
 
 Input: "what vegetarian options?"
-Output: {{"intent": "SEARCH_ITEM", "item_name": "vegetarian", "quantity": 1}}
+Output: {{"intent": "SEARCH_ITEM", "item_name": null, "quantity": 1, "filters": {{"vegetarian": true}}}}
+
+Input: "veg starters under 200"
+Output: {{"intent": "SEARCH_ITEM", "item_name": "starters", "quantity": 1, "filters": {{"vegetarian": true, "max_price": 200, "category": "starters"}}}}
+
+Input: "any vegan desserts between 100 and 250?"
+Output: {{"intent": "SEARCH_ITEM", "item_name": "desserts", "quantity": 1, "filters": {{"vegan": true, "min_price": 100, "max_price": 250, "category": "desserts"}}}}
 
 Input: "what's in my cart?"
 Output: {{"intent": "SHOW_CART", "item_name": null, "quantity": 1}}
@@ -418,16 +1107,15 @@ Output: {{"intent": "HELP", "item_name": null, "quantity": 1}}
 
 NOW ANALYZE THE USER MESSAGE AND RESPOND WITH JSON ONLY:"""
     
+    response_text = ""
     try:
-        response = _groq_client.chat.completions.create(
-            model="meta-llama/llama-4-maverick-17b-128e-instruct",
-            messages=[{"role": "user", "content": prompt}],
+        response_text = gateway.chat(
+            [{"role": "user", "content": prompt}],
+            model=INTENT_LLM_MODEL,
             temperature=0.2,
-            max_tokens=250
+            max_tokens=250,
         )
         
-        response_text = response.choices[0].message.content.strip()
-        
         # Clean JSON response - handle markdown code blocks
         if response_text.startswith("```json"):
             response_text = response_text[7:]
@@ -452,6 +1140,9 @@ NOW ANALYZE THE USER MESSAGE AND RESPOND WITH JSON ONLY:"""
         result["confidence"] = 0.9
         
         print(f"[RAG] LLM parsed intent: {result['intent']}, item: {result.get('item_name')}, qty: {result.get('quantity')}")
+
+        # Only successful classifications are cached (errors fall through below)
+        _intent_cache.set(message, result)
         
         return result
         
@@ -459,20 +1150,224 @@ NOW ANALYZE THE USER MESSAGE AND RESPOND WITH JSON ONLY:"""
         print(f"[RAG] JSON parsing error: {e}")
         print(f"[RAG] Raw response: {response_text}")
         return {"intent": "HELP", "confidence": 0.3}
+    except LLMUnavailable as e:
+        # Breaker open / deadline gone: caller uses the local parse instead
+        print(f"[RAG] LLM unavailable: {e}")
+        return {"intent": "HELP", "confidence": 0.3, "llm_unavailable": True}
     except Exception as e:
+        # Upstream errors / over quota: also handled by the local classifier
         print(f"[RAG] LLM classification error: {e}")
-        return {"intent": "HELP", "confidence": 0.3}
+        return {"intent": "HELP", "confidence": 0.3, "llm_unavailable": True}
+
+
+# ============================================
+# Local (embedding) intent classifier
+# ============================================
+# Words dropped when pulling the dish / category out of a locally
+# classified message ("can i get two butter naan please" -> "butter naan")
+LOCAL_FILLER_WORDS = {
+    "i", "im", "id", "ill", "we", "want", "wanna", "would", "like", "to", "get",
+    "me", "us", "give", "can", "could", "please", "pls", "have", "order",
+    "add", "put", "in", "into", "my", "the", "cart", "remove", "delete",
+    "take", "out", "drop", "cancel", "dont", "anymore", "from", "do", "you",
+    "what", "whats", "which", "tell", "about", "your", "is", "are", "there",
+    "any", "available", "options", "option", "section", "serve", "show",
+    "something", "anything", "some", "more", "of", "plate", "plates", "for",
+    "one", "kind", "kinds", "types", "type",
+}
 
 
-def generate_conversational_response(user_query: str, retrieved_items: List[Dict[str, any]]) -> str:
+def get_intent_classifier():
     """
-    Generate natural conversational responses using LLM with retrieved menu context.
-    Similar to qa_menu.py's ask_llm function.
+    Local intent classifier, trained once per process on the example
+    utterances (chatbot/intent_classifier.py) with the resident embedding model.
+    """
+    global _intent_classifier
+
+    if _intent_classifier is None:
+        with _init_lock:
+            if _intent_classifier is None:
+                started = time.perf_counter()
+                _intent_classifier = train_intent_classifier(_encode_batch)
+                print(
+                    f"[RAG] Local intent classifier ({_intent_classifier.name}) trained "
+                    f"in {time.perf_counter() - started:.2f}s"
+                )
+    return _intent_classifier
+
+
+def _local_entities(text: str, intent: str):
+    """
+    (item_name, quantity) for a locally classified message: the first
+    number is the quantity, what's left after dropping filler words is the item.
+    """
+    if intent not in ("ADD_ITEM", "REMOVE_ITEM", "SEARCH_ITEM"):
+        return None, 1
+
+    quantity = 1
+    words = []
+    for word in text.split():
+        if quantity == 1 and (word.isdigit() or word in NUMBER_WORDS) and word not in ("a", "an"):
+            quantity = int(word) if word.isdigit() else NUMBER_WORDS[word]
+            continue
+        if word in LOCAL_FILLER_WORDS or word in ("a", "an"):
+            continue
+        words.append(word)
+
+    item_name = " ".join(words) or None
+    if intent == "SEARCH_ITEM" and item_name is None:
+        item_name = "dishes"  # "what do you have?"
+    return item_name, quantity
+
+
+def classify_intent_locally(message: str) -> Optional[Dict[str, any]]:
+    """
+    Classify with the embedding model instead of the LLM.
+    Returns a dict shaped like classify_intent_with_llm()'s result plus
+    'margin' (probability gap to the runner-up intent), or None if the
+    embedding model can't be loaded.
+    """
+    text = _normalize_message(message)
+    if not text:
+        return None
+
+    try:
+        classifier = get_intent_classifier()
+        # Same cached vector the HELP fallback's semantic_search(message) uses
+        query_emb = embed_query((message or "").strip())
+    except Exception as e:
+        print(f"[RAG] Local intent classifier unavailable: {e}")
+        return None
+
+    intent, probability, margin = rank_intents(classifier, query_emb)
+    item_name, quantity = _local_entities(text, intent)
+    return {
+        "intent": intent,
+        "item_name": item_name,
+        "quantity": quantity,
+        "confidence": round(probability, 3),
+        "margin": round(margin, 3),
+    }
+
+
+# ============================================
+# Semantic response cache
+# ============================================
+@dataclass
+class CachedResponse:
+    build_id: Optional[str]
+    item_ids: frozenset
+    embedding: np.ndarray
+    reply: str
+    stored_at: float
+
+
+class ResponseCache:
+    """
+    Per-restaurant cache of conversational replies.
+
+    A reply is reused for a new question when its embedding is within
+    `threshold` cosine similarity of a cached question, the retrieved
+    items are the same set and the menu build is unchanged. Paraphrases
+    like "anything sweet?" / "what sweet stuff do you have" then share
+    one LLM answer. Entries are dropped whenever the restaurant's index
+    is reloaded, and never match a different build_id anyway.
+    """
+
+    def __init__(self, threshold: float, max_per_restaurant: int, ttl_seconds: float):
+        self.threshold = threshold
+        self.max_per_restaurant = max_per_restaurant
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[int, "OrderedDict[int, CachedResponse]"] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(
+        self, restaurant_id: int, build_id: Optional[str], item_ids, query_embedding: np.ndarray
+    ) -> Optional[str]:
+        item_ids = frozenset(item_ids)
+        query = self._unit(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries.get(int(restaurant_id))
+            best_key, best_score = None, self.threshold
+            if entries:
+                for key, entry in list(entries.items()):
+                    if entry.build_id != build_id or now - entry.stored_at >= self.ttl_seconds:
+                        del entries[key]  # stale menu or expired
+                        continue
+                    if entry.item_ids != item_ids:
+                        continue
+                    score = float(entry.embedding @ query)
+                    if score >= best_score:
+                        best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_key)
+            self.hits += 1
+            return entries[best_key].reply
+
+    def put(
+        self, restaurant_id: int, build_id: Optional[str], item_ids, query_embedding: np.ndarray, reply: str
+    ):
+        if self.max_per_restaurant <= 0:
+            return
+        entry = CachedResponse(
+            build_id=build_id,
+            item_ids=frozenset(item_ids),
+            embedding=self._unit(query_embedding),
+            reply=reply,
+            stored_at=time.monotonic(),
+        )
+        with self._lock:
+            entries = self._entries.setdefault(int(restaurant_id), OrderedDict())
+            entries[self._next_key] = entry
+            self._next_key += 1
+            while len(entries) > self.max_per_restaurant:
+                entries.popitem(last=False)
+
+    def invalidate(self, restaurant_id: Optional[int] = None):
+        with self._lock:
+            if restaurant_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(restaurant_id), None)
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "restaurants": len(self._entries),
+                "entries": sum(len(e) for e in self._entries.values()),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_response_cache = ResponseCache(
+    RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_MAX_PER_RESTAURANT, RESPONSE_CACHE_TTL
+)
+
+
+def response_cache_stats() -> Dict[str, any]:
+    return _response_cache.stats()
+
+
+def _conversational_messages(user_query: str, retrieved_items: List[Dict[str, any]]) -> List[Dict[str, str]]:
+    """
+    Chat messages for a conversational answer over the retrieved menu items.
     """
-    if not _groq_client:
-        # Fallback to simple response if no LLM
-        return "I found some items that might interest you."
-    
     # Build context string from retrieved items
     context_lines = []
     for item in retrieved_items:
@@ -499,36 +1394,140 @@ def generate_conversational_response(user_query: str, retrieved_items: List[Dict
         f"Relevant menu items:\n{context_string}\n\n"
         "Provide a natural, friendly response based on the menu information above."
     )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _conversational_fallback(retrieved_items: List[Dict[str, any]]) -> str:
+    # Fallback to listing items
+    item_names = [item["parsed"]["name"] for item in retrieved_items if item.get("parsed", {}).get("name")]
+    if item_names:
+        return f"I found these items: {', '.join(item_names)}."
+    return "I found some items that might interest you."
+
+
+def _cached_conversational_reply(
+    user_query: str, retrieved_items: List[Dict[str, any]], restaurant_id: Optional[int]
+):
+    """
+    Returns (cache_key, cached_reply). cache_key is None when the reply
+    can't be cached (no restaurant / index, or items without ids).
+    """
+    if restaurant_id is None:
+        return None, None
+    index = get_restaurant_index(restaurant_id)
+    item_ids = [item.get("item_id") for item in retrieved_items]
+    if index is None or None in item_ids:
+        return None, None
+
+    # Already computed by semantic_search; served from the query cache
+    query_emb = embed_query(user_query)
+    cache_key = (restaurant_id, index.build_id, item_ids, query_emb)
+    cached_reply = _response_cache.get(*cache_key)
+    if cached_reply is not None:
+        print(f"[RAG] Cached conversational reply for restaurant_id={restaurant_id}")
+    return cache_key, cached_reply
+
+
+def generate_conversational_response(
+    user_query: str,
+    retrieved_items: List[Dict[str, any]],
+    restaurant_id: Optional[int] = None,
+) -> str:
+    """
+    Generate natural conversational responses using LLM with retrieved menu context.
+    Similar to qa_menu.py's ask_llm function.
+
+    With a restaurant_id, replies are cached semantically (see ResponseCache)
+    so paraphrased questions over the same items skip the LLM.
+    """
+    cache_key, cached_reply = _cached_conversational_reply(user_query, retrieved_items, restaurant_id)
+    if cached_reply is not None:
+        return cached_reply
+
+    gateway = get_llm_gateway()
+    if not gateway:
+        # Fallback to simple response if no LLM
+        return "I found some items that might interest you."
     
     try:
-        response = _groq_client.chat.completions.create(
-            model="meta-llama/llama-4-maverick-17b-128e-instruct",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
+        reply = gateway.chat(
+            _conversational_messages(user_query, retrieved_items),
+            model=INTENT_LLM_MODEL,
             temperature=0.6,
-            max_tokens=350
+            max_tokens=350,
         )
-        
-        return response.choices[0].message.content.strip()
+        if cache_key is not None and reply:
+            _response_cache.put(*cache_key, reply)
+        return reply
         
     except Exception as e:
         print(f"[RAG] Conversational response error: {e}")
-        # Fallback to listing items
-        item_names = [item["parsed"]["name"] for item in retrieved_items if item.get("parsed", {}).get("name")]
-        if item_names:
-            return f"I found these items: {', '.join(item_names)}."
-        return "I found some items that might interest you."
+        return _conversational_fallback(retrieved_items)
+
+
+def stream_conversational_response(
+    user_query: str,
+    retrieved_items: List[Dict[str, any]],
+    restaurant_id: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Streaming variant of generate_conversational_response: yields reply
+    chunks as the LLM produces them (a cached reply comes as one chunk).
+    The complete reply is stored in the response cache at the end.
+    """
+    cache_key, cached_reply = _cached_conversational_reply(user_query, retrieved_items, restaurant_id)
+    if cached_reply is not None:
+        yield cached_reply
+        return
+
+    gateway = get_llm_gateway()
+    if not gateway:
+        yield "I found some items that might interest you."
+        return
+
+    parts = []
+    try:
+        for delta in gateway.stream_chat(
+            _conversational_messages(user_query, retrieved_items),
+            model=INTENT_LLM_MODEL,
+            temperature=0.6,
+            max_tokens=350,
+        ):
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        print(f"[RAG] Conversational stream error: {e}")
+        if not parts:
+            yield _conversational_fallback(retrieved_items)
+        return
+
+    reply = "".join(parts).strip()
+    if cache_key is not None and reply:
+        _response_cache.put(*cache_key, reply)
 
 
-def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
+def parse_message(
+    message: str,
+    restaurant_id: Optional[int] = None,
+    restaurant_menu_items=None,
+    stream: bool = False,
+    wait_for_model: bool = True,
+) -> ChatbotResult:
     """
     Main entry point: parse user message using AI.
     
     Args:
         message: User's input text
+        restaurant_id: Restaurant whose menu index is searched
         restaurant_menu_items: Optional QuerySet of MenuItem objects for name matching
+        stream: If True, an LLM-written reply is returned lazily in
+            `reply_stream` (with an empty `reply`) instead of being awaited
+        wait_for_model: If False, a turn that needs the embedding model while
+            it is still loading raises RagWarmingUp instead of loading it on
+            this thread (keyword, lexical and category matches still answer)
     
     Returns:
         ChatbotResult with intent and extracted info
@@ -542,8 +1541,30 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
             confidence=1.0
         )
     
-    # Use LLM to classify intent
-    llm_result = classify_intent_with_llm(text)
+    # Cheap local parse first; only unclear messages go to the LLM
+    fast_result = fast_parse_intent(text)
+    if fast_result is not None and fast_result["confidence"] >= FAST_PATH_MIN_CONFIDENCE:
+        llm_result = fast_result
+        print(f"[RAG] Fast-path intent: {llm_result['intent']}, item: {llm_result.get('item_name')}, qty: {llm_result.get('quantity')}")
+    else:
+        # Embedding classifier next (only once the model is resident, so an
+        # LLM-only turn never waits for the model to load)
+        local_result = classify_intent_locally(text) if is_rag_ready() else None
+        if local_result is not None and local_result["margin"] >= LOCAL_INTENT_MIN_MARGIN:
+            llm_result = local_result
+            print(f"[RAG] Local intent: {llm_result['intent']} (margin {llm_result['margin']}), item: {llm_result.get('item_name')}, qty: {llm_result.get('quantity')}")
+        else:
+            llm_result = classify_intent_with_llm(text)
+            if llm_result.get("llm_unavailable"):
+                # Groq down / over quota: the local classifier is the primary path
+                if local_result is None and (wait_for_model or is_rag_ready()):
+                    local_result = classify_intent_locally(text)
+                if local_result is not None:
+                    llm_result = local_result
+                    print(f"[RAG] LLM unavailable, local intent: {llm_result['intent']}, item: {llm_result.get('item_name')}, qty: {llm_result.get('quantity')}")
+                elif fast_result is not None:
+                    # A low-confidence rule-based guess still beats HELP
+                    llm_result = fast_result
     intent = llm_result.get("intent", "HELP")
     item_name_raw = llm_result.get("item_name")
     quantity = llm_result.get("quantity", 1)
@@ -624,50 +1645,62 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
         # ============================================
     # Intent: SEARCH_ITEM (semantic + category detection)
     # ============================================
-    if intent == "SEARCH_ITEM" and item_name_raw:
-        print(f"[RAG] Search Item triggered for: {item_name_raw}")
+    if intent == "SEARCH_ITEM":
+        # ✅ Structured constraints (veg / vegan / price / category): the
+        #    LLM's "filters" first, gaps filled by parsing the message locally
+        term_filters, term = parse_search_filters(item_name_raw or "")
+        message_filters, _ = parse_search_filters(text)
+        filters = SearchFilters.from_llm(llm_result.get("filters")).merged(
+            term_filters.merged(message_filters)
+        )
+        # What is left of the item name once the filter words are gone
+        # ("vegan" -> ""); the LLM's category when it gave no item name
+        term = term if item_name_raw else (filters.category or "")
+        item_name_raw = item_name_raw or filters.category
+
+    if intent == "SEARCH_ITEM" and (item_name_raw or filters):
+        print(f"[RAG] Search Item triggered for: {item_name_raw} {filters.to_dict() if filters else ''}")
 
         # ✅ Normalize common typos like 'desert' -> 'dessert'
-        normalized_term = normalize_search_term(item_name_raw)
+        normalized_term = normalize_search_term(term) if term else ""
+        if filters and normalized_term in GENERIC_SEARCH_TERMS:
+            normalized_term = ""  # "vegan dishes": the filters are the whole query
         print(f"[RAG] Normalized search term: {normalized_term}")
 
-        # ✅ 1️⃣ Try direct category match first
-        all_categories = {
-            parse_chunk_text(c)["category"].lower()
-            for c in _text_chunks
-            if parse_chunk_text(c)["category"]
-        }
+        # Rows allowed by the filters (None = no filters)
+        index = get_restaurant_index(restaurant_id)
+        mask = index.filter_mask(filters) if index is not None else None
 
-        # Normalize plural forms (desserts → dessert)
-        cat_query = normalized_term.lower().rstrip("s")
-        cat_match = None
-        for cat in all_categories:
-            if cat == normalized_term.lower() or cat.rstrip("s") == cat_query:
-                cat_match = cat
-                break
+        # ✅ 1️⃣ Try direct category match first
+        #    (precomputed category index handles plural forms and typos)
+        category_hit = (
+            index.lookup_category(normalized_term) if index is not None and normalized_term else None
+        )
 
-        if cat_match:
+        if category_hit:
+            cat_match, category_rows = category_hit
+            cat_match = cat_match.lower()
             print(f"[RAG] Direct category match: {cat_match}")
+            if mask is not None:
+                category_rows = category_rows[mask[category_rows]]
+                if len(category_rows) == 0:
+                    return ChatbotResult(
+                        intent="SEARCH_ITEM",
+                        reply=f"Sorry, we don't have any {filters.describe(cat_match)} right now. Type 'menu' to see all dishes.",
+                        confidence=1.0,
+                    )
             matched_items = [
-                {"text": c, "score": 1.0, "parsed": parse_chunk_text(c)}
-                for c in _text_chunks
-                if parse_chunk_text(c)["category"].lower() == cat_match
+                build_search_result(index, idx, 1.0) for idx in category_rows
             ]
 
             reply_text = build_search_items_reply(
                 user_query=text,
                 normalized_term=cat_match,
                 retrieved_items=matched_items,
+                heading=filters.describe(cat_match.title()) if filters else None,
             )
 
-            suggestions = [
-                {
-                    "name": i["parsed"]["name"],
-                    "price": i["parsed"]["price"],
-                    "category": i["parsed"]["category"],
-                }
-                for i in matched_items
-            ]
+            suggestions = build_suggestions(matched_items)
 
             return ChatbotResult(
                 intent="SEARCH_ITEM",
@@ -676,8 +1709,43 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
                 suggestions=suggestions,
             )
 
-        # ✅ 2️⃣ If no category match, fall back to semantic search
-        search_results = semantic_search(normalized_term, top_k=5)
+        # ✅ 2️⃣ Only filters ("vegan options", "anything under 150"):
+        #    list the rows they allow, cheapest first, no scoring needed
+        if not normalized_term and mask is not None:
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return ChatbotResult(
+                    intent="SEARCH_ITEM",
+                    reply=f"Sorry, we don't have anything {filters.describe()} right now. Type 'menu' to see all dishes.",
+                    confidence=1.0,
+                )
+            listed = rows[np.argsort(index.columns["price"][rows], kind="stable")[:FILTER_LIST_LIMIT]]
+            matched_items = [build_search_result(index, int(idx), 1.0) for idx in listed]
+            reply_text = build_search_items_reply(text, "", matched_items, heading=filters.describe("dishes"))
+            if len(rows) > len(listed):
+                reply_text += (
+                    f"\n\n(Showing the {len(listed)} lowest-priced of {len(rows)} matches. "
+                    f"Type 'menu' for more.)"
+                )
+            return ChatbotResult(
+                intent="SEARCH_ITEM",
+                reply=reply_text,
+                confidence=1.0,
+                suggestions=build_suggestions(matched_items),
+            )
+
+        # ✅ 3️⃣ If no category match, fall back to semantic search
+        #    (filtered rows are never scored)
+        search_results = semantic_search(
+            normalized_term, restaurant_id, top_k=5, filters=filters, wait_for_model=wait_for_model
+        )
+
+        if not search_results and mask is not None and not mask.any():
+            return ChatbotResult(
+                intent="SEARCH_ITEM",
+                reply=f"Sorry, we don't have anything {filters.describe()} right now. Type 'menu' to see all dishes.",
+                confidence=0.0,
+            )
 
         if not search_results:
             return ChatbotResult(
@@ -695,20 +1763,15 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
             )
 
         # 🔹 Build bullet-style reply (your existing nice text)
-        reply_text = build_search_items_reply(text, normalized_term, search_results)
+        reply_text = build_search_items_reply(
+            text,
+            normalized_term,
+            search_results,
+            heading=filters.describe(normalized_term) if filters else None,
+        )
 
         # 🔹 Build structured suggestions for frontend
-        suggestions: List[Dict[str, str]] = []
-        for item in search_results:
-            parsed = item.get("parsed") or {}
-            name = parsed.get("name") or ""
-            price = parsed.get("price") or ""
-            category = parsed.get("category") or ""
-            if not name:
-                continue
-            suggestions.append(
-                {"name": name, "price": price, "category": category}
-            )
+        suggestions = build_suggestions(search_results)
 
         return ChatbotResult(
             intent="SEARCH_ITEM",
@@ -765,7 +1828,7 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
     
 
     if intent == "ADD_ITEM" and item_name_raw:
-        search_results = semantic_search(item_name_raw, top_k=3)
+        search_results = semantic_search(item_name_raw, restaurant_id, top_k=3, wait_for_model=wait_for_model)
 
         if not search_results:
             return ChatbotResult(
@@ -776,13 +1839,14 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
 
         best_match = search_results[0]
         matched_name = best_match["parsed"]["name"]
-        match_score = best_match["score"]
+        match_score = best_match["match_score"]
 
         # ✅ NEW: if the name exactly matches, trust it fully
         if matched_name and matched_name.strip().lower() == item_name_raw.strip().lower():
             return ChatbotResult(
                 intent="ADD_ITEM",
                 reply=f"Adding {quantity} × {matched_name} to your cart...",
+                item_id=best_match["item_id"],
                 item_name=matched_name,
                 quantity=quantity,
                 confidence=1.0,
@@ -806,6 +1870,7 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
         return ChatbotResult(
             intent="ADD_ITEM",
             reply=f"Adding {quantity} × {matched_name} to your cart...",
+            item_id=best_match["item_id"],
             item_name=matched_name,
             quantity=quantity,
             confidence=match_score
@@ -816,16 +1881,34 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
     # ============================================
     if intent == "REMOVE_ITEM" and item_name_raw:
         # Use semantic search for removal too
-        search_results = semantic_search(item_name_raw, top_k=1)
+        search_results = semantic_search(item_name_raw, restaurant_id, top_k=3, wait_for_model=wait_for_model)
         
         if search_results:
             matched_name = search_results[0]["parsed"]["name"]
+            match_score = search_results[0]["match_score"]
+            exact = matched_name and matched_name.strip().lower() == item_name_raw.strip().lower()
+
+            # Same thresholds as ADD_ITEM: never remove a weak match
+            if not exact and match_score < 0.4:
+                return ChatbotResult(
+                    intent="HELP",
+                    reply=f"Sorry, I couldn't find '{item_name_raw}' on our menu. Type 'cart' to see your order.",
+                    confidence=match_score
+                )
+            if not exact and match_score < 0.6:
+                alternatives = [r["parsed"]["name"] for r in search_results[:3]]
+                return ChatbotResult(
+                    intent="HELP",
+                    reply=f"I'm not sure about '{item_name_raw}'. Did you mean: {', '.join(alternatives)}?",
+                    confidence=match_score
+                )
             return ChatbotResult(
                 intent="REMOVE_ITEM",
                 reply=f"Removing {quantity} × {matched_name} from cart...",
+                item_id=search_results[0]["item_id"],
                 item_name=matched_name,
                 quantity=quantity,
-                confidence=search_results[0]["score"]
+                confidence=match_score
             )
     
     # ============================================
@@ -833,12 +1916,24 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
     # ============================================
     
     # If the message seems like a menu question but wasn't classified correctly,
-    # try to give a conversational answer
-    if len(text.split()) > 2:  # More than 2 words suggests a real question
-        search_results = semantic_search(text, top_k=5)
+    # try to give a conversational answer (unless the model is still loading
+    # and we may not wait for it; the help text below answers instead)
+    if len(text.split()) > 2 and (wait_for_model or is_rag_ready()):  # More than 2 words suggests a real question
+        search_results = semantic_search(text, restaurant_id, top_k=5)
         if search_results and search_results[0]["score"] >= 0.3:
             # There's some relevant context, generate conversational response
-            conversational_reply = generate_conversational_response(text, search_results)
+            if stream:
+                return ChatbotResult(
+                    intent="HELP",
+                    reply="",
+                    confidence=0.6,
+                    reply_stream=stream_conversational_response(
+                        text, search_results, restaurant_id=restaurant_id
+                    ),
+                )
+            conversational_reply = generate_conversational_response(
+                text, search_results, restaurant_id=restaurant_id
+            )
             return ChatbotResult(
                 intent="HELP",
                 reply=conversational_reply,
@@ -864,13 +1959,3 @@ def parse_message(message: str, restaurant_menu_items=None) -> ChatbotResult:
         ),
         confidence=0.5
     )
-
-
-# ============================================
-# Initialize on module import
-# ============================================
-try:
-    load_rag_system()
-except Exception as e:
-    print(f"[RAG] Warning: Could not load RAG system: {e}")
-    print("[RAG] Chatbot will use fallback mode.")
\ No newline at end of file
@@ -0,0 +1,223 @@
+# chatbot/index_events.py
+"""
+Cross-process invalidation of the per-restaurant menu indexes.
+
+Generation protocol:
+
+- every restaurant has a generation number in a shared store
+- whoever rebuilds an index (generate_embeddings, usually via the Celery
+  regen task) bumps it with publish_index_update() once the new files are
+  in place, which also broadcasts {"restaurant_id", "generation"}
+- each web worker runs one listener thread that swaps in the rebuilt
+  index when notified, so the request path is a dict lookup with no
+  stat() calls
+
+Transports (INDEX_INVALIDATION_BACKEND):
+    redis   generation in Redis (INCR), notification over pub/sub
+    files   generation files under MENU_INDEX_DIR/_generations, watched
+            with watchfiles (single host, no Redis needed)
+    auto    (default) redis when INDEX_INVALIDATION_REDIS_URL (or
+            CHATBOT_CACHE_URL) is set, files otherwise
+
+Pub/sub is fire-and-forget, so the listener also re-reads the generations
+of the restaurants it has loaded after every reconnect and every
+INDEX_GENERATION_RECHECK_SECONDS (off the request path).
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+from filelock import FileLock
+
+from .menu_index import MENU_INDEX_DIR
+
+# ============================================
+# Configuration
+# ============================================
+INDEX_INVALIDATION_BACKEND = os.getenv("INDEX_INVALIDATION_BACKEND", "auto").lower()
+INDEX_INVALIDATION_REDIS_URL = os.getenv(
+    "INDEX_INVALIDATION_REDIS_URL", os.getenv("CHATBOT_CACHE_URL", "")
+)
+INDEX_GENERATION_RECHECK_SECONDS = float(os.getenv("INDEX_GENERATION_RECHECK_SECONDS", "60"))
+
+INVALIDATION_CHANNEL = "chatbot:index-invalidation"
+GENERATION_KEY = "chatbot:index-generation:{restaurant_id}"
+GENERATIONS_DIRNAME = "_generations"
+
+
+class RedisGenerationStore:
+    """
+    Generations as Redis integers, notifications over pub/sub.
+    """
+    name = "redis"
+
+    def __init__(self, url: str = INDEX_INVALIDATION_REDIS_URL):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=2)
+
+    def get(self, restaurant_id: int) -> int:
+        value = self.client.get(GENERATION_KEY.format(restaurant_id=int(restaurant_id)))
+        return int(value) if value is not None else 0
+
+    def bump(self, restaurant_id: int) -> int:
+        generation = int(self.client.incr(GENERATION_KEY.format(restaurant_id=int(restaurant_id))))
+        self.client.publish(
+            INVALIDATION_CHANNEL,
+            json.dumps({"restaurant_id": int(restaurant_id), "generation": generation}),
+        )
+        return generation
+
+    def listen(self, on_update: Callable[[int, int], None], on_idle: Callable[[], None], stop: threading.Event):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(INVALIDATION_CHANNEL)
+        try:
+            # Anything published while we were (re)connecting
+            on_idle()
+            last_check = time.monotonic()
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "message":
+                    data = json.loads(message["data"])
+                    on_update(int(data["restaurant_id"]), int(data["generation"]))
+                if time.monotonic() - last_check >= INDEX_GENERATION_RECHECK_SECONDS:
+                    on_idle()
+                    last_check = time.monotonic()
+        finally:
+            pubsub.close()
+
+
+class FileGenerationStore:
+    """
+    Generations as small files (one per restaurant), watched for changes.
+    """
+    name = "files"
+
+    def __init__(self, root: Optional[Path] = None):
+        self.dir = Path(root if root is not None else MENU_INDEX_DIR) / GENERATIONS_DIRNAME
+
+    def _path(self, restaurant_id: int) -> Path:
+        return self.dir / f"restaurant_{int(restaurant_id)}"
+
+    def get(self, restaurant_id: int) -> int:
+        try:
+            return int(self._path(restaurant_id).read_text().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self, restaurant_id: int) -> int:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(restaurant_id)
+        # Read-increment-write under a per-restaurant lock, so concurrent
+        # publishers never write the same generation (and lose an update)
+        with FileLock(str(path.with_name(f"{path.name}.lock"))):
+            generation = self.get(restaurant_id) + 1
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(str(generation))
+            os.replace(tmp_path, path)  # readers never see a half-written number
+        return generation
+
+    def listen(self, on_update: Callable[[int, int], None], on_idle: Callable[[], None], stop: threading.Event):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        on_idle()
+        try:
+            from watchfiles import watch
+        except ImportError:
+            # No watcher available: fall back to the periodic recheck only
+            while not stop.wait(INDEX_GENERATION_RECHECK_SECONDS):
+                on_idle()
+            return
+
+        for changes in watch(
+            self.dir,
+            stop_event=stop,
+            rust_timeout=int(INDEX_GENERATION_RECHECK_SECONDS * 1000),
+            yield_on_timeout=True,
+        ):
+            if not changes:
+                on_idle()
+                continue
+            for _, changed_path in changes:
+                name = Path(changed_path).name
+                if name.startswith("restaurant_") and name[len("restaurant_"):].isdigit():
+                    restaurant_id = int(name[len("restaurant_"):])
+                    on_update(restaurant_id, self.get(restaurant_id))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_generation_store():
+    """
+    The configured generation store for this process.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = INDEX_INVALIDATION_BACKEND
+                if backend == "auto":
+                    backend = "redis" if INDEX_INVALIDATION_REDIS_URL else "files"
+                _store = RedisGenerationStore() if backend == "redis" else FileGenerationStore()
+    return _store
+
+
+def publish_index_update(restaurant_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Tell every worker that these restaurants' indexes were rebuilt.
+    Call only after the new files are fully in place.
+    Returns {restaurant_id: new generation}.
+    """
+    store = get_generation_store()
+    generations = {}
+    for restaurant_id in restaurant_ids:
+        generations[int(restaurant_id)] = store.bump(restaurant_id)
+        print(
+            f"[RAG] Published index generation {generations[int(restaurant_id)]} "
+            f"for restaurant_id={restaurant_id} ({store.name})"
+        )
+    return generations
+
+
+class IndexListener:
+    """
+    Background thread that keeps one process's indexes current.
+
+    on_update(restaurant_id, generation) is called for every notification;
+    on_idle() after (re)connecting and periodically, to catch up on
+    anything that was missed. Connection errors are retried with backoff.
+    """
+
+    def __init__(self, on_update: Callable[[int, int], None], on_idle: Callable[[], None]):
+        self.on_update = on_update
+        self.on_idle = on_idle
+        self.stop_event = threading.Event()
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, name="menu-index-listener", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        # Let the watcher / pubsub loop exit before the interpreter tears down
+        atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout: float = 2.0):
+        self.stop_event.set()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def _run(self):
+        delay = 1.0
+        while not self.stop_event.is_set():
+            try:
+                get_generation_store().listen(self.on_update, self.on_idle, self.stop_event)
+                delay = 1.0
+            except Exception as e:
+                print(f"[RAG] Index listener error: {e}; retrying in {delay:.0f}s")
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, 60.0)
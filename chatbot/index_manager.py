@@ -0,0 +1,206 @@
+# chatbot/index_manager.py
+"""
+Which restaurants' indexes are resident in this process.
+
+A node can serve far more restaurants than it can keep in memory, so
+indexes are loaded on a restaurant's first chat and kept in LRU order
+under MENU_INDEX_MEMORY_BUDGET_MB (0 = unlimited). When a load pushes
+the total over the budget, the least-recently-used tenants are dropped;
+their next chat loads them again.
+
+The budget covers each index's private arrays (columns, masks, IVF
+lists, lexical postings), i.e. what this process holds on its own. The
+vectors are memory-mapped: their pages sit in the shared page cache,
+which the kernel reclaims by itself, so they are reported separately
+(stats()["mapped_mb"]) and don't count against the budget.
+
+Concurrent first chats for the same restaurant share a single load
+(single-flight); loads of different restaurants run in parallel.
+Restaurants without an index are remembered too, so they cost one
+load attempt, not one per request.
+
+stats() reports residency, memory, hits, loads and evictions for
+capacity planning.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from .menu_index import RestaurantIndex
+
+# ============================================
+# Configuration
+# ============================================
+MENU_INDEX_MEMORY_BUDGET_MB = float(os.getenv("MENU_INDEX_MEMORY_BUDGET_MB", "1024"))
+
+
+@dataclass
+class ResidentIndex:
+    index: Optional[RestaurantIndex]  # None: no index built for this restaurant
+    generation: int
+    nbytes: int  # private arrays, counted against the budget
+    mapped_nbytes: int
+    last_used: float
+
+
+class IndexManager:
+    """
+    LRU set of loaded RestaurantIndex objects under a memory budget.
+
+    loader(restaurant_id, generation) -> (index or None, generation it
+    corresponds to); generation None means "whatever is current".
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int, Optional[int]], Tuple[Optional[RestaurantIndex], int]],
+        budget_mb: float = MENU_INDEX_MEMORY_BUDGET_MB,
+    ):
+        self.loader = loader
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._entries: "OrderedDict[int, ResidentIndex]" = OrderedDict()
+        self._loading: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self.memory_bytes = 0
+        self.mapped_bytes = 0
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+        self.coalesced_loads = 0
+
+    def get(self, restaurant_id: int) -> Optional[RestaurantIndex]:
+        """
+        The resident index of a restaurant, loading it on first use.
+        """
+        with self._lock:
+            entry = self._entries.get(restaurant_id)
+            if entry is not None:
+                self._entries.move_to_end(restaurant_id)
+                entry.last_used = time.monotonic()
+                self.hits += 1
+                return entry.index
+            self.misses += 1
+
+        return self._load(restaurant_id)
+
+    def generation(self, restaurant_id: int) -> Optional[int]:
+        """
+        Generation of the resident index, None if the restaurant isn't resident.
+        """
+        with self._lock:
+            entry = self._entries.get(restaurant_id)
+            return entry.generation if entry is not None else None
+
+    def generations(self) -> Dict[int, int]:
+        with self._lock:
+            return {rid: entry.generation for rid, entry in self._entries.items()}
+
+    def reload(self, restaurant_id: int, generation: Optional[int] = None) -> Optional[RestaurantIndex]:
+        """
+        Re-read a restaurant's index (e.g. after a published rebuild).
+        Requests keep getting the old index until the new one is in.
+        """
+        return self._load(restaurant_id, generation, force=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+            self.mapped_bytes = 0
+
+    def _load(self, restaurant_id: int, generation: Optional[int] = None, force: bool = False):
+        with self._lock:
+            if not force:
+                entry = self._entries.get(restaurant_id)
+                if entry is not None:
+                    return entry.index
+            future = self._loading.get(restaurant_id)
+            owner = future is None
+            if owner:
+                future = self._loading[restaurant_id] = Future()
+            else:
+                self.coalesced_loads += 1
+
+        if not owner:
+            # Someone else is loading this tenant; wait for their result
+            index = future.result()
+            if not force:
+                return index
+            # A reload must reflect files newer than the load we joined
+            return self._load(restaurant_id, generation, force=True)
+
+        started = time.perf_counter()
+        try:
+            index, generation = self.loader(restaurant_id, generation)
+        except BaseException as e:
+            with self._lock:
+                self.load_failures += 1
+                del self._loading[restaurant_id]
+            future.set_exception(e)
+            raise
+
+        nbytes = index.memory_bytes() if index is not None else 0
+        mapped_nbytes = index.mapped_bytes() if index is not None else 0
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - started
+            old = self._entries.pop(restaurant_id, None)
+            if old is not None:
+                self.memory_bytes -= old.nbytes
+                self.mapped_bytes -= old.mapped_nbytes
+            self._entries[restaurant_id] = ResidentIndex(
+                index, generation, nbytes, mapped_nbytes, time.monotonic()
+            )
+            self.memory_bytes += nbytes
+            self.mapped_bytes += mapped_nbytes
+            self._evict_over_budget()
+            del self._loading[restaurant_id]
+        future.set_result(index)
+        return index
+
+    def _evict_over_budget(self):
+        if self.budget_bytes <= 0:
+            return
+        # The tenant just loaded is the most recent, so it always stays
+        while self.memory_bytes > self.budget_bytes and len(self._entries) > 1:
+            restaurant_id, entry = self._entries.popitem(last=False)
+            self.memory_bytes -= entry.nbytes
+            self.mapped_bytes -= entry.mapped_nbytes
+            self.evictions += 1
+            print(
+                f"[RAG] Evicted index of restaurant_id={restaurant_id} "
+                f"({entry.nbytes / 1e6:.1f} MB, idle {time.monotonic() - entry.last_used:.0f}s)"
+            )
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            resident = [e for e in self._entries.values() if e.index is not None]
+            return {
+                "resident": len(resident),
+                "known_without_index": len(self._entries) - len(resident),
+                "loading": len(self._loading),
+                "memory_mb": self.memory_bytes / (1024 * 1024),
+                "mapped_mb": self.mapped_bytes / (1024 * 1024),
+                "budget_mb": self.budget_bytes / (1024 * 1024),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "loads": self.loads,
+                "coalesced_loads": self.coalesced_loads,
+                "load_failures": self.load_failures,
+                "avg_load_ms": (1000 * self.load_seconds / self.loads) if self.loads else 0.0,
+                "evictions": self.evictions,
+                "largest": sorted(
+                    ((rid, e.nbytes / (1024 * 1024)) for rid, e in self._entries.items()),
+                    key=lambda item: -item[1],
+                )[:10],
+            }
@@ -0,0 +1,196 @@
+# chatbot/intent_classifier.py
+"""
+Local intent classifier over sentence embeddings.
+
+Uses the same embedding model as menu search, trained on the labelled
+example utterances below (the examples from the LLM classifier prompt plus
+a few paraphrases per intent). Two backends:
+
+    LOCAL_INTENT_MODEL=centroid   (default) cosine to the mean example vector per intent
+    LOCAL_INTENT_MODEL=logreg     scikit-learn LogisticRegression on the example vectors
+
+Both return calibrated-ish probabilities; the engine trusts the local
+answer when the gap between the two most likely intents is at least
+LOCAL_INTENT_MIN_MARGIN, and uses it as the primary classifier when the
+LLM is unavailable.
+"""
+import os
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+# ============================================
+# Configuration
+# ============================================
+LOCAL_INTENT_MODEL = os.getenv("LOCAL_INTENT_MODEL", "centroid").lower()
+LOCAL_INTENT_TEMPERATURE = float(os.getenv("LOCAL_INTENT_TEMPERATURE", "20"))
+
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "ADD_ITEM": [
+        "add 2 butter naan",
+        "I want three masala dosa",
+        "get me some biryani",
+        "I'll have a paneer tikka",
+        "can I get one mango lassi",
+        "give me two plates of chole bhature",
+        "I'd like to order a veg burger",
+        "put a garlic naan in my order",
+        "one more cold coffee please",
+        "order dal makhani",
+    ],
+    "REMOVE_ITEM": [
+        "remove paneer tikka",
+        "delete the butter naan",
+        "take out one biryani",
+        "I don't want the lassi anymore",
+        "remove 2 garlic naan from my cart",
+        "cancel the masala dosa",
+        "drop the gulab jamun",
+    ],
+    "SHOW_CART": [
+        "what's in my cart?",
+        "my cart",
+        "show my order",
+        "what have I ordered so far",
+        "how much is my bill",
+        "view cart",
+    ],
+    "SHOW_MENU": [
+        "menu",
+        "show me the menu",
+        "show menu",
+        "can I see the full menu",
+        "what's on the menu",
+        "open the menu",
+    ],
+    "CLEAR_CART": [
+        "clear my order",
+        "clear cart",
+        "start over",
+        "empty my cart",
+        "remove everything",
+        "cancel my whole order",
+    ],
+    "CONFIRM_ORDER": [
+        "place the order",
+        "confirm",
+        "checkout",
+        "I'm done, place my order",
+        "that's all, confirm it",
+        "proceed to payment",
+        "I want to pay now",
+    ],
+    "SEARCH_ITEM": [
+        "what do you have in desserts?",
+        "what desserts do you have?",
+        "tell me about your breads",
+        "what vegetarian options?",
+        "do you have rajma chawal?",
+        "is paneer available?",
+        "I want something spicy",
+        "what do you have?",
+        "anything sweet?",
+        "what drinks do you serve",
+        "which starters are vegan",
+        "what's in your breads section?",
+    ],
+    "HELP": [
+        "hello",
+        "what can you do?",
+        "hi there",
+        "how does this work",
+        "good evening",
+        "thanks",
+        "who are you",
+    ],
+}
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max()
+    exp = np.exp(scores)
+    return exp / exp.sum()
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class CentroidIntentClassifier:
+    """
+    Nearest-centroid classifier: one normalized mean vector per intent,
+    probabilities from a softmax over the cosine scores.
+    """
+    name = "centroid"
+
+    def __init__(self, temperature: float = LOCAL_INTENT_TEMPERATURE):
+        self.temperature = temperature
+        self.intents: List[str] = []
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+
+    def fit(self, embeddings: np.ndarray, labels: List[str]):
+        embeddings = _unit(embeddings)
+        labels = np.asarray(labels)
+        self.intents = sorted(set(labels.tolist()))
+        self.centroids = _unit(
+            np.stack([embeddings[labels == intent].mean(axis=0) for intent in self.intents])
+        )
+        return self
+
+    def predict_proba(self, embedding: np.ndarray) -> np.ndarray:
+        scores = self.centroids @ _unit(embedding).reshape(-1)
+        return _softmax(scores * self.temperature)
+
+
+class LogisticIntentClassifier:
+    """
+    Multinomial logistic regression on the example embeddings (scikit-learn).
+    """
+    name = "logreg"
+
+    def __init__(self):
+        self.intents: List[str] = []
+        self.model = None
+
+    def fit(self, embeddings: np.ndarray, labels: List[str]):
+        from sklearn.linear_model import LogisticRegression
+
+        self.model = LogisticRegression(C=10.0, max_iter=1000)
+        self.model.fit(_unit(embeddings), labels)
+        self.intents = [str(c) for c in self.model.classes_]
+        return self
+
+    def predict_proba(self, embedding: np.ndarray) -> np.ndarray:
+        return self.model.predict_proba(_unit(embedding).reshape(1, -1))[0]
+
+
+def train_intent_classifier(
+    encode: Callable[[List[str]], np.ndarray],
+    kind: str = LOCAL_INTENT_MODEL,
+    examples: Dict[str, List[str]] = INTENT_EXAMPLES,
+):
+    """
+    Embed the example utterances with `encode` (texts -> (n, dim) array)
+    and fit the chosen classifier.
+    """
+    texts, labels = [], []
+    for intent, utterances in examples.items():
+        texts.extend(utterances)
+        labels.extend([intent] * len(utterances))
+
+    embeddings = np.asarray(encode(texts), dtype=np.float32)
+    classifier = LogisticIntentClassifier() if kind == "logreg" else CentroidIntentClassifier()
+    return classifier.fit(embeddings, labels)
+
+
+def rank_intents(classifier, embedding: np.ndarray) -> Tuple[str, float, float]:
+    """
+    Returns (best intent, its probability, margin over the runner-up).
+    """
+    probs = classifier.predict_proba(embedding)
+    order = np.argsort(-probs)
+    best = float(probs[order[0]])
+    second = float(probs[order[1]]) if len(order) > 1 else 0.0
+    return classifier.intents[int(order[0])], best, best - second
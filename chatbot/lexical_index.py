@@ -0,0 +1,199 @@
+# chatbot/lexical_index.py
+"""
+In-memory lexical index over one restaurant's menu rows.
+
+Two signals, both built once when the restaurant's index is loaded:
+
+- BM25 over item name, category, ingredients and diet tags
+  ("vegetarian", "vegan"); name tokens count double.
+- Character-trigram (Jaccard) similarity against the item name, which
+  tolerates typos and word order ("buter nan", "naan butter").
+
+semantic_search() merges the lexical candidates with the vector
+candidates. When the lexical match is decisive (exact name, or one
+clearly best near-exact name) the embedding call is skipped.
+
+Tuning (env):
+    LEXICAL_DECISIVE_SIMILARITY  trigram similarity of a decisive match (default 0.7)
+    LEXICAL_DECISIVE_MARGIN      lead over the runner-up it needs (default 0.15)
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ============================================
+# Configuration
+# ============================================
+LEXICAL_DECISIVE_SIMILARITY = float(os.getenv("LEXICAL_DECISIVE_SIMILARITY", "0.7"))
+LEXICAL_DECISIVE_MARGIN = float(os.getenv("LEXICAL_DECISIVE_MARGIN", "0.15"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with a naive plural strip ('naans' -> 'naan')."""
+    return [
+        t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+        for t in _TOKEN_RE.findall((text or "").lower())
+    ]
+
+
+def trigrams(text: str) -> set:
+    t = f"  {normalize_text(text)} "
+    return {t[i: i + 3] for i in range(len(t) - 2)}
+
+
+def _postings(doc_terms: Sequence) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """term -> (row ids, counts) for a list of per-row term lists/sets."""
+    postings: Dict[str, Dict[int, int]] = {}
+    for row, terms in enumerate(doc_terms):
+        for term in terms:
+            counts = postings.setdefault(term, {})
+            counts[row] = counts.get(row, 0) + 1
+    return {
+        term: (
+            np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)),
+            np.fromiter(counts.values(), dtype=np.float32, count=len(counts)),
+        )
+        for term, counts in postings.items()
+    }
+
+
+class LexicalIndex:
+    """
+    BM25 + name-trigram index over the rows of one RestaurantIndex.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        categories: Sequence[str] = (),
+        ingredients: Sequence[str] = (),
+        is_vegetarian: Sequence[bool] = (),
+        is_vegan: Sequence[bool] = (),
+    ):
+        n_rows = len(names)
+        self.n_rows = n_rows
+
+        docs = []
+        for i in range(n_rows):
+            terms = tokenize(names[i]) * NAME_WEIGHT
+            if i < len(categories):
+                terms += tokenize(categories[i])
+            if i < len(ingredients):
+                terms += tokenize(ingredients[i])
+            if i < len(is_vegan) and is_vegan[i]:
+                terms += ["vegan", "veg", "vegetarian"]
+            elif i < len(is_vegetarian) and is_vegetarian[i]:
+                terms += ["veg", "vegetarian"]
+            docs.append(terms)
+
+        self.doc_len = np.array([len(d) for d in docs], dtype=np.float32)
+        self.avg_doc_len = float(self.doc_len.mean()) if n_rows else 0.0
+        self.postings = _postings(docs)
+
+        name_grams = [trigrams(name) for name in names]
+        self.name_gram_count = np.array([len(g) for g in name_grams], dtype=np.float32)
+        self.gram_postings = _postings(name_grams)
+
+        self.exact_names: Dict[str, np.ndarray] = {}
+        for i, name in enumerate(names):
+            key = normalize_text(name)
+            if key:
+                self.exact_names.setdefault(key, []).append(i)
+        self.exact_names = {k: np.asarray(v, dtype=np.int64) for k, v in self.exact_names.items()}
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def bm25(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_rows, dtype=np.float32)
+        if not self.n_rows:
+            return scores
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tf = posting
+            idf = np.log(1 + (self.n_rows - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[rows] / self.avg_doc_len)
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def name_similarity(self, query: str) -> np.ndarray:
+        """Trigram Jaccard similarity of the query to every item name."""
+        shared = np.zeros(self.n_rows, dtype=np.float32)
+        query_grams = trigrams(query)
+        for gram in query_grams:
+            posting = self.gram_postings.get(gram)
+            if posting is not None:
+                shared[posting[0]] += 1
+        union = len(query_grams) + self.name_gram_count - shared
+        return shared / np.clip(union, 1, None)
+
+    def search(
+        self, query: str, top_k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lexical top-k: (row indices, name similarity), ranked by
+        name similarity plus max-normalized BM25. Rows with no overlap
+        at all, and rows outside `mask`, are left out.
+        """
+        if not self.n_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        similarity = self.name_similarity(query)
+        bm25 = self.bm25(query)
+        top_bm25 = bm25.max()
+        combined = similarity + (bm25 / top_bm25 if top_bm25 > 0 else 0)
+        if mask is not None:
+            combined = np.where(mask, combined, 0)
+
+        candidates = np.flatnonzero(combined > 0)
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-combined[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-combined[candidates], kind="stable")]
+        return order, similarity[order]
+
+    def decisive_match(
+        self, query: str, mask: Optional[np.ndarray] = None
+    ) -> Optional[Tuple[int, float]]:
+        """
+        (row, similarity) when the query clearly names one item:
+        an exact (normalized) name, or a near-exact name well ahead of
+        every other item. Only rows inside `mask` count. None otherwise.
+        """
+        exact = self.exact_names.get(normalize_text(query))
+        if exact is not None and mask is not None:
+            exact = exact[mask[exact]]
+        if exact is not None and len(exact) == 1:
+            return int(exact[0]), 1.0
+        if not self.n_rows:
+            return None
+
+        similarity = self.name_similarity(query)
+        if mask is not None:
+            similarity = np.where(mask, similarity, 0)
+        if self.n_rows == 1:
+            best, second = 0, 0.0
+        else:
+            top2 = np.argpartition(-similarity, 1)[:2]
+            best, other = (top2[0], top2[1]) if similarity[top2[0]] >= similarity[top2[1]] else (top2[1], top2[0])
+            second = float(similarity[other])
+        best_sim = float(similarity[best])
+        if best_sim >= LEXICAL_DECISIVE_SIMILARITY and best_sim - second >= LEXICAL_DECISIVE_MARGIN:
+            return int(best), best_sim
+        return None
+
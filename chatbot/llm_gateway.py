@@ -0,0 +1,451 @@
+# chatbot/llm_gateway.py
+"""
+HTTP gateway to the Groq (OpenAI-compatible) chat completions API.
+
+Every call gets:
+    - a deadline (total budget across retries, never longer than LLM_DEADLINE_SECONDS)
+    - bounded retries with full jitter on timeouts, connection errors, 429 and 5xx
+    - one pooled keep-alive connection set per process (httpx.Client)
+    - a circuit breaker: when the recent error rate spikes, calls fail fast with
+      LLMUnavailable for LLM_BREAKER_COOLDOWN seconds so callers use their
+      local fallback instead of pinning worker threads on a sick upstream
+
+The gateway is synchronous on purpose: the chat views are sync DRF views
+under WSGI and the Celery tasks are sync too, so an async client would
+only add an event loop per call. What stops a slow upstream from pinning
+a worker thread is the deadline, not async I/O.
+
+Point GROQ_BASE_URL (or LLMGateway(base_url=...)) at a local stub server
+to test timeouts / failures, as chatbot/tests.py does:
+
+    GROQ_BASE_URL=http://127.0.0.1:8099/v1
+
+Tuning (env):
+    LLM_DEADLINE_SECONDS      total time budget per call (default 8)
+    LLM_CONNECT_TIMEOUT       TCP/TLS connect timeout (default 2)
+    LLM_MAX_RETRIES           retries after the first attempt (default 2)
+    LLM_RETRY_BASE_DELAY      first backoff step in seconds (default 0.25)
+    LLM_RETRY_MAX_DELAY       backoff cap in seconds (default 2)
+    LLM_POOL_MAX_CONNECTIONS  pooled connections per process (default 20)
+    LLM_BREAKER_WINDOW        recent attempts considered (default 20)
+    LLM_BREAKER_MIN_CALLS     attempts needed before the breaker can open (default 5)
+    LLM_BREAKER_ERROR_RATE    error ratio that opens the breaker (default 0.5)
+    LLM_BREAKER_COOLDOWN      seconds to stay open before a probe call (default 30)
+"""
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+# ============================================
+# Configuration
+# ============================================
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "8"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "2"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.25"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2"))
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The LLM call failed (after retries, or with a non-retryable error)."""
+
+
+class LLMUnavailable(LLMError):
+    """Failing fast: breaker open, deadline exhausted or no API key."""
+
+
+# ============================================
+# Circuit breaker
+# ============================================
+class CircuitBreaker:
+    """
+    Error-rate breaker over the last `window` attempts.
+
+    closed     -> calls pass; opens when errors/attempts >= error_rate
+    open       -> calls are rejected until `cooldown` has passed
+    half_open  -> one probe call is let through; success closes the
+                  breaker, failure opens it again. A probe that ends
+                  without either (deadline, rejected retry) releases
+                  its slot with release_probe().
+    """
+
+    def __init__(
+        self,
+        window: int = LLM_BREAKER_WINDOW,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        error_rate: float = LLM_BREAKER_ERROR_RATE,
+        cooldown: float = LLM_BREAKER_COOLDOWN,
+    ):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._outcomes = deque(maxlen=window)  # True = error
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        False if the call must fail fast, "probe" if it is the half-open
+        probe (release_probe() when it ends), else True.
+        """
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+                return "probe"
+            return True
+
+    def release_probe(self):
+        """Let the next call probe again if this probe recorded no outcome."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "closed"
+                self._outcomes.clear()
+                self._probe_in_flight = False
+            self._outcomes.append(False)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == "half_open":
+                self._open()
+                return
+            self._outcomes.append(True)
+            errors = sum(self._outcomes)
+            if (
+                self.state == "closed"
+                and len(self._outcomes) >= self.min_calls
+                and errors / len(self._outcomes) >= self.error_rate
+            ):
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._probe_in_flight = False
+        print(f"[RAG] LLM circuit breaker OPEN for {self.cooldown:.0f}s")
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            attempts = len(self._outcomes)
+            errors = sum(self._outcomes)
+            return {
+                "state": self.state,
+                "recent_attempts": attempts,
+                "recent_errors": errors,
+                "error_rate": (errors / attempts) if attempts else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+# ============================================
+# Gateway
+# ============================================
+class LLMGateway:
+    """
+    Chat completions over pooled HTTP connections with deadlines,
+    retries and a circuit breaker. chat() / stream_chat() for Django
+    views and Celery; a slow upstream holds a worker for at most the
+    deadline.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = GROQ_API_KEY,
+        base_url: str = GROQ_BASE_URL,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        # Counters shared by request threads; updated under _lock
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self._client: Optional[httpx.Client] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # ---------- connection pool ----------
+    def _client_options(self) -> Dict[str, any]:
+        return {
+            "base_url": self.base_url,
+            "headers": {"Authorization": f"Bearer {self.api_key}"},
+            "limits": httpx.Limits(
+                max_connections=LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_POOL_MAX_CONNECTIONS,
+            ),
+            "timeout": httpx.Timeout(self.deadline, connect=LLM_CONNECT_TIMEOUT),
+        }
+
+    def _get_client(self) -> httpx.Client:
+        # A client created before a fork (gunicorn --preload / Celery prefork)
+        # shares sockets with the parent; open a fresh pool per process.
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = httpx.Client(**self._client_options())
+                    self._pid = os.getpid()
+        return self._client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    # ---------- helpers ----------
+    def _payload(self, messages, model, temperature, max_tokens) -> Dict[str, any]:
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+    def _start(self, deadline: Optional[float]):
+        """Returns (expires_at, whether this call is the breaker's probe)."""
+        if not self.api_key:
+            raise LLMUnavailable("GROQ_API_KEY not set")
+        allowed = self.breaker.allow()
+        if not allowed:
+            raise LLMUnavailable("LLM circuit breaker is open")
+        with self._lock:
+            self.calls += 1
+        expires_at = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        return expires_at, allowed == "probe"
+
+    def _allow_retry(self) -> bool:
+        """
+        The breaker may have opened since the first attempt (this call's
+        failures or other threads'); don't keep hitting the upstream.
+        """
+        allowed = self.breaker.allow()
+        if not allowed:
+            with self._lock:
+                self.failures += 1
+            raise LLMUnavailable("LLM circuit breaker opened during the call")
+        return allowed == "probe"
+
+    def _attempt_timeout(self, expires_at: float) -> httpx.Timeout:
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            raise LLMUnavailable("LLM deadline exceeded")
+        return httpx.Timeout(remaining, connect=min(LLM_CONNECT_TIMEOUT, remaining))
+
+    def _backoff(self, attempt: int, expires_at: float, retry_after: Optional[str] = None) -> Optional[float]:
+        """Seconds to sleep before the next attempt, or None if out of budget."""
+        if attempt >= self.max_retries:
+            return None
+        # Full jitter: uniform(0, min(cap, base * 2^attempt))
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        if time.monotonic() + delay >= expires_at:
+            return None
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    @staticmethod
+    def _content(response: httpx.Response) -> str:
+        data = response.json()
+        return (data["choices"][0]["message"]["content"] or "").strip()
+
+    def _classify(self, response: Optional[httpx.Response], error: Optional[Exception]) -> bool:
+        """Record the attempt on the breaker; True if it is worth retrying."""
+        if error is not None:
+            self.breaker.record_failure()
+            return True
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            self.breaker.record_failure()
+            return True
+        # 2xx, or a client error the upstream answered promptly (still healthy)
+        self.breaker.record_success()
+        return False
+
+    def _fail(self, message: str):
+        with self._lock:
+            self.failures += 1
+        raise LLMError(message)
+
+    # ---------- sync ----------
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.2,
+        max_tokens: int = 250,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """
+        Return the assistant message content.
+        Raises LLMUnavailable (fail fast) or LLMError (call failed).
+        """
+        expires_at, probe = self._start(deadline)
+        payload = self._payload(messages, model, temperature, max_tokens)
+        try:
+            client = self._get_client()
+
+            attempt = 0
+            while True:
+                response, error = None, None
+                try:
+                    response = client.post(
+                        "/chat/completions", json=payload, timeout=self._attempt_timeout(expires_at)
+                    )
+                except httpx.HTTPError as e:
+                    error = e
+
+                if not self._classify(response, error):
+                    if response.is_success:
+                        return self._content(response)
+                    self._fail(f"LLM request rejected: HTTP {response.status_code}")
+
+                delay = self._backoff(
+                    attempt, expires_at, response.headers.get("retry-after") if response is not None else None
+                )
+                if delay is None:
+                    reason = repr(error) if error is not None else f"HTTP {response.status_code}"
+                    self._fail(f"LLM request failed after {attempt + 1} attempt(s): {reason}")
+                time.sleep(delay)
+                probe = self._allow_retry() or probe
+                attempt += 1
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    # ---------- streaming ----------
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.2,
+        max_tokens: int = 250,
+        deadline: Optional[float] = None,
+    ) -> Iterator[str]:
+        """
+        Yield content deltas as the upstream produces them (stream=true).
+
+        Retries only happen before the response starts. The remaining
+        deadline is used as the connect / per-read timeout, so a stalled
+        stream is cut off too. A failure mid-stream raises LLMError.
+        """
+        expires_at, probe = self._start(deadline)
+        try:
+            payload = self._payload(messages, model, temperature, max_tokens)
+            payload["stream"] = True
+            client = self._get_client()
+
+            attempt = 0
+            while True:
+                error = None
+                try:
+                    request = client.build_request(
+                        "POST", "/chat/completions", json=payload, timeout=self._attempt_timeout(expires_at)
+                    )
+                    response = client.send(request, stream=True)
+                except httpx.HTTPError as e:
+                    response, error = None, e
+
+                if not self._classify(response, error):
+                    if response.is_success:
+                        break
+                    response.close()
+                    self._fail(f"LLM request rejected: HTTP {response.status_code}")
+
+                retry_after = None
+                if response is not None:
+                    retry_after = response.headers.get("retry-after")
+                    response.close()
+                delay = self._backoff(attempt, expires_at, retry_after)
+                if delay is None:
+                    reason = repr(error) if error is not None else f"HTTP {response.status_code}"
+                    self._fail(f"LLM request failed after {attempt + 1} attempt(s): {reason}")
+                time.sleep(delay)
+                probe = self._allow_retry() or probe
+                attempt += 1
+
+            try:
+                for line in response.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        yield delta
+            except httpx.HTTPError as e:
+                self.breaker.record_failure()
+                self._fail(f"LLM stream interrupted: {e!r}")
+            finally:
+                response.close()
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            counters = {"calls": self.calls, "failures": self.failures, "retries": self.retries}
+        return {"base_url": self.base_url, **counters, "breaker": self.breaker.stats()}
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> Optional[LLMGateway]:
+    """
+    Process-wide gateway (one connection pool, one breaker), or None
+    when GROQ_API_KEY is not configured.
+    """
+    global _gateway
+    if _gateway is None and GROQ_API_KEY:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+                print(f"[RAG] LLM gateway initialized ({GROQ_BASE_URL})")
+    return _gateway
@@ -0,0 +1,83 @@
+# chatbot/management/commands/bench_menu_search.py
+"""
+Micro-benchmark of the exact menu search kernel on random vectors.
+
+Usage:
+    python manage.py bench_menu_search
+    python manage.py bench_menu_search --rows 1000,10000,100000 --dim 768 --queries 200
+
+Compares, per query:
+    baseline    renormalize every row per query + full argsort (the old kernel)
+    f32         pre-normalized float32 rows, mat-vec + argpartition
+    f16         pre-normalized float16 rows (scored in float32 blocks)
+    f32 batch   search_batch(): one mat-mat product for --batch queries
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chatbot.ann_index import ExactSearchBackend
+
+
+def baseline_search(vectors: np.ndarray, query: np.ndarray, top_k: int):
+    q = query / np.linalg.norm(query)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    scores = (vectors @ q) / norms
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return order, scores[order]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the exact menu search kernel at several menu sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=str, default='1000,10000,100000', help='Comma-separated row counts')
+        parser.add_argument('--dim', type=int, default=768, help='Embedding dimension (default: 768)')
+        parser.add_argument('--queries', type=int, default=200, help='Queries per measurement (default: 200)')
+        parser.add_argument('--batch', type=int, default=32, help='Queries per search_batch call (default: 32)')
+        parser.add_argument('--top-k', type=int, default=5, help='Results per query (default: 5)')
+
+    def _per_query_ms(self, fn, queries) -> float:
+        fn(queries[0])  # warm caches
+        started = time.perf_counter()
+        for q in queries:
+            fn(q)
+        return 1000 * (time.perf_counter() - started) / len(queries)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        dim, top_k, batch = options['dim'], options['top_k'], max(1, options['batch'])
+        queries = rng.standard_normal((options['queries'], dim)).astype(np.float32)
+
+        self.stdout.write(f"{'rows':>8} {'baseline':>10} {'f32':>10} {'f16':>10} {'f32 batch':>10} {'speedup':>8}  recall@{top_k}")
+        for n_rows in [int(n) for n in options['rows'].split(',') if n.strip()]:
+            raw = rng.standard_normal((n_rows, dim)).astype(np.float32)
+            unit = raw / np.linalg.norm(raw, axis=1, keepdims=True)
+            exact32 = ExactSearchBackend(unit, normalized=True)
+            exact16 = ExactSearchBackend(unit.astype(np.float16), normalized=True)
+
+            base_ms = self._per_query_ms(lambda q: baseline_search(raw, q, top_k), queries)
+            f32_ms = self._per_query_ms(lambda q: exact32.search(q, top_k), queries)
+            f16_ms = self._per_query_ms(lambda q: exact16.search(q, top_k), queries)
+
+            batches = [queries[i: i + batch] for i in range(0, len(queries), batch)]
+            exact32.search_batch(batches[0], top_k)
+            started = time.perf_counter()
+            for b in batches:
+                exact32.search_batch(b, top_k)
+            batch_ms = 1000 * (time.perf_counter() - started) / len(queries)
+
+            # Same top-k as the old kernel? (f16 may swap near-ties)
+            hits = sum(
+                len(set(baseline_search(raw, q, top_k)[0]) & set(exact16.search(q, top_k)[0]))
+                for q in queries[:50]
+            )
+            recall = hits / (top_k * min(50, len(queries)))
+
+            self.stdout.write(
+                f"{n_rows:>8} {base_ms:>8.3f}ms {f32_ms:>8.3f}ms {f16_ms:>8.3f}ms {batch_ms:>8.3f}ms "
+                f"{base_ms / max(f32_ms, 1e-9):>7.1f}x  {recall:.3f} (f16)"
+            )
@@ -0,0 +1,83 @@
+# chatbot/management/commands/export_onnx_model.py
+"""
+Export the menu embedding model to ONNX for the onnxruntime backend.
+
+Usage:
+    python manage.py export_onnx_model
+    python manage.py export_onnx_model --quantize
+    python manage.py export_onnx_model --output-dir models/onnx/all-mpnet-base-v2
+
+Then run the app with EMBEDDING_BACKEND=onnx
+(and EMBEDDING_ONNX_QUANTIZED=True to use the int8 model).
+"""
+
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.embedders import EMBEDDING_ONNX_DIR, check_parity, export_onnx_model
+
+
+class Command(BaseCommand):
+    help = 'Export the sentence-transformers embedding model to ONNX and check parity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            type=str,
+            default='sentence-transformers/all-mpnet-base-v2',
+            help='Sentence transformer model to export',
+        )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=str(EMBEDDING_ONNX_DIR),
+            help=f'Where to write the ONNX model (default: {EMBEDDING_ONNX_DIR})',
+        )
+        parser.add_argument(
+            '--quantize',
+            action='store_true',
+            help='Also write an int8 dynamically-quantized model',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.02,
+            help='Max allowed cosine score difference vs. the torch model',
+        )
+
+    def handle(self, *args, **options):
+        model_name = options['model']
+        output_dir = Path(options['output_dir'])
+
+        self.stdout.write(f"Exporting {model_name} to {output_dir}...")
+        model_path = export_onnx_model(model_name, output_dir, quantize=options['quantize'])
+        self.stdout.write(self.style.SUCCESS(f"✓ Saved: {model_path}"))
+
+        variants = [False, True] if options['quantize'] else [False]
+        failed = []
+        for quantized in variants:
+            label = "int8" if quantized else "fp32"
+            result = check_parity(
+                model_name, output_dir, quantized=quantized, tolerance=options['tolerance']
+            )
+            line = (
+                f"Parity ({label}): max |Δcos| = {result['max_abs_diff']:.4f} "
+                f"(tolerance {result['tolerance']})"
+            )
+            if result["ok"]:
+                self.stdout.write(self.style.SUCCESS(f"✓ {line}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"✗ {line}"))
+                failed.append(label)
+
+        if failed:
+            raise CommandError(
+                f"ONNX parity check failed for: {', '.join(failed)}. "
+                "Do not enable EMBEDDING_BACKEND=onnx with this export."
+            )
+
+        self.stdout.write("\nNext steps:")
+        self.stdout.write("1. Set EMBEDDING_BACKEND=onnx in your .env")
+        if options['quantize']:
+            self.stdout.write("2. Optionally set EMBEDDING_ONNX_QUANTIZED=True for the int8 model")
+        self.stdout.write("3. Rebuild the menu index: python manage.py generate_embeddings")
@@ -0,0 +1,74 @@
+# chatbot/management/commands/rollback_menu_index.py
+"""
+List or roll back the versioned menu index builds of a restaurant.
+
+Usage:
+    python manage.py rollback_menu_index --restaurant-id 1 --list
+    python manage.py rollback_menu_index --restaurant-id 1
+    python manage.py rollback_menu_index --restaurant-id 1 --build-id 20250101120000.123456789-ab12cd34
+
+Without --build-id the build before the current one is activated.
+Running web workers are notified and swap to the activated build.
+"""
+
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.index_events import publish_index_update
+from chatbot.menu_index import MENU_INDEX_DIR, activate_build, list_builds, read_current_build
+
+
+class Command(BaseCommand):
+    help = 'List or roll back the versioned menu index builds of a restaurant'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--restaurant-id',
+            type=int,
+            required=True,
+            help='Restaurant whose index to roll back',
+        )
+        parser.add_argument(
+            '--build-id',
+            type=str,
+            help='Build to activate (default: the one before the current build)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Only list the retained builds',
+        )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=str(MENU_INDEX_DIR),
+            help=f'Root directory of the per-restaurant indexes (default: {MENU_INDEX_DIR})',
+        )
+
+    def handle(self, *args, **options):
+        restaurant_id = options['restaurant_id']
+        root = Path(options['output_dir'])
+
+        builds = list_builds(restaurant_id, root)
+        current = read_current_build(restaurant_id, root)
+        if not builds:
+            raise CommandError(f"No versioned builds for restaurant_id={restaurant_id}")
+
+        if options['list']:
+            for build_id in builds:
+                marker = " (current)" if build_id == current else ""
+                self.stdout.write(f"{build_id}{marker}")
+            return
+
+        target = options.get('build_id')
+        if not target:
+            older = [b for b in builds if current is None or b < current]
+            if not older:
+                raise CommandError("No older build to roll back to")
+            target = older[-1]
+        elif target not in builds:
+            raise CommandError(f"Unknown build {target}; use --list to see retained builds")
+
+        activate_build(restaurant_id, target, root)
+        publish_index_update([restaurant_id])
+        self.stdout.write(self.style.SUCCESS(f"✓ restaurant_id={restaurant_id} now serves build {target}"))
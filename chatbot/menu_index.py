@@ -0,0 +1,866 @@
+# chatbot/menu_index.py
+"""
+Per-restaurant menu index used by the chatbot RAG engine.
+
+Every restaurant gets its own directory under MENU_INDEX_DIR:
+
+    menu_index/
+        restaurant_1/
+            CURRENT                   build_id of the live build
+            builds/
+                <build_id>/
+                    menu_embeddings.vec
+                    menu_columns.npz
+                    menu_ann_ivf.npz          (large menus only, see ann_index.py)
+                    embedding_metadata.json
+                <older build_id>/     kept for rollback (MENU_INDEX_KEEP_BUILDS)
+        restaurant_2/
+            ...
+
+so a query only ever scores the rows of one tenant, and rebuilding one
+restaurant never touches the files of another. Builds are immutable:
+a new one is written to its own directory and published by atomically
+replacing CURRENT, under a per-restaurant file lock.
+
+menu_embeddings.vec is a raw matrix of L2-normalized rows (float32, or
+float16 with MENU_INDEX_VECTOR_DTYPE=float16) behind a small JSON header
+(model, dim, rows, dtype, normalized, build_id). It is opened with mmap,
+so every gunicorn / Celery process on the node shares the same read-only
+pages through the OS page cache instead of holding a private np.load()
+copy.
+
+menu_columns.npz holds parallel arrays (item_id, name, category, price,
+veg flags, availability, ingredients) aligned with the vector rows, so
+search returns structured rows and MenuItem ids without parsing any
+strings. The same columns feed the in-memory lexical index (lexical_index.py).
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from filelock import FileLock
+
+from .ann_index import ExactSearchBackend, load_search_backend, write_ivf_file
+from .lexical_index import LexicalIndex
+
+# ============================================
+# Configuration
+# ============================================
+MENU_INDEX_DIR = Path(os.getenv("MENU_INDEX_DIR", "menu_index"))
+
+EMBEDDINGS_FILENAME = "menu_embeddings.vec"
+COLUMNS_FILENAME = "menu_columns.npz"
+METADATA_FILENAME = "embedding_metadata.json"
+
+# Versioned builds: restaurant_<id>/builds/<build_id>/ + CURRENT pointer
+BUILDS_DIRNAME = "builds"
+CURRENT_FILENAME = "CURRENT"
+LOCK_FILENAME = ".build.lock"
+MENU_INDEX_KEEP_BUILDS = int(os.getenv("MENU_INDEX_KEEP_BUILDS", "3"))
+MENU_INDEX_LOCK_TIMEOUT = float(os.getenv("MENU_INDEX_LOCK_TIMEOUT", "900"))
+
+COLUMN_NAMES = (
+    "item_id",
+    "name",
+    "category",
+    "price",
+    "is_vegetarian",
+    "is_vegan",
+    "available",
+    "ingredients",
+    "content_hash",
+)
+
+
+# Common restaurant typos / aliases
+COMMON_TYPO_MAP = {
+    "desert": "dessert",
+    "deserts": "desserts",
+    # you can add more later here...
+}
+
+# Vector file layout: MAGIC | uint32 header length | JSON header | padding | rows
+# The header block is page-sized so the rows start page-aligned.
+VECTOR_FILE_MAGIC = b"MENUVEC1"
+VECTOR_HEADER_SIZE = 4096
+VECTOR_DTYPE = np.dtype("<f4")
+# Storage dtype of new builds: float32 (default) or float16 (half the memory)
+MENU_INDEX_VECTOR_DTYPE = np.dtype(
+    "<f2" if os.getenv("MENU_INDEX_VECTOR_DTYPE", "float32").lower() in ("float16", "f2") else "<f4"
+)
+
+
+_last_build_ns = 0
+_build_id_lock = threading.Lock()
+
+
+def new_build_id() -> str:
+    """
+    Unique id for one index build, sortable by build time: local time
+    with nanoseconds, strictly increasing within a process, so builds of
+    the same second still sort in the order they were started.
+    """
+    global _last_build_ns
+    with _build_id_lock:
+        ns = max(time.time_ns(), _last_build_ns + 1)
+        _last_build_ns = ns
+    seconds, fraction = divmod(ns, 1_000_000_000)
+    return f"{time.strftime('%Y%m%d%H%M%S', time.localtime(seconds))}.{fraction:09d}-{uuid.uuid4().hex[:8]}"
+
+
+def _vector_header_block(header: Dict) -> bytes:
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix_len = len(VECTOR_FILE_MAGIC) + 4
+    if prefix_len + len(header_bytes) > VECTOR_HEADER_SIZE:
+        raise ValueError("Vector file header too large")
+    return (
+        VECTOR_FILE_MAGIC
+        + len(header_bytes).to_bytes(4, "little")
+        + header_bytes
+        + b"\0" * (VECTOR_HEADER_SIZE - prefix_len - len(header_bytes))
+    )
+
+
+class VectorFileWriter:
+    """
+    Streams rows into a vector file: append() chunks as they are encoded,
+    close() fills in the header and moves the file into place, so the
+    whole matrix never has to be in memory. Rows are L2-normalized on the
+    way in, so search is a plain dot product.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        model_name: str,
+        build_id: str,
+        dtype: np.dtype = MENU_INDEX_VECTOR_DTYPE,
+    ):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.dtype = np.dtype(dtype)
+        self.header = {
+            "model": model_name,
+            "dim": 0,
+            "rows": 0,
+            "dtype": self.dtype.str,
+            "normalized": True,
+            "build_id": build_id,
+        }
+        self._file = open(self.tmp_path, "wb")
+        # Placeholder; rewritten with the final row count in close()
+        self._file.write(_vector_header_block(self.header))
+
+    def append(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError(f"Expected a 2-D embedding matrix, got shape {vectors.shape}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = np.ascontiguousarray(vectors / norms, dtype=self.dtype)
+        if self.header["rows"] and vectors.shape[1] != self.header["dim"]:
+            raise ValueError(f"Expected dim {self.header['dim']}, got {vectors.shape[1]}")
+        self.header["dim"] = int(vectors.shape[1])
+        self.header["rows"] += int(vectors.shape[0])
+        self._file.write(vectors.tobytes(order="C"))
+
+    def close(self) -> Dict:
+        self._file.seek(0)
+        self._file.write(_vector_header_block(self.header))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        return self.header
+
+    def abort(self):
+        self._file.close()
+        if self.tmp_path.exists():
+            self.tmp_path.unlink()
+
+
+def write_vector_file(
+    path: Path,
+    vectors: np.ndarray,
+    model_name: str,
+    build_id: str,
+    dtype: np.dtype = MENU_INDEX_VECTOR_DTYPE,
+) -> Dict:
+    """
+    Write an embedding matrix in the mmap-able vector format.
+
+    The file is written next to its final location and moved into place
+    with os.replace(), so processes that already mapped the old file keep
+    reading it until they reopen.
+    """
+    writer = VectorFileWriter(path, model_name, build_id, dtype)
+    try:
+        writer.append(vectors)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def read_vector_header(path: Path) -> Dict:
+    """
+    Read only the JSON header of a vector file.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(VECTOR_FILE_MAGIC))
+        if magic != VECTOR_FILE_MAGIC:
+            raise ValueError(f"{path} is not a menu vector file")
+        header_len = int.from_bytes(f.read(4), "little")
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+
+def open_vector_file(path: Path) -> Tuple[Dict, np.ndarray]:
+    """
+    Map a vector file read-only. Returns (header, vectors) where vectors
+    is a np.memmap backed by the shared page cache.
+    """
+    header = read_vector_header(path)
+    rows, dim = header["rows"], header["dim"]
+    if rows == 0:
+        return header, np.empty((0, dim), dtype=VECTOR_DTYPE)
+
+    vectors = np.memmap(
+        path,
+        dtype=np.dtype(header.get("dtype", VECTOR_DTYPE.str)),
+        mode="r",
+        offset=VECTOR_HEADER_SIZE,
+        shape=(rows, dim),
+    )
+    return header, vectors
+
+
+def restaurant_index_dir(restaurant_id: int, root: Optional[Path] = None) -> Path:
+    """
+    Directory holding the index files of one restaurant.
+    """
+    root = Path(root) if root is not None else MENU_INDEX_DIR
+    return root / f"restaurant_{int(restaurant_id)}"
+
+
+def build_chunk_text(category: str, name: str, price) -> str:
+    """
+    Text that gets embedded for one menu item.
+    """
+    return f"Category: {category}. Item: {name}. Price: {price}"
+
+
+def content_hash(model_id: str, chunk_text: str) -> str:
+    """
+    Identity of one embedded row: the embedding model plus the exact text
+    that was encoded. Rows with an unchanged hash can reuse their vector.
+    """
+    return hashlib.sha1(f"{model_id}\n{chunk_text}".encode("utf-8")).hexdigest()
+
+
+def category_key(text: str) -> str:
+    """
+    Canonical lookup key for a category name or search term:
+    lowercase, no punctuation, single spaces, common typos fixed.
+    """
+    t = re.sub(r"[^a-z0-9\s]", "", (text or "").strip().lower())
+    t = re.sub(r"\s+", " ", t).strip()
+    return COMMON_TYPO_MAP.get(t, t)
+
+
+def category_key_variants(text: str) -> set:
+    """
+    All keys a category is reachable by: exact, singular/plural
+    ('desserts' / 'dessert') and the known typo spellings of those.
+    """
+    key = category_key(text)
+    if not key:
+        return set()
+    keys = {key, key.rstrip("s")}
+    keys |= {typo for typo, fixed in COMMON_TYPO_MAP.items() if fixed in keys}
+    return keys
+
+
+def format_price(price: float) -> str:
+    """
+    Render a price column value the way MenuItem.price prints (2 decimals).
+    """
+    return f"{price:.2f}"
+
+
+@dataclass
+class RestaurantIndex:
+    """
+    In-memory view of one restaurant's embeddings + columnar item metadata.
+
+    Row i of `embeddings` describes the item in row i of every column.
+    """
+    restaurant_id: int
+    embeddings: np.ndarray
+    columns: Dict[str, np.ndarray]
+    header: Dict = field(default_factory=dict)
+    # category key -> (display category, row indices); built once per load
+    category_rows: Dict[str, Tuple[str, np.ndarray]] = field(default_factory=dict)
+    # ExactSearchBackend / IVFSearchBackend over `embeddings`
+    searcher: Optional[object] = None
+    # BM25 + name-trigram index over the same rows; built once per load
+    lexical: Optional[LexicalIndex] = None
+    # Boolean row masks for structured filters ("vegetarian", "vegan",
+    # "non_vegetarian"); built once per load
+    masks: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.category_rows:
+            self.category_rows = build_category_index(self.columns.get("category", ()))
+        if self.searcher is None:
+            self.searcher = ExactSearchBackend(
+                self.embeddings, normalized=self.header.get("normalized", False)
+            )
+        if self.lexical is None:
+            c = self.columns
+            self.lexical = LexicalIndex(
+                names=c["name"],
+                categories=c.get("category", ()),
+                # Indexes built before the column existed simply lack it
+                ingredients=c.get("ingredients", ()),
+                is_vegetarian=c.get("is_vegetarian", ()),
+                is_vegan=c.get("is_vegan", ()),
+            )
+        if not self.masks:
+            n_rows = len(self)
+            vegan = np.asarray(self.columns.get("is_vegan", np.zeros(n_rows, dtype=bool)), dtype=bool)
+            vegetarian = vegan | np.asarray(
+                self.columns.get("is_vegetarian", np.zeros(n_rows, dtype=bool)), dtype=bool
+            )
+            self.masks = {
+                "vegan": vegan,
+                "vegetarian": vegetarian,
+                "non_vegetarian": ~vegetarian,
+            }
+
+    def __len__(self) -> int:
+        return len(self.columns["item_id"])
+
+    def search(
+        self, query_emb: np.ndarray, top_k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k rows for a query embedding: (row indices, cosine scores), best first.
+        With a mask (see filter_mask) only the allowed rows are scored.
+        """
+        return self.searcher.search(query_emb, top_k, mask)
+
+    def filter_mask(self, filters) -> Optional[np.ndarray]:
+        """
+        Boolean mask of the rows satisfying SearchFilters (search_filters.py),
+        combined from the precomputed diet masks, the price column and the
+        category index. None when there is nothing to filter on. A category
+        the menu doesn't have is ignored (the search term still carries it).
+        """
+        if not filters:
+            return None
+
+        mask = np.ones(len(self), dtype=bool)
+        if filters.vegan:
+            mask &= self.masks["vegan"]
+        if filters.vegetarian:
+            mask &= self.masks["vegetarian"]
+        elif filters.vegetarian is False:
+            mask &= self.masks["non_vegetarian"]
+
+        price = self.columns["price"]
+        if filters.min_price is not None:
+            mask &= price >= filters.min_price
+        if filters.max_price is not None:
+            mask &= price <= filters.max_price
+
+        if filters.category:
+            category_hit = self.lookup_category(filters.category)
+            if category_hit is not None:
+                in_category = np.zeros(len(self), dtype=bool)
+                in_category[category_hit[1]] = True
+                mask &= in_category
+        return mask
+
+    def search_batch(self, query_embs: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        search() for a (queries, dim) matrix in one pass; one result per query.
+        """
+        return self.searcher.search_batch(query_embs, top_k)
+
+    def score_rows(self, query_emb: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Cosine scores of a query embedding against specific rows only.
+        """
+        vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+        if len(vectors) == 0:
+            return np.empty(0, dtype=np.float32)
+        q = np.asarray(query_emb, dtype=np.float32).reshape(-1)
+        scores = vectors @ (q / (np.linalg.norm(q) or 1.0))
+        if not self.header.get("normalized", False):
+            norms = np.linalg.norm(vectors, axis=1)
+            norms[norms == 0] = 1.0
+            scores /= norms
+        return scores
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate private (per-process) footprint of this index: columns,
+        masks, category/IVF arrays and lexical postings. Memory-mapped
+        vectors live in the shared page cache and are counted by
+        mapped_bytes() instead.
+        """
+        def arrays_nbytes(values) -> int:
+            return sum(
+                v.nbytes for v in values
+                if isinstance(v, np.ndarray) and not isinstance(v, np.memmap)
+            )
+
+        total = arrays_nbytes([self.embeddings]) + arrays_nbytes(self.columns.values())
+        total += arrays_nbytes(self.masks.values())
+        total += arrays_nbytes(rows for _, rows in self.category_rows.values())
+        if self.searcher is not None:
+            # IVF centroids / lists, inverse norms; the vectors are counted above
+            total += arrays_nbytes(
+                v for k, v in vars(self.searcher).items() if k != "vectors"
+            )
+        if self.lexical is not None:
+            for postings in (self.lexical.postings, self.lexical.gram_postings):
+                total += sum(rows.nbytes + counts.nbytes for rows, counts in postings.values())
+        return int(total)
+
+    def mapped_bytes(self) -> int:
+        """Size of the memory-mapped vectors (shared by every process)."""
+        return int(self.embeddings.nbytes) if isinstance(self.embeddings, np.memmap) else 0
+
+    def lookup_category(self, term: str) -> Optional[Tuple[str, np.ndarray]]:
+        """
+        Rows of the category matching a search term ('desserts', 'dessert',
+        'deserts' ...), or None. Costs O(matches), not O(menu size).
+        """
+        key = category_key(term)
+        if not key:
+            return None
+        return self.category_rows.get(key) or self.category_rows.get(key.rstrip("s"))
+
+    @property
+    def build_id(self) -> Optional[str]:
+        return self.header.get("build_id")
+
+    def row(self, idx: int) -> Dict:
+        """
+        Structured metadata for one row (no string parsing involved).
+        """
+        c = self.columns
+        return {
+            "id": int(c["item_id"][idx]),
+            "name": str(c["name"][idx]),
+            "category": str(c["category"][idx]),
+            "price": format_price(float(c["price"][idx])),
+            "is_vegetarian": bool(c["is_vegetarian"][idx]),
+            "is_vegan": bool(c["is_vegan"][idx]),
+            "available": bool(c["available"][idx]),
+        }
+
+    def chunk_text(self, idx: int) -> str:
+        """
+        The text that was embedded for this row (used as LLM context).
+        """
+        c = self.columns
+        return build_chunk_text(
+            c["category"][idx], c["name"][idx], format_price(float(c["price"][idx]))
+        )
+
+
+def build_category_index(categories) -> Dict[str, Tuple[str, np.ndarray]]:
+    """
+    Map every normalized key of every category to its row indices.
+    """
+    rows_by_category: Dict[str, list] = {}
+    for idx, category in enumerate(categories):
+        category = str(category)
+        if category:
+            rows_by_category.setdefault(category, []).append(idx)
+
+    index: Dict[str, Tuple[str, np.ndarray]] = {}
+    for category, rows in rows_by_category.items():
+        entry = (category, np.asarray(rows, dtype=np.int64))
+        for key in category_key_variants(category):
+            # Exact keys win over singular/typo variants of another category
+            if key not in index or key == category_key(category):
+                index[key] = entry
+    return index
+
+
+def columns_from_rows(rows: Sequence[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Turn a list of per-item dicts into the parallel column arrays
+    stored next to the vectors.
+    """
+    return {
+        "item_id": np.array([r["item_id"] for r in rows], dtype=np.int64),
+        "name": np.array([r["name"] for r in rows], dtype=np.str_),
+        "category": np.array([r.get("category") or "" for r in rows], dtype=np.str_),
+        "price": np.array([float(r["price"]) for r in rows], dtype=np.float64),
+        "is_vegetarian": np.array([bool(r.get("is_vegetarian")) for r in rows], dtype=bool),
+        "is_vegan": np.array([bool(r.get("is_vegan")) for r in rows], dtype=bool),
+        "available": np.array([bool(r.get("available", True)) for r in rows], dtype=bool),
+        "ingredients": np.array(
+            [_ingredients_text(r.get("ingredients")) for r in rows], dtype=np.str_
+        ),
+        "content_hash": np.array([r.get("content_hash") or "" for r in rows], dtype=np.str_),
+    }
+
+
+def _ingredients_text(ingredients) -> str:
+    # MenuItem.ingredients is a JSON list; tolerate plain strings too
+    if not ingredients:
+        return ""
+    if isinstance(ingredients, str):
+        return ingredients
+    return ", ".join(str(i) for i in ingredients)
+
+
+def write_columns_file(path: Path, columns: Dict[str, np.ndarray]):
+    """
+    Save the column arrays as an uncompressed .npz (no pickled objects).
+    """
+    path = Path(path)
+    missing = [name for name in COLUMN_NAMES if name not in columns]
+    if missing:
+        raise ValueError(f"Missing index columns: {missing}")
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **{name: np.asarray(columns[name]) for name in COLUMN_NAMES})
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_columns_file(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def build_dir(restaurant_id: int, build_id: str, root: Optional[Path] = None) -> Path:
+    """
+    Directory of one immutable build of a restaurant's index.
+    """
+    return restaurant_index_dir(restaurant_id, root) / BUILDS_DIRNAME / build_id
+
+
+def restaurant_build_lock(restaurant_id: int, root: Optional[Path] = None) -> FileLock:
+    """
+    Cross-process lock serializing index builds of one restaurant.
+    Re-entrant within a process (write_restaurant_index takes it too).
+    """
+    index_dir = restaurant_index_dir(restaurant_id, root)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(index_dir / LOCK_FILENAME), timeout=MENU_INDEX_LOCK_TIMEOUT, is_singleton=True)
+
+
+def read_current_build(restaurant_id: int, root: Optional[Path] = None) -> Optional[str]:
+    """
+    build_id the CURRENT pointer of a restaurant refers to, or None.
+    """
+    try:
+        path = restaurant_index_dir(restaurant_id, root) / CURRENT_FILENAME
+        return path.read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_index_dir(restaurant_id: int, root: Optional[Path] = None) -> Optional[Path]:
+    """
+    Directory holding the live files of a restaurant: the build CURRENT
+    points to, or the restaurant directory itself for indexes written
+    before versioned builds existed. None if nothing was built yet.
+    """
+    build_id = read_current_build(restaurant_id, root)
+    if build_id:
+        return build_dir(restaurant_id, build_id, root)
+    legacy_dir = restaurant_index_dir(restaurant_id, root)
+    if (legacy_dir / EMBEDDINGS_FILENAME).exists():
+        return legacy_dir
+    return None
+
+
+def indexed_restaurant_ids(root: Optional[Path] = None) -> List[int]:
+    """
+    Restaurants that currently have an index under `root`.
+    """
+    root = Path(root) if root is not None else MENU_INDEX_DIR
+    if not root.exists():
+        return []
+    restaurant_ids = []
+    for p in root.glob("restaurant_*"):
+        suffix = p.name[len("restaurant_"):]
+        if p.is_dir() and suffix.isdigit() and current_index_dir(int(suffix), root) is not None:
+            restaurant_ids.append(int(suffix))
+    return sorted(restaurant_ids)
+
+
+def list_builds(restaurant_id: int, root: Optional[Path] = None) -> List[str]:
+    """
+    Complete builds of a restaurant, oldest first (build ids sort by time).
+    """
+    builds_dir = restaurant_index_dir(restaurant_id, root) / BUILDS_DIRNAME
+    if not builds_dir.exists():
+        return []
+    return sorted(
+        p.name for p in builds_dir.iterdir() if p.is_dir() and not p.name.endswith(".tmp")
+    )
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows: directories can't be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def activate_build(restaurant_id: int, build_id: str, root: Optional[Path] = None):
+    """
+    Atomically point CURRENT at a complete build (also used for rollback).
+    Readers see either the old or the new build, never a mix.
+    """
+    if not build_dir(restaurant_id, build_id, root).is_dir():
+        raise FileNotFoundError(f"No build {build_id} for restaurant_id={restaurant_id}")
+
+    index_dir = restaurant_index_dir(restaurant_id, root)
+    with restaurant_build_lock(restaurant_id, root):
+        tmp_path = index_dir / f"{CURRENT_FILENAME}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(build_id)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_dir / CURRENT_FILENAME)
+        _fsync_dir(index_dir)
+
+
+def gc_builds(
+    restaurant_id: int, keep: int = MENU_INDEX_KEEP_BUILDS, root: Optional[Path] = None
+) -> List[str]:
+    """
+    Delete old builds, keeping the current one plus the `keep` newest
+    (for rollback), and any abandoned half-written build directories.
+    Processes that still map a deleted build keep reading it until they
+    swap (unlinked files stay valid while mapped).
+    """
+    builds_dir = restaurant_index_dir(restaurant_id, root) / BUILDS_DIRNAME
+    removed = []
+    with restaurant_build_lock(restaurant_id, root):
+        if builds_dir.exists():
+            for p in builds_dir.iterdir():
+                if p.name.endswith(".tmp"):
+                    shutil.rmtree(p, ignore_errors=True)
+
+        current = read_current_build(restaurant_id, root)
+        builds = list_builds(restaurant_id, root)
+        retained = set(builds[-keep:]) if keep > 0 else set()
+        for build_id in builds:
+            if build_id != current and build_id not in retained:
+                shutil.rmtree(builds_dir / build_id, ignore_errors=True)
+                removed.append(build_id)
+    return removed
+
+
+class RestaurantIndexBuild:
+    """
+    One new build of a restaurant's index, written incrementally:
+
+        with RestaurantIndexBuild(restaurant_id, metadata, root) as build:
+            for embeddings, columns in chunks:
+                build.append(embeddings, columns)
+            build_dir = build.commit()
+
+    Holds the restaurant's build lock throughout. Vectors are streamed to
+    disk as they are appended; nothing becomes visible until commit()
+    renames the finished directory into place and flips CURRENT. Leaving
+    the block without commit() discards the partial build.
+    """
+
+    def __init__(self, restaurant_id: int, metadata: Dict, root: Optional[Path] = None):
+        self.restaurant_id = restaurant_id
+        self.root = root
+        self.metadata = dict(metadata)
+        self.build_id: Optional[str] = None
+        self._lock = restaurant_build_lock(restaurant_id, root)
+        self._columns: List[Dict[str, np.ndarray]] = []
+        self._vectors: Optional[VectorFileWriter] = None
+        self.committed = False
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            # Stamped once the lock is held, so build ids sort in commit
+            # order even when builds queue on the lock
+            self.metadata.setdefault("build_id", new_build_id())
+            self.build_id = self.metadata["build_id"]
+            self.final_dir = build_dir(self.restaurant_id, self.build_id, self.root)
+            self.tmp_dir = self.final_dir.with_name(self.final_dir.name + ".tmp")
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir.mkdir(parents=True)
+            self._vectors = VectorFileWriter(
+                self.tmp_dir / EMBEDDINGS_FILENAME,
+                model_name=self.metadata.get("model", ""),
+                build_id=self.build_id,
+            )
+        except Exception:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self.committed:
+                self._vectors.abort()
+                shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        finally:
+            self._lock.release()
+        return False
+
+    @property
+    def rows(self) -> int:
+        return self._vectors.header["rows"]
+
+    def append(self, embeddings: np.ndarray, columns: Dict[str, np.ndarray]):
+        if len(embeddings) != len(columns["item_id"]):
+            raise ValueError(
+                f"{len(embeddings)} vectors but {len(columns['item_id'])} column rows"
+            )
+        self._vectors.append(embeddings)
+        self._columns.append(columns)
+
+    def commit(self) -> Path:
+        self._vectors.close()
+        chunks = self._columns or [columns_from_rows([])]
+        columns = {
+            name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMN_NAMES
+        }
+        write_columns_file(self.tmp_dir / COLUMNS_FILENAME, columns)
+
+        # IVF training streams the mapped rows (a sample, then blocks)
+        _, embeddings = open_vector_file(self.tmp_dir / EMBEDDINGS_FILENAME)
+        write_ivf_file(self.tmp_dir, embeddings, self.build_id)
+        del embeddings
+
+        with open(self.tmp_dir / METADATA_FILENAME, "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(self.tmp_dir, self.final_dir)
+        _fsync_dir(self.final_dir.parent)
+        self.committed = True
+
+        activate_build(self.restaurant_id, self.build_id, self.root)
+        gc_builds(self.restaurant_id, root=self.root)
+        return self.final_dir
+
+
+def write_restaurant_index(
+    restaurant_id: int,
+    embeddings: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    metadata: Dict,
+    root: Optional[Path] = None,
+) -> Path:
+    """
+    Save one restaurant's embeddings, item columns and metadata as a new
+    build and make it current. Returns the build directory.
+
+    Files are written to builds/<build_id>.tmp/, the directory is renamed
+    into place once complete, and only then is CURRENT flipped, so a
+    reader can never pair new vectors with old columns.
+    """
+    with RestaurantIndexBuild(restaurant_id, metadata, root) as build:
+        build.append(embeddings, columns)
+        return build.commit()
+
+
+def reusable_vectors(
+    restaurant_id: int, model_id: str, root: Optional[Path] = None
+) -> Dict[str, np.ndarray]:
+    """
+    content_hash -> vector for every row of the current build that was
+    encoded with `model_id` (empty if there is no such build, or it
+    predates the content_hash column).
+    """
+    index_dir = current_index_dir(restaurant_id, root)
+    if index_dir is None or not (index_dir / EMBEDDINGS_FILENAME).exists():
+        return {}
+
+    header, vectors = open_vector_file(index_dir / EMBEDDINGS_FILENAME)
+    if header.get("model") != model_id:
+        return {}
+    if vectors.dtype.itemsize < MENU_INDEX_VECTOR_DTYPE.itemsize:
+        # float16 rows would lose precision in a float32 build
+        return {}
+    hashes = read_columns_file(index_dir / COLUMNS_FILENAME).get("content_hash")
+    if hashes is None or len(hashes) != len(vectors):
+        return {}
+
+    # Row views into the mapping (no copy); they stay valid even if the
+    # build is garbage-collected while a rebuild still reads them
+    return {str(h): vectors[i] for i, h in enumerate(hashes) if h}
+
+
+def load_restaurant_index(
+    restaurant_id: int, root: Optional[Path] = None, model_id: Optional[str] = None
+) -> Optional[RestaurantIndex]:
+    """
+    Load one restaurant's index (its current build) from disk.
+    Returns None if no index has been generated for it yet, or if
+    `model_id` is given and the vectors were encoded with another model
+    (queries would be compared against a different embedding space).
+    """
+    index_dir = current_index_dir(restaurant_id, root)
+    if index_dir is None:
+        return None
+    emb_path = index_dir / EMBEDDINGS_FILENAME
+    columns_path = index_dir / COLUMNS_FILENAME
+
+    if not emb_path.exists() or not columns_path.exists():
+        return None
+
+    header, embeddings = open_vector_file(emb_path)
+    if model_id and header.get("model") and header["model"] != model_id:
+        print(
+            f"[RAG] Index for restaurant_id={restaurant_id} was built with "
+            f"{header['model']}, but queries use {model_id}; ignoring it until it is rebuilt."
+        )
+        return None
+    columns = read_columns_file(columns_path)
+
+    if len(embeddings) != len(columns.get("item_id", ())):
+        # A half-written rebuild; treat as "not ready yet" rather than
+        # pairing vectors with the wrong items.
+        print(
+            f"[RAG] Index for restaurant_id={restaurant_id} is inconsistent "
+            f"({len(embeddings)} vectors vs {len(columns.get('item_id', ()))} rows); skipping."
+        )
+        return None
+
+    return RestaurantIndex(
+        restaurant_id=int(restaurant_id),
+        embeddings=embeddings,
+        columns=columns,
+        header=header,
+        searcher=load_search_backend(
+            index_dir, embeddings, header.get("build_id"), normalized=header.get("normalized", False)
+        ),
+    )
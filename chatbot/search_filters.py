@@ -0,0 +1,146 @@
+# chatbot/search_filters.py
+"""
+Structured constraints on menu searches ("veg starters under 200",
+"vegan desserts", "mains between 150 and 300").
+
+SearchFilters come from the LLM classifier's "filters" field when it has
+one, merged with a local parse of the message (which also works when the
+LLM is down). RestaurantIndex.filter_mask() turns them into a boolean row
+mask built from the precomputed column masks, and the vector / lexical
+searches only score the rows it allows.
+
+    filters, term = parse_search_filters("veg starters under 200")
+    # SearchFilters(vegetarian=True, max_price=200.0), "starters"
+"""
+import re
+from dataclasses import dataclass, fields
+from typing import Dict, Optional, Tuple
+
+_NUMBER = r"(?:rs\.?|inr|₹)?\s*(\d+(?:\.\d+)?)"
+
+# Order matters: ranges before single bounds, "non veg" before "veg"
+_PRICE_RANGE_RE = re.compile(rf"\b(?:between|from)\s+{_NUMBER}\s*(?:and|to|-)\s*{_NUMBER}")
+_MAX_PRICE_RE = re.compile(
+    rf"\b(?:under|below|less than|cheaper than|upto|up to|within|max(?:imum)?|at most)\s+{_NUMBER}"
+)
+_MIN_PRICE_RE = re.compile(rf"\b(?:above|over|more than|at least|min(?:imum)?)\s+{_NUMBER}")
+_NON_VEG_RE = re.compile(r"\bnon[\s-]?(?:veg|vegetarian)\b")
+_VEGAN_RE = re.compile(r"\bvegan\b")
+_VEG_RE = re.compile(r"\b(?:veg|vegetarian|veggie|pure veg)\b")
+# Left over once a price phrase is removed ("... rupees", "... rs")
+_CURRENCY_WORD_RE = re.compile(r"\b(?:rupees?|rs|inr|bucks)\b|₹")
+
+
+@dataclass
+class SearchFilters:
+    """
+    None means "no constraint". vegetarian=False asks for non-veg dishes.
+    """
+    vegetarian: Optional[bool] = None
+    vegan: Optional[bool] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    category: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) is not None for f in fields(self))
+
+    def merged(self, other: "SearchFilters") -> "SearchFilters":
+        """This object's constraints, with gaps filled from `other`."""
+        return SearchFilters(**{
+            f.name: getattr(self, f.name) if getattr(self, f.name) is not None else getattr(other, f.name)
+            for f in fields(self)
+        })
+
+    def describe(self, term: Optional[str] = None) -> str:
+        """
+        Short human phrase for replies: 'vegetarian starters under ₹200'
+        (`term` replaces the category when given).
+        """
+        parts = []
+        if self.vegan:
+            parts.append("vegan")
+        elif self.vegetarian:
+            parts.append("vegetarian")
+        elif self.vegetarian is False:
+            parts.append("non-vegetarian")
+        if term or self.category:
+            parts.append(term or self.category)
+        if self.min_price is not None and self.max_price is not None:
+            parts.append(f"between ₹{self.min_price:g} and ₹{self.max_price:g}")
+        elif self.max_price is not None:
+            parts.append(f"under ₹{self.max_price:g}")
+        elif self.min_price is not None:
+            parts.append(f"over ₹{self.min_price:g}")
+        return " ".join(parts)
+
+    @classmethod
+    def from_llm(cls, data) -> "SearchFilters":
+        """
+        Filters from the LLM's JSON ({"vegetarian": true, "max_price": 200, ...});
+        anything malformed is ignored.
+        """
+        if not isinstance(data, dict):
+            return cls()
+
+        def flag(key) -> Optional[bool]:
+            value = data.get(key)
+            return value if isinstance(value, bool) else None
+
+        def price(key) -> Optional[float]:
+            try:
+                value = float(data.get(key))
+            except (TypeError, ValueError):
+                return None
+            return value if value >= 0 else None
+
+        category = data.get("category")
+        return cls(
+            vegetarian=flag("vegetarian"),
+            vegan=flag("vegan"),
+            min_price=price("min_price"),
+            max_price=price("max_price"),
+            category=category.strip().lower() if isinstance(category, str) and category.strip() else None,
+        )
+
+    def to_dict(self) -> Dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if getattr(self, f.name) is not None}
+
+
+def parse_search_filters(text: str) -> Tuple[SearchFilters, str]:
+    """
+    Pull diet and price constraints out of a search phrase.
+    Returns (filters, the phrase with those words removed). The category
+    is left in the phrase; the index decides whether it names one.
+    """
+    t = (text or "").lower()
+    filters = SearchFilters()
+
+    match = _PRICE_RANGE_RE.search(t)
+    if match:
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        filters.min_price, filters.max_price = low, high
+        t = t[: match.start()] + " " + t[match.end():]
+    else:
+        match = _MAX_PRICE_RE.search(t)
+        if match:
+            filters.max_price = float(match.group(1))
+            t = t[: match.start()] + " " + t[match.end():]
+        match = _MIN_PRICE_RE.search(t)
+        if match:
+            filters.min_price = float(match.group(1))
+            t = t[: match.start()] + " " + t[match.end():]
+    if filters.min_price is not None or filters.max_price is not None:
+        t = _CURRENCY_WORD_RE.sub(" ", t)
+
+    if _NON_VEG_RE.search(t):
+        filters.vegetarian = False
+        t = _NON_VEG_RE.sub(" ", t)
+    if _VEGAN_RE.search(t):
+        filters.vegan = True
+        t = _VEGAN_RE.sub(" ", t)
+    if _VEG_RE.search(t):
+        filters.vegetarian = True
+        t = _VEG_RE.sub(" ", t)
+
+    return filters, " ".join(t.split())
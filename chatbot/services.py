@@ -48,6 +48,22 @@ def find_menu_item_by_name(restaurant: Restaurant, item_name: str) -> MenuItem:
     raise MenuItem.DoesNotExist(f"No menu item found matching: {item_name}")
 
 
+def find_menu_item_for_result(restaurant: Restaurant, result: ChatbotResult) -> MenuItem:
+    """
+    Resolve the MenuItem for an ADD/REMOVE result.
+    Uses the MenuItem id returned by the search index when present,
+    and only falls back to name matching if it is missing or stale.
+    """
+    if result.item_id:
+        try:
+            return MenuItem.objects.get(restaurant=restaurant, id=result.item_id)
+        except MenuItem.DoesNotExist:
+            # Item deleted since the index was built
+            pass
+
+    return find_menu_item_by_name(restaurant, result.item_name)
+
+
 def apply_intent(restaurant: Restaurant, session_id: str, result: ChatbotResult):
     """
     Takes ChatbotResult from AI engine, performs DB actions,
@@ -158,7 +174,7 @@ def apply_intent(restaurant: Restaurant, session_id: str, result: ChatbotResult)
             )
 
         try:
-            menu_item = find_menu_item_by_name(restaurant, result.item_name)
+            menu_item = find_menu_item_for_result(restaurant, result)
         except MenuItem.DoesNotExist:
             similar_items = MenuItem.objects.filter(
                 restaurant=restaurant,
@@ -239,7 +255,7 @@ def apply_intent(restaurant: Restaurant, session_id: str, result: ChatbotResult)
             return "Which item would you like to remove?", order, {}
 
         try:
-            menu_item = find_menu_item_by_name(restaurant, result.item_name)
+            menu_item = find_menu_item_for_result(restaurant, result)
             oi = OrderItem.objects.get(
                 order=order,
                 menu_item=menu_item,
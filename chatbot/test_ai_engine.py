@@ -11,10 +11,13 @@ import os
 import sys
 from pathlib import Path
 
-# Add parent directory to path if running standalone
-sys.path.insert(0, str(Path(__file__).parent))
+# Add project root to path if running standalone
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from engine import parse_message, load_rag_system
+from chatbot.engine import parse_message, load_rag_system
+from chatbot.menu_index import COLUMNS_FILENAME, EMBEDDINGS_FILENAME, current_index_dir, restaurant_index_dir
+
+RESTAURANT_ID = int(os.getenv("TEST_RESTAURANT_ID", "1"))
 
 
 def print_result(query: str, result):
@@ -44,8 +47,9 @@ def run_tests():
     except Exception as e:
         print(f"❌ Failed to load RAG system: {e}")
         print("\nMake sure you have:")
-        print("1. menu_embeddings.npy")
-        print("2. text_chunks.json")
+        print(f"1. A current build in {restaurant_index_dir(RESTAURANT_ID)} "
+              f"(python manage.py generate_embeddings --restaurant-id {RESTAURANT_ID})")
+        print(f"2. {EMBEDDINGS_FILENAME} and {COLUMNS_FILENAME} in that build")
         print("3. GROQ_API_KEY in .env")
         return
     
@@ -98,7 +102,7 @@ def run_tests():
     success_count = 0
     for query in test_queries:
         try:
-            result = parse_message(query)
+            result = parse_message(query, restaurant_id=RESTAURANT_ID)
             print_result(query, result)
             
             # Count as success if not HELP or has high confidence
@@ -118,8 +122,10 @@ def run_tests():
     
     # Check for common issues
     print("\n✅ System Check:")
-    print(f"   Embeddings: {'✓' if Path('menu_embeddings.npy').exists() else '✗'}")
-    print(f"   Text chunks: {'✓' if Path('text_chunks.json').exists() else '✗'}")
+    index_dir = current_index_dir(RESTAURANT_ID)
+    print(f"   Current build: {index_dir or '✗'}")
+    print(f"   Embeddings: {'✓' if index_dir and (index_dir / EMBEDDINGS_FILENAME).exists() else '✗'}")
+    print(f"   Item columns: {'✓' if index_dir and (index_dir / COLUMNS_FILENAME).exists() else '✗'}")
     print(f"   GROQ_API_KEY: {'✓' if os.getenv('GROQ_API_KEY') else '✗'}")
 
 
@@ -146,7 +152,7 @@ def interactive_mode():
             if not query:
                 continue
             
-            result = parse_message(query)
+            result = parse_message(query, restaurant_id=RESTAURANT_ID)
             print(f"\nBot ({result.intent}, conf={result.confidence:.2f}): {result.reply}")
             
             if result.item_name:
@@ -0,0 +1,1053 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+
+from restaurants.models import Restaurant
+
+from . import ann_index, engine
+from .ann_index import ExactSearchBackend, IVFSearchBackend, train_ivf
+from .embedders import ONNX_CONFIG_FILENAME, ONNX_MODEL_FILENAME, OnnxSentenceEncoder
+from .engine import FAST_PATH_MIN_CONFIDENCE, fast_parse_intent
+from .index_events import FileGenerationStore
+from .index_manager import IndexManager
+from .intent_classifier import rank_intents, train_intent_classifier
+from .llm_gateway import CircuitBreaker, LLMError, LLMGateway, LLMUnavailable
+from .menu_index import (
+    activate_build,
+    columns_from_rows,
+    gc_builds,
+    list_builds,
+    load_restaurant_index,
+    open_vector_file,
+    read_current_build,
+    write_restaurant_index,
+    write_vector_file,
+)
+from .search_filters import SearchFilters, parse_search_filters
+
+
+# ============================================
+# Per-restaurant index partitions
+# ============================================
+def _menu_rows(count: int, offset: int = 0):
+    return [
+        {"item_id": offset + i, "name": f"Dish {offset + i}", "category": "Mains", "price": 100 + i}
+        for i in range(count)
+    ]
+
+
+class RestaurantPartitionTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        rng = np.random.default_rng(0)
+        self.vectors = {rid: rng.standard_normal((4, 8)).astype(np.float32) for rid in (1, 2)}
+        for rid, offset in ((1, 0), (2, 100)):
+            self.publish(rid, self.vectors[rid], offset)
+
+        # The query is restaurant 2's first dish
+        self.query = self.vectors[2][0]
+        patches = [
+            mock.patch.object(engine, "_index_manager", IndexManager(self.load, budget_mb=0)),
+            mock.patch.object(engine, "INDEX_LISTENER_ENABLED", False),
+            mock.patch.object(engine, "embed_query", lambda text, wait_for_model=True: self.query),
+            mock.patch.object(engine, "HYBRID_SEARCH", False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def load(self, restaurant_id, generation):
+        return load_restaurant_index(restaurant_id, self.root), 0
+
+    def publish(self, restaurant_id, vectors, offset):
+        write_restaurant_index(
+            restaurant_id, vectors, columns_from_rows(_menu_rows(len(vectors), offset)),
+            {"model": "test-model"}, root=self.root,
+        )
+
+    def test_search_only_returns_own_rows(self):
+        own = engine.semantic_search("dish", 1, top_k=10)
+        self.assertEqual(sorted(r["item_id"] for r in own), [0, 1, 2, 3])
+
+        other = engine.semantic_search("dish", 2, top_k=1)
+        self.assertEqual(other[0]["item_id"], 100)
+        self.assertAlmostEqual(other[0]["score"], 1.0, places=5)
+
+        self.assertEqual(engine.semantic_search("dish", 3), [])
+        self.assertEqual(engine.semantic_search("dish", None), [])
+
+    def test_rebuild_leaves_other_restaurants_untouched(self):
+        before = read_current_build(2, self.root)
+        resident = engine.get_restaurant_index(2)
+        self.publish(1, self.vectors[1][:2], 0)
+        engine.reload_rag_system(1)
+
+        self.assertEqual(len(engine.semantic_search("dish", 1, top_k=10)), 2)
+        # Restaurant 2 keeps its files and its in-memory index
+        self.assertEqual(read_current_build(2, self.root), before)
+        self.assertIs(engine.get_restaurant_index(2), resident)
+        self.assertEqual(len(engine.semantic_search("dish", 2, top_k=10)), 4)
+
+
+# ============================================
+# Memory-mapped vector store
+# ============================================
+class VectorFileTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_round_trip_is_mapped_read_only(self):
+        vectors = np.array([[3, 4], [0, 2], [0, 0]], dtype=np.float32)
+        path = self.root / "menu_embeddings.vec"
+        write_vector_file(path, vectors, "test-model", "build-1")
+
+        header, mapped = open_vector_file(path)
+        self.assertEqual(
+            {k: header[k] for k in ("model", "dim", "rows", "build_id", "normalized")},
+            {"model": "test-model", "dim": 2, "rows": 3, "build_id": "build-1", "normalized": True},
+        )
+        self.assertIsInstance(mapped, np.memmap)
+        self.assertFalse(mapped.flags.writeable)
+        # Rows are stored unit-length; zero rows stay zero
+        np.testing.assert_allclose(mapped, [[0.6, 0.8], [0, 1], [0, 0]])
+
+    def test_other_model_counts_as_missing(self):
+        embeddings = np.eye(3, dtype=np.float32)
+        write_restaurant_index(1, embeddings, columns_from_rows(_menu_rows(3)), {"model": "test-model"}, root=self.root)
+        self.assertIsNotNone(load_restaurant_index(1, self.root, model_id="test-model"))
+        self.assertIsNone(load_restaurant_index(1, self.root, model_id="other-model"))
+
+
+# ============================================
+# Query-embedding cache
+# ============================================
+class EmbeddingCacheTests(SimpleTestCase):
+    def test_lru_eviction_and_counters(self):
+        cache = engine.LRUCache(max_size=2, ttl_seconds=60)
+        cache.store("a", 1)
+        cache.store("b", 2)
+        self.assertEqual(cache.lookup("a"), 1)  # "b" is now least recently used
+        cache.store("c", 3)
+        self.assertIsNone(cache.lookup("b"))
+        self.assertEqual((cache.lookup("a"), cache.lookup("c")), (1, 3))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (2, 3, 1))
+
+    def test_entries_expire(self):
+        cache = engine.LRUCache(max_size=10, ttl_seconds=0.05)
+        cache.store("naan", 1)
+        self.assertEqual(cache.lookup("naan"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.lookup("naan"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_keyed_by_model_and_normalized_term(self):
+        cache = engine.EmbeddingCache(max_size=10, ttl_seconds=60)
+        cache.put("model-a", "  Butter   Naan ", np.ones(4))
+        cached = cache.get("model-a", "butter naan")
+        self.assertEqual(cached.dtype, np.float32)
+        self.assertFalse(cached.flags.writeable)  # shared between requests
+        self.assertIsNone(cache.get("model-b", "butter naan"))
+
+    def test_embed_query_encodes_each_term_once(self):
+        encode = mock.Mock(side_effect=lambda texts: np.ones((len(texts), 4)))
+        with mock.patch.object(engine, "_query_embedding_cache", engine.EmbeddingCache(10, 60)), \
+                mock.patch.object(engine, "EMBED_BATCHING", False), \
+                mock.patch.object(engine, "_encode_batch", encode):
+            first = engine.embed_query("Dessert")
+            second = engine.embed_query("dessert ")
+        np.testing.assert_array_equal(first, second)
+        encode.assert_called_once_with(["dessert"])
+
+
+# ============================================
+# IVF vs exact search
+# ============================================
+class IVFRecallTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((64, 32)).astype(np.float32)
+        assignment = rng.integers(0, len(centers), 6000)
+        self.vectors = centers[assignment] + 0.3 * rng.standard_normal((6000, 32)).astype(np.float32)
+        self.queries = self.vectors[rng.choice(len(self.vectors), 50, replace=False)] + 0.1
+        self.exact = ExactSearchBackend(self.vectors)
+        centroids, list_offsets, list_rows = train_ivf(self.vectors, nlist=64)
+        self.ivf = IVFSearchBackend(self.vectors, centroids, list_offsets, list_rows, nprobe=8)
+
+    def test_recall_against_exact(self):
+        top_k = 10
+        hits = 0
+        for q in self.queries:
+            exact_rows, exact_scores = self.exact.search(q, top_k)
+            ivf_rows, ivf_scores = self.ivf.search(q, top_k)
+            hits += len(set(exact_rows.tolist()) & set(ivf_rows.tolist()))
+            # Whatever IVF returns is scored exactly
+            np.testing.assert_allclose(ivf_scores[0], exact_scores[0], rtol=1e-4)
+        self.assertGreaterEqual(hits / (top_k * len(self.queries)), 0.95)
+
+    def test_mask_is_respected(self):
+        mask = np.zeros(len(self.vectors), dtype=bool)
+        mask[::97] = True
+        for backend in (self.exact, self.ivf):
+            rows, _ = backend.search(self.queries[0], 5, mask=mask)
+            self.assertEqual(len(rows), 5)
+            self.assertTrue(mask[rows].all())
+
+    def test_search_batch_matches_search(self):
+        normalized = np.asarray(ann_index._normalize_rows(self.vectors), dtype=np.float16)
+        backends = [
+            self.exact,  # unnormalized rows: inverse norms
+            ExactSearchBackend(normalized, normalized=True),  # float16, scored in blocks
+            self.ivf,
+        ]
+        for backend in backends:
+            with self.subTest(backend=backend.name, dtype=str(backend.vectors.dtype)):
+                batch = backend.search_batch(self.queries, 10)
+                self.assertEqual(len(batch), len(self.queries))
+                for q, (rows, scores) in zip(self.queries, batch):
+                    expected_rows, expected_scores = backend.search(q, 10)
+                    np.testing.assert_array_equal(rows, expected_rows)
+                    np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-6)
+
+    def test_training_reads_only_a_sample_of_mapped_rows(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        write_vector_file(root / "menu_embeddings.vec", self.vectors, "test-model", "build-1", dtype=np.float16)
+        _, mapped = open_vector_file(root / "menu_embeddings.vec")
+
+        normalized_rows = []
+        normalize = ann_index._normalize_rows
+
+        def spy(vectors):
+            normalized_rows.append(len(vectors))
+            return normalize(vectors)
+
+        with mock.patch.object(ann_index, "ANN_KMEANS_SAMPLE", 1000), \
+                mock.patch.object(ann_index, "SCORE_BLOCK_ROWS", 512), \
+                mock.patch.object(ann_index, "_normalize_rows", spy):
+            centroids, list_offsets, list_rows = train_ivf(mapped, nlist=64)
+
+        self.assertLessEqual(max(normalized_rows), 1000)
+        # Every row lands in exactly one list: its closest centroid
+        np.testing.assert_array_equal(np.sort(list_rows), np.arange(len(mapped)))
+        expected = np.argmax(np.asarray(mapped, dtype=np.float32) @ centroids.T, axis=1)
+        lists = np.repeat(np.arange(len(centroids)), np.diff(list_offsets))
+        np.testing.assert_array_equal(expected[list_rows], lists)
+
+
+# ============================================
+# Query-embedding micro-batching
+# ============================================
+class EmbeddingBatcherTests(SimpleTestCase):
+    @staticmethod
+    def vector(text):
+        return np.array([len(text), ord(text[0])], dtype=np.float32)
+
+    def batcher(self, encode_fn, **kwargs):
+        kwargs.setdefault("max_wait_ms", 50)
+        return engine.EmbeddingBatcher(encode_fn, **kwargs)
+
+    def test_each_caller_gets_its_own_row(self):
+        calls = []
+
+        def encode(texts):
+            calls.append(list(texts))
+            return np.stack([self.vector(t) for t in texts])
+
+        batcher = self.batcher(encode)
+        texts = ["naan", "dal", "biryani", "naan", "lassi"]
+        futures = [batcher.submit(t) for t in texts]
+        for text, future in zip(texts, futures):
+            np.testing.assert_array_equal(future.result(timeout=5), self.vector(text))
+
+        # One forward pass; the duplicate "naan" is encoded once
+        self.assertEqual(calls, [["naan", "dal", "biryani", "lassi"]])
+        stats = batcher.stats()
+        self.assertEqual((stats["requests"], stats["batches"]), (5, 1))
+        self.assertEqual(stats["batch_size_histogram"], {8: 1})
+
+    def test_batches_are_capped(self):
+        calls = []
+
+        def encode(texts):
+            calls.append(len(texts))
+            return np.stack([self.vector(t) for t in texts])
+
+        batcher = self.batcher(encode, max_batch_size=2)
+        futures = [batcher.submit(f"dish {i}") for i in range(5)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertTrue(all(size <= 2 for size in calls), calls)
+        self.assertEqual(sum(calls), 5)
+
+    def test_error_reaches_every_waiter(self):
+        def encode(texts):
+            raise RuntimeError("model crashed")
+
+        batcher = self.batcher(encode)
+        futures = [batcher.submit(t) for t in ("naan", "dal", "naan")]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "model crashed"):
+                future.result(timeout=5)
+
+        # The worker survives and serves the next batch
+        batcher.encode_fn = lambda texts: np.stack([self.vector(t) for t in texts])
+        np.testing.assert_array_equal(batcher.encode("dal"), self.vector("dal"))
+
+
+# ============================================
+# ONNX embedding backend
+# ============================================
+class OnnxEncoderTests(SimpleTestCase):
+    def test_export_of_another_model_is_rejected(self):
+        model_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, model_dir, ignore_errors=True)
+        (model_dir / ONNX_MODEL_FILENAME).write_bytes(b"")
+        (model_dir / ONNX_CONFIG_FILENAME).write_text(json.dumps({"model": "sentence-transformers/other"}))
+
+        with self.assertRaisesRegex(ValueError, "export of 'sentence-transformers/other'"):
+            OnnxSentenceEncoder(model_dir, quantized=False, model_name="sentence-transformers/all-mpnet-base-v2")
+
+
+# ============================================
+# Lazy initialization / warming up
+# ============================================
+class WarmingUpTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        rows = [
+            {"item_id": i, "name": name, "category": "Mains", "price": 100}
+            for i, name in enumerate(["Butter Naan", "Dal Makhani", "Gulab Jamun"])
+        ]
+        write_restaurant_index(1, np.eye(3, dtype=np.float32), columns_from_rows(rows), {"model": "test-model"}, root=self.root)
+
+        self.start_warm_up = mock.Mock()
+        patches = [
+            mock.patch.object(engine, "_rag_ready", threading.Event()),  # model not loaded
+            mock.patch.object(engine, "start_warm_up", self.start_warm_up),
+            mock.patch.object(engine, "_query_embedding_cache", engine.EmbeddingCache(10, 60)),
+            mock.patch.object(engine, "_encode_batch", mock.Mock(side_effect=AssertionError("model loaded"))),
+            mock.patch.object(
+                engine, "_index_manager",
+                IndexManager(lambda rid, gen: (load_restaurant_index(rid, self.root), 0), budget_mb=0),
+            ),
+            mock.patch.object(engine, "INDEX_LISTENER_ENABLED", False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def parse(self, message):
+        return engine.parse_message(message, restaurant_id=1, wait_for_model=False)
+
+    def test_turns_without_the_model_still_answer(self):
+        self.assertEqual(self.parse("show my cart").intent, "SHOW_CART")
+        result = self.parse("add 2 butter naan")
+        self.assertEqual((result.intent, result.item_id, result.quantity), ("ADD_ITEM", 0, 2))
+        self.assertEqual(self.parse("what can you do here").intent, "HELP")
+        self.start_warm_up.assert_not_called()
+
+    def test_turn_needing_the_model_raises_instead_of_loading(self):
+        with self.assertRaises(engine.RagWarmingUp):
+            self.parse("add 2 butter chicken")
+        self.start_warm_up.assert_called_once()
+
+
+class WarmingUpViewTests(TestCase):
+    def test_chat_returns_503_with_retry_after(self):
+        restaurant = Restaurant.objects.create(name="Test Kitchen", phone="1")
+        body = {"restaurant_id": restaurant.id, "session_id": "sess_1", "message": "add butter chicken"}
+        with mock.patch("chatbot.views.start_warm_up"), \
+                mock.patch("chatbot.views.parse_message", side_effect=engine.RagWarmingUp):
+            for url in ("/api/chatbot/simple/", "/api/chatbot/simple/stream/"):
+                response = self.client.post(url, body, content_type="application/json")
+                self.assertEqual(response.status_code, 503, url)
+                self.assertEqual(response["Retry-After"], "5")
+                self.assertEqual(response.json()["order"]["items"], [])
+
+
+# ============================================
+# Rule-based fast path
+# ============================================
+class FastParseIntentTests(SimpleTestCase):
+    def assertFast(self, message, intent, item_name=None, quantity=1):
+        result = fast_parse_intent(message)
+        self.assertIsNotNone(result, message)
+        self.assertEqual(result["intent"], intent, message)
+        self.assertEqual(result["item_name"], item_name, message)
+        self.assertEqual(result["quantity"], quantity, message)
+        self.assertGreaterEqual(result["confidence"], FAST_PATH_MIN_CONFIDENCE, message)
+
+    def assertDefersToLLM(self, message):
+        result = fast_parse_intent(message)
+        if result is not None:
+            self.assertLess(result["confidence"], FAST_PATH_MIN_CONFIDENCE, message)
+
+    def test_keywords(self):
+        self.assertFast("Menu", "SHOW_MENU")
+        self.assertFast("show my cart", "SHOW_CART")
+        self.assertFast("clear my cart", "CLEAR_CART")
+        self.assertFast("place order!", "CONFIRM_ORDER")
+
+    def test_add_and_remove(self):
+        self.assertFast("add 2 butter naan", "ADD_ITEM", "butter naan", 2)
+        self.assertFast("please add three masala dosa to my cart", "ADD_ITEM", "masala dosa", 3)
+        self.assertFast("3 x garlic naan", "ADD_ITEM", "garlic naan", 3)
+        self.assertFast("remove one paneer tikka", "REMOVE_ITEM", "paneer tikka", 1)
+        self.assertFast("delete 2 gulab jamun from my order", "REMOVE_ITEM", "gulab jamun", 2)
+
+    def test_cart_wide_removal_clears_cart(self):
+        for message in (
+            "remove everything", "remove all items", "remove all", "delete all",
+            "delete my order", "remove the cart", "remove everything from my cart",
+        ):
+            self.assertFast(message, "CLEAR_CART")
+
+    def test_unclear_messages_defer_to_llm(self):
+        for message in (
+            "add 0 naan", "add half naan", "add naan and dal", "add something spicy",
+            "add everything", "remove all the naan",
+        ):
+            self.assertDefersToLLM(message)
+        self.assertIsNone(fast_parse_intent("what do you have in desserts?"))
+        self.assertIsNone(fast_parse_intent(""))
+
+    def test_missing_dish_or_unreadable_quantity_is_not_parsed(self):
+        # None, so not even the LLM-unavailable fallback acts on them
+        for message in (
+            "add 2", "add two", "remove 3", "add a lot of naan", "add lots of naan",
+            "add a few samosas", "add 2 plates of biryani",
+        ):
+            self.assertIsNone(fast_parse_intent(message), message)
+        self.assertFast("add a couple of naan", "ADD_ITEM", "naan", 2)
+        self.assertFast("add 2 chicken 65", "ADD_ITEM", "chicken 65", 2)
+        self.assertFast("remove all of it", "CLEAR_CART")
+
+
+# ============================================
+# Intent classification cache
+# ============================================
+class IntentCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["chatbot"].clear()
+        self.result = {"intent": "ADD_ITEM", "item_name": "butter naan", "quantity": 2, "confidence": 0.9}
+
+    def test_hit_on_normalized_message(self):
+        cache = engine.IntentCache("v1", max_size=10, ttl_seconds=60)
+        self.assertIsNone(cache.get("add 2 butter naan"))
+        cache.set("Add 2 Butter Naan!", self.result)
+
+        hit = cache.get("add 2 butter naan")
+        self.assertEqual(hit, self.result)
+        hit["quantity"] = 5  # callers get a copy
+        self.assertEqual(cache.get("add 2 butter naan")["quantity"], 2)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_shared_between_workers(self):
+        engine.IntentCache("v1", max_size=10, ttl_seconds=60).set("add 2 butter naan", self.result)
+        other_worker = engine.IntentCache("v1", max_size=10, ttl_seconds=60)
+        self.assertEqual(other_worker.get("add 2 butter naan"), self.result)
+        self.assertEqual(other_worker.stats()["shared_hits"], 1)
+
+    def test_prompt_version_bump_misses(self):
+        engine.IntentCache("v1", max_size=10, ttl_seconds=60).set("add 2 butter naan", self.result)
+        self.assertIsNone(engine.IntentCache("v2", max_size=10, ttl_seconds=60).get("add 2 butter naan"))
+
+    def test_entries_expire(self):
+        # Local layer only (no such cache alias)
+        cache = engine.IntentCache("v1", max_size=10, ttl_seconds=0.05, alias="missing")
+        cache.set("add 2 butter naan", self.result)
+        self.assertIsNotNone(cache.get("add 2 butter naan"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("add 2 butter naan"))
+
+    def test_cached_classification_skips_the_llm(self):
+        cache = engine.IntentCache("v1", max_size=10, ttl_seconds=60)
+        cache.set("add 2 butter naan", self.result)
+        get_gateway = mock.Mock(side_effect=AssertionError("LLM called"))
+        with mock.patch.object(engine, "_intent_cache", cache), \
+                mock.patch.object(engine, "get_llm_gateway", get_gateway):
+            self.assertEqual(engine.classify_intent_with_llm("add 2 butter naan"), self.result)
+
+
+# ============================================
+# Semantic response cache
+# ============================================
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = engine.ResponseCache(threshold=0.9, max_per_restaurant=2, ttl_seconds=60)
+        self.question = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+        self.paraphrase = np.array([0.95, 0.2, 0.0], dtype=np.float32)  # cosine ~0.98
+        self.cache.put(1, "build-1", [10, 11], self.question, "Try our gulab jamun!")
+
+    def test_paraphrase_over_same_items_hits(self):
+        self.assertEqual(self.cache.get(1, "build-1", [11, 10], self.paraphrase), "Try our gulab jamun!")
+        self.assertIsNone(self.cache.get(1, "build-1", [10, 11], np.array([0.0, 1.0, 0.0])))
+        self.assertIsNone(self.cache.get(1, "build-1", [10, 12], self.paraphrase))
+        self.assertIsNone(self.cache.get(2, "build-1", [10, 11], self.paraphrase))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 3))
+
+    def test_menu_change_misses(self):
+        # A rebuilt index has a new build id
+        self.assertIsNone(self.cache.get(1, "build-2", [10, 11], self.paraphrase))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+        self.cache.put(1, "build-2", [10, 11], self.question, "reply")
+        self.cache.put(2, "build-9", [10, 11], self.question, "other restaurant")
+        with mock.patch.object(engine, "_response_cache", self.cache), \
+                mock.patch.object(engine, "_index_manager", mock.Mock()):
+            engine.reload_rag_system(1)
+        self.assertIsNone(self.cache.get(1, "build-2", [10, 11], self.question))
+        self.assertEqual(self.cache.get(2, "build-9", [10, 11], self.question), "other restaurant")
+
+    def test_entries_expire_and_are_bounded(self):
+        cache = engine.ResponseCache(threshold=0.9, max_per_restaurant=2, ttl_seconds=0.05)
+        cache.put(1, "build-1", [10], self.question, "reply")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(1, "build-1", [10], self.question))
+
+        for i in range(3):
+            self.cache.put(1, "build-1", [i], self.question, f"reply {i}")
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertIsNone(self.cache.get(1, "build-1", [10, 11], self.question))  # oldest evicted
+        self.assertEqual(self.cache.get(1, "build-1", [2], self.question), "reply 2")
+
+
+# ============================================
+# Local intent classifier
+# ============================================
+def _bag_of_words(texts, dim=256):
+    """Deterministic stand-in for the embedding model: hashed word counts."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in engine._normalize_message(text).split():
+            vectors[row, zlib.crc32(word.encode()) % dim] += 1.0
+    return vectors
+
+
+class LocalIntentClassifierTests(SimpleTestCase):
+    def setUp(self):
+        self.classifier = train_intent_classifier(_bag_of_words)
+        self.llm = mock.Mock(return_value={"intent": "SHOW_CART", "confidence": 0.9})
+        ready = threading.Event()
+        ready.set()
+        patches = [
+            mock.patch.object(engine, "_rag_ready", ready),
+            mock.patch.object(engine, "_intent_classifier", self.classifier),
+            mock.patch.object(engine, "embed_query", lambda text, wait_for_model=True: _bag_of_words([text])[0]),
+            mock.patch.object(engine, "classify_intent_with_llm", self.llm),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_rank_intents_margin(self):
+        intent, probability, margin = rank_intents(self.classifier, _bag_of_words(["how much is my bill so far"])[0])
+        self.assertEqual(intent, "SHOW_CART")
+        self.assertGreaterEqual(margin, engine.LOCAL_INTENT_MIN_MARGIN)
+        self.assertLessEqual(margin, probability)
+
+    def test_confident_local_intent_skips_the_llm(self):
+        result = engine.parse_message("how much is my bill so far")
+        self.assertEqual(result.intent, "SHOW_CART")
+        self.llm.assert_not_called()
+
+    def test_small_margin_goes_to_the_llm(self):
+        # "empty" (CLEAR_CART) vs "my cart" (SHOW_CART): too close to trust
+        _, _, margin = rank_intents(self.classifier, _bag_of_words(["empty my cart please"])[0])
+        self.assertLess(margin, engine.LOCAL_INTENT_MIN_MARGIN)
+        self.llm.return_value = {"intent": "CLEAR_CART", "confidence": 0.9}
+        self.assertEqual(engine.parse_message("empty my cart please").intent, "CLEAR_CART")
+        self.llm.assert_called_once_with("empty my cart please")
+
+
+# ============================================
+# Hybrid search: near names don't auto-add
+# ============================================
+class NearNameMatchTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        names = ["Paneer Tikka Masala", "Chicken 555", "Butter Naan"]
+        rows = [{"item_id": i, "name": name, "category": "Mains", "price": 200} for i, name in enumerate(names)]
+        write_restaurant_index(1, np.eye(3, 8, dtype=np.float32), columns_from_rows(rows), {"model": "test-model"}, root=self.root)
+
+        self.query = np.zeros(8, dtype=np.float32)
+        patches = [
+            mock.patch.object(
+                engine, "_index_manager",
+                IndexManager(lambda rid, gen: (load_restaurant_index(rid, self.root), 0), budget_mb=0),
+            ),
+            mock.patch.object(engine, "INDEX_LISTENER_ENABLED", False),
+            mock.patch.object(engine, "HYBRID_SEARCH", True),
+            mock.patch.object(engine, "embed_query", lambda text, wait_for_model=True: self.query),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def model_agrees(self, row, cosine):
+        """The query embedding scores `cosine` against `row` (and 0 elsewhere)."""
+        self.query = np.zeros(8, dtype=np.float32)
+        self.query[row] = cosine
+        self.query[7] = np.sqrt(1 - cosine ** 2)
+
+    def test_similar_name_asks_instead_of_adding(self):
+        for message, row in (("add paneer tikka", 0), ("add chicken 65", 1)):
+            with self.subTest(message=message):
+                self.model_agrees(row, 0.5)
+                result = engine.parse_message(message, restaurant_id=1)
+                self.assertEqual(result.intent, "HELP")
+                self.assertIn("Did you mean", result.reply)
+                self.assertIsNone(result.item_id)
+
+    def test_model_match_or_exact_name_adds(self):
+        self.model_agrees(0, 0.8)
+        result = engine.parse_message("add paneer tikka", restaurant_id=1)
+        self.assertEqual((result.intent, result.item_id), ("ADD_ITEM", 0))
+
+        self.model_agrees(2, 0.0)  # decisive lexical hit: the model isn't consulted
+        result = engine.parse_message("add chicken 555", restaurant_id=1)
+        self.assertEqual((result.intent, result.item_id), ("ADD_ITEM", 1))
+
+
+# ============================================
+# Index generations / listener
+# ============================================
+class IndexGenerationTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.store = FileGenerationStore(self.root)
+
+    def test_concurrent_bumps_never_repeat_a_generation(self):
+        self.assertEqual(self.store.get(1), 0)
+        generations = []
+        threads = [threading.Thread(target=lambda: generations.append(self.store.bump(1))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(generations), list(range(1, 9)))
+        self.assertEqual((self.store.get(1), self.store.get(2)), (8, 0))
+
+    def test_listener_sees_a_bump(self):
+        updates, seen, stop = [], threading.Event(), threading.Event()
+
+        def on_update(restaurant_id, generation):
+            updates.append((restaurant_id, generation))
+            seen.set()
+
+        thread = threading.Thread(target=self.store.listen, args=(on_update, lambda: None, stop), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(stop.set)
+        time.sleep(0.5)  # let the watcher start
+        self.store.bump(3)
+        self.assertTrue(seen.wait(10))
+        self.assertIn((3, 1), updates)
+
+    def test_update_swaps_only_newer_resident_indexes(self):
+        loads = []
+
+        def load(restaurant_id, generation):
+            loads.append((restaurant_id, generation))
+            return None, generation if generation is not None else 1
+
+        manager = IndexManager(load, budget_mb=0)
+        with mock.patch.object(engine, "_index_manager", manager), \
+                mock.patch.object(engine, "_response_cache", mock.Mock()):
+            engine._on_index_update(1, 5)  # not resident: read fresh on first use
+            self.assertEqual(loads, [])
+
+            manager.get(1)
+            engine._on_index_update(1, 1)  # already current
+            engine._on_index_update(1, 2)
+            self.assertEqual(loads, [(1, None), (1, 2)])
+            self.assertEqual(manager.generation(1), 2)
+
+
+# ============================================
+# Versioned index builds: publish, rollback, gc
+# ============================================
+class MenuIndexBuildTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.rng = np.random.default_rng(0)
+
+    def publish(self, count: int, restaurant_id: int = 1) -> str:
+        embeddings = self.rng.standard_normal((count, 8)).astype(np.float32)
+        build_path = write_restaurant_index(
+            restaurant_id, embeddings, columns_from_rows(_menu_rows(count)), {"model": "test-model"}, root=self.root
+        )
+        return build_path.name
+
+    def test_publish_makes_build_current(self):
+        first = self.publish(3)
+        self.assertEqual(read_current_build(1, self.root), first)
+        self.assertEqual(len(load_restaurant_index(1, self.root)), 3)
+
+        second = self.publish(5)
+        self.assertGreater(second, first)
+        self.assertEqual(read_current_build(1, self.root), second)
+        index = load_restaurant_index(1, self.root)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.build_id, second)
+        # Other restaurants are untouched
+        self.assertIsNone(load_restaurant_index(2, self.root))
+
+    def test_rollback_to_previous_build(self):
+        first = self.publish(3)
+        self.publish(5)
+        activate_build(1, first, self.root)
+        self.assertEqual(read_current_build(1, self.root), first)
+        self.assertEqual(len(load_restaurant_index(1, self.root)), 3)
+        with self.assertRaises(FileNotFoundError):
+            activate_build(1, "no-such-build", self.root)
+
+    def test_builds_sort_in_publish_order(self):
+        build_ids = [self.publish(2) for _ in range(3)]
+        self.assertEqual(list_builds(1, self.root), build_ids)
+
+    def test_gc_keeps_current_and_newest(self):
+        build_ids = [self.publish(2) for _ in range(5)]
+        # commit() collects with the default keep=3
+        self.assertEqual(list_builds(1, self.root), build_ids[-3:])
+
+        activate_build(1, build_ids[-3], self.root)
+        removed = gc_builds(1, keep=1, root=self.root)
+        self.assertEqual(removed, [build_ids[-2]])
+        self.assertEqual(list_builds(1, self.root), [build_ids[-3], build_ids[-1]])
+        self.assertEqual(len(load_restaurant_index(1, self.root)), 2)
+
+    def test_other_model_counts_as_missing(self):
+        self.publish(3)
+        self.assertIsNotNone(load_restaurant_index(1, self.root, model_id="test-model"))
+        self.assertIsNone(load_restaurant_index(1, self.root, model_id="other-model"))
+
+
+# ============================================
+# Resident indexes: LRU under a memory budget
+# ============================================
+class _SizedIndex:
+    def __init__(self, nbytes, mapped_nbytes=0):
+        self.nbytes = nbytes
+        self.mapped_nbytes = mapped_nbytes
+
+    def memory_bytes(self):
+        return self.nbytes
+
+    def mapped_bytes(self):
+        return self.mapped_nbytes
+
+
+class IndexManagerTests(SimpleTestCase):
+    MB = 1024 * 1024
+
+    def test_least_recently_used_is_evicted_over_budget(self):
+        loads = []
+
+        def load(restaurant_id, generation):
+            loads.append(restaurant_id)
+            # Mapped vectors don't count against the budget
+            return _SizedIndex(self.MB, mapped_nbytes=100 * self.MB), 0
+
+        manager = IndexManager(load, budget_mb=2.5)
+        manager.get(1)
+        manager.get(2)
+        manager.get(1)  # 2 is now the least recently used
+        manager.get(3)
+        self.assertEqual(loads, [1, 2, 3])
+        self.assertEqual(manager.generations(), {1: 0, 3: 0})
+
+        stats = manager.stats()
+        self.assertEqual((stats["resident"], stats["evictions"]), (2, 1))
+        self.assertEqual((stats["memory_mb"], stats["mapped_mb"]), (2, 200))
+
+        manager.get(2)  # evicted tenants load again
+        self.assertEqual(loads, [1, 2, 3, 2])
+        self.assertEqual(manager.generations(), {3: 0, 2: 0})
+
+    def test_concurrent_first_chats_share_one_load(self):
+        loads, release = [], threading.Event()
+
+        def load(restaurant_id, generation):
+            loads.append(restaurant_id)
+            release.wait(5)
+            return _SizedIndex(0), 0
+
+        manager = IndexManager(load, budget_mb=0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(manager.get(1))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while manager.stats()["loading"] == 0:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(loads, [1])
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(index is results[0] for index in results))
+
+    def test_mapped_vectors_are_not_private_memory(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        embeddings = np.ones((100, 16), dtype=np.float32)
+        write_restaurant_index(1, embeddings, columns_from_rows(_menu_rows(100)), {"model": "test-model"}, root=root)
+
+        index = load_restaurant_index(1, root)
+        self.assertEqual(index.mapped_bytes(), index.embeddings.nbytes)
+        private = index.memory_bytes()
+        self.assertGreater(private, 0)
+        # The same vectors held in process memory do count
+        index.embeddings = np.array(index.embeddings)
+        self.assertEqual(index.memory_bytes(), private + index.embeddings.nbytes)
+
+
+# ============================================
+# Search filters
+# ============================================
+class SearchFiltersTests(SimpleTestCase):
+    def test_parse(self):
+        cases = {
+            "veg starters under 200": (SearchFilters(vegetarian=True, max_price=200), "starters"),
+            "vegan desserts": (SearchFilters(vegan=True), "desserts"),
+            "non veg mains between 300 and 150 rupees": (
+                SearchFilters(vegetarian=False, min_price=150, max_price=300), "mains"
+            ),
+            "anything under ₹150": (SearchFilters(max_price=150), "anything"),
+            "paneer above rs 100": (SearchFilters(min_price=100), "paneer"),
+            "vegetarian": (SearchFilters(vegetarian=True), ""),
+            "vegetable biryani": (SearchFilters(), "vegetable biryani"),
+        }
+        for text, expected in cases.items():
+            self.assertEqual(parse_search_filters(text), expected, text)
+
+    def test_from_llm_ignores_malformed_fields(self):
+        filters = SearchFilters.from_llm(
+            {"vegetarian": "yes", "vegan": True, "max_price": "250", "min_price": -5, "category": " Desserts "}
+        )
+        self.assertEqual(filters, SearchFilters(vegan=True, max_price=250, category="desserts"))
+        self.assertFalse(SearchFilters.from_llm(None))
+        self.assertFalse(SearchFilters.from_llm("vegan"))
+
+    def test_merged_prefers_own_values(self):
+        llm = SearchFilters(vegetarian=True, max_price=300)
+        local = SearchFilters(vegetarian=False, max_price=200, min_price=100)
+        self.assertEqual(
+            llm.merged(local), SearchFilters(vegetarian=True, min_price=100, max_price=300)
+        )
+
+    def test_describe(self):
+        self.assertEqual(
+            SearchFilters(vegetarian=True, max_price=200).describe("starters"), "vegetarian starters under ₹200"
+        )
+        self.assertEqual(SearchFilters(vegan=True).describe("dishes"), "vegan dishes")
+
+
+
+class FilterOnlyListingTests(SimpleTestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        rows = [
+            {"item_id": i, "name": f"Dish {i}", "category": "Mains", "price": 100 + (i * 7) % 60}
+            for i in range(60)
+        ]
+        write_restaurant_index(1, np.eye(60, dtype=np.float32), columns_from_rows(rows), {"model": "test-model"}, root=self.root)
+
+        llm_result = {"intent": "SEARCH_ITEM", "item_name": None, "quantity": 1, "confidence": 0.9}
+        patches = [
+            mock.patch.object(
+                engine, "_index_manager",
+                IndexManager(lambda rid, gen: (load_restaurant_index(rid, self.root), 0), budget_mb=0),
+            ),
+            mock.patch.object(engine, "INDEX_LISTENER_ENABLED", False),
+            mock.patch.object(engine, "_rag_ready", threading.Event()),
+            mock.patch.object(engine, "classify_intent_with_llm", mock.Mock(return_value=llm_result)),
+            mock.patch.object(engine, "embed_query", mock.Mock(side_effect=AssertionError("scored"))),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_lists_at_most_the_cap_cheapest_first(self):
+        result = engine.parse_message("anything under 200", restaurant_id=1)
+        self.assertEqual(result.intent, "SEARCH_ITEM")
+        prices = [float(s["price"]) for s in result.suggestions]
+        self.assertEqual(len(prices), engine.FILTER_LIST_LIMIT)
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(prices[-1], 100 + engine.FILTER_LIST_LIMIT - 1)
+        self.assertIn("Type 'menu' for more", result.reply)
+
+    def test_short_list_has_no_hint(self):
+        result = engine.parse_message("anything under 109", restaurant_id=1)
+        self.assertEqual(len(result.suggestions), 10)
+        self.assertNotIn("Type 'menu' for more", result.reply)
+
+
+# ============================================
+# LLM gateway against a local stub server
+# ============================================
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /v1/chat/completions with the next scripted action:
+    ("ok", content), ("status", code) or ("sleep", seconds).
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            action, value = server.actions.pop(0) if server.actions else ("ok", "hello")
+
+        if action == "sleep":
+            time.sleep(value)
+            return  # the client has given up by now
+        if action == "status":
+            self.send_response(value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = json.dumps({"choices": [{"message": {"content": value}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LLMGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+        self.server.lock = threading.Lock()
+        self.server.actions = []
+        self.server.requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def gateway(self, **kwargs) -> LLMGateway:
+        breaker = kwargs.pop("breaker", None) or CircuitBreaker(window=10, min_calls=2, error_rate=0.5, cooldown=60)
+        gateway = LLMGateway(api_key="test", base_url=self.base_url, breaker=breaker, **kwargs)
+        self.addCleanup(gateway.close)
+        return gateway
+
+    def chat(self, gateway, **kwargs) -> str:
+        return gateway.chat([{"role": "user", "content": "hi"}], model="stub", **kwargs)
+
+    def test_success(self):
+        self.server.actions = [("ok", "paneer tikka")]
+        self.assertEqual(self.chat(self.gateway()), "paneer tikka")
+
+    def test_deadline_cuts_off_slow_upstream(self):
+        self.server.actions = [("sleep", 2)]
+        gateway = self.gateway(deadline=0.3, max_retries=0)
+        started = time.monotonic()
+        with self.assertRaises(LLMError):
+            self.chat(gateway)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_retries_retryable_status(self):
+        self.server.actions = [("status", 503), ("status", 429), ("ok", "done")]
+        gateway = self.gateway(max_retries=2, breaker=CircuitBreaker(min_calls=10))
+        self.assertEqual(self.chat(gateway), "done")
+        self.assertEqual(gateway.retries, 2)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_client_error_is_not_retried(self):
+        self.server.actions = [("status", 400)]
+        gateway = self.gateway(max_retries=2)
+        with self.assertRaises(LLMError):
+            self.chat(gateway)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(gateway.breaker.state, "closed")
+
+    def test_breaker_opens_and_fails_fast(self):
+        self.server.actions = [("status", 503), ("status", 503)]
+        gateway = self.gateway(max_retries=0)
+        for _ in range(2):
+            with self.assertRaises(LLMError):
+                self.chat(gateway)
+        self.assertEqual(gateway.breaker.state, "open")
+
+        with self.assertRaises(LLMUnavailable):
+            self.chat(gateway)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_no_retries_once_breaker_opens_mid_call(self):
+        self.server.actions = [("status", 503)] * 5
+        gateway = self.gateway(max_retries=4)
+        with self.assertRaises(LLMUnavailable):
+            self.chat(gateway)
+        # Second failure opens the breaker; the remaining retries are skipped
+        self.assertEqual(self.server.requests, 2)
+
+    def test_half_open_probe_recovers(self):
+        breaker = CircuitBreaker(window=10, min_calls=2, error_rate=0.5, cooldown=0.2)
+        self.server.actions = [("status", 503), ("status", 503), ("ok", "back")]
+        gateway = self.gateway(max_retries=0, breaker=breaker)
+        for _ in range(2):
+            with self.assertRaises(LLMError):
+                self.chat(gateway)
+        self.assertEqual(breaker.state, "open")
+
+        time.sleep(0.3)
+        self.assertEqual(self.chat(gateway), "back")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(window=10, min_calls=2, error_rate=0.5, cooldown=0.2)
+        self.server.actions = [("status", 503)] * 3
+        gateway = self.gateway(max_retries=0, breaker=breaker)
+        for _ in range(2):
+            with self.assertRaises(LLMError):
+                self.chat(gateway)
+
+        time.sleep(0.3)
+        with self.assertRaises(LLMError):
+            self.chat(gateway)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.times_opened, 2)
+
+    def test_probe_released_when_deadline_expires(self):
+        breaker = CircuitBreaker(window=10, min_calls=2, error_rate=0.5, cooldown=0.2)
+        self.server.actions = [("status", 503), ("status", 503), ("ok", "back")]
+        gateway = self.gateway(max_retries=0, breaker=breaker)
+        for _ in range(2):
+            with self.assertRaises(LLMError):
+                self.chat(gateway)
+
+        time.sleep(0.3)
+        # The probe never reaches the upstream (no time left) ...
+        with self.assertRaises(LLMUnavailable):
+            self.chat(gateway, deadline=0)
+        self.assertEqual(breaker.state, "half_open")
+        # ... and must not keep the breaker stuck in half_open
+        self.assertEqual(self.chat(gateway), "back")
+        self.assertEqual(breaker.state, "closed")
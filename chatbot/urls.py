@@ -1,10 +1,12 @@
 # chatbot/urls.py
 from django.urls import path
-from .views import SimpleChatbotView,ChatbotWidgetDemoView,PopularItemsView,CategoryListView
+from .views import SimpleChatbotView,SimpleChatbotStreamView,ChatbotWidgetDemoView,PopularItemsView,CategoryListView,ChatbotReadyView
 
 urlpatterns = [
     path("simple/", SimpleChatbotView.as_view(), name="chatbot-simple"),
+    path("simple/stream/", SimpleChatbotStreamView.as_view(), name="chatbot-simple-stream"),
     path("widget-demo/", ChatbotWidgetDemoView.as_view(), name="chatbot-demo-ui"),
     path("popular-items/", PopularItemsView.as_view(), name="chatbot_popular_items"),
     path("categories/", CategoryListView.as_view(), name="chatbot_categories"),
+    path("ready/", ChatbotReadyView.as_view(), name="chatbot_ready"),
 ]
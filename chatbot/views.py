@@ -1,7 +1,10 @@
 # chatbot/views.py
+import json
 import uuid
 import requests
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
@@ -14,8 +17,8 @@ from menu.models import MenuItem  # 👈 add this
 
 from restaurants.models import Restaurant
 from .serializers import ChatRequestSerializer
-from .engine import parse_message
-from .services import apply_intent
+from .engine import RagWarmingUp, is_rag_ready, parse_message, start_warm_up
+from .services import apply_intent, get_or_create_open_order
 from orders.models import Order   # ✅ add this
 
 
@@ -23,6 +26,9 @@ from django.utils import timezone
 from datetime import timedelta
 
 
+# Seconds the widget is told to wait while this worker's model is loading
+CHAT_WARMING_UP_RETRY_AFTER = 5
+
 
 class ChatbotWidgetDemoView(TemplateView):
     template_name = "chatbot_widget_demo.html"
@@ -34,6 +40,11 @@ class SimpleChatbotView(APIView):
     authentication_classes = []
 
     def post(self, request, *args, **kwargs):
+        # Load the embedding model in the background (no-op once ready) so it
+        # overlaps with the intent-classification call below. The request
+        # never waits for it: a turn that needs it gets a 503 until it's in.
+        start_warm_up()
+
         serializer = ChatRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -46,89 +57,24 @@ class SimpleChatbotView(APIView):
             session_id = f"sess_{uuid.uuid4().hex[:16]}"
 
         # 1️⃣ Parse message → intent
-        result = parse_message(message)
+        try:
+            result = parse_message(message, restaurant_id=restaurant.id, wait_for_model=False)
+        except RagWarmingUp:
+            return warming_up_response(restaurant, session_id)
 
         # 2️⃣ Handle CONFIRM_ORDER intent separately (payment trigger)
         if result.intent == "CONFIRM_ORDER":
-            order = Order.objects.filter(
-                restaurant=restaurant,
-                session_id=session_id,
-                status=Order.OrderStatus.PENDING,
-            ).first()
-
-            if not order:
-                return Response(
-                    {"reply": "No open order found to confirm.", "session_id": session_id},
-                    status=status.HTTP_200_OK,
-                )
-
-            payments_api = request.build_absolute_uri("/api/payments/create/")
-            try:
-                r = requests.post(payments_api, json={"order_id": order.id})
-                if r.status_code != 200:
-                    # Razorpay create failed → reply politely instead of KeyError
-                    msg = r.json().get("detail", "Unable to create payment.")
-                    return Response(
-                        {
-                            "reply": f"⚠️ Cannot process payment — there should be atleast one order.",
-                            "session_id": session_id,
-                        },
-                        status=status.HTTP_200_OK,
-                    )
-
-                data = r.json()
-
-                return Response(
-                    {
-                        "reply": "Please complete your payment to confirm the order.",
-                        "session_id": session_id,
-                        "payment": {
-                            "key": data["key"],
-                            "order_id": data["razorpay_order_id"],
-                            "amount": data["amount"],
-                            "currency": data["currency"],
-                        },
-                    },
-                    status=status.HTTP_200_OK,
-                )
-            except Exception as e:
-                print("Payment creation error:", e)
-                return Response(
-                    {"reply": "Something went wrong creating the payment."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
-
+            payload, status_code = confirm_order_payload(request, restaurant, session_id)
+            return Response(payload, status=status_code)
 
         # 3️⃣ For all other intents → process normally
-                # 3️⃣ For all other intents → process normally
         reply_text, order, extra = apply_intent(restaurant, session_id, result)
 
-        # 4️⃣ Prepare order snapshot
-        items_data = [
-            {
-                "id": item.menu_item.id,
-                "name": item.name,
-                "quantity": item.quantity,
-                "unit_price": str(item.unit_price),
-                "total_price": str(item.total_price),
-            }
-            for item in order.items.select_related("menu_item").all()
-        ]
-
-        order_data = {
-            "id": order.id,
-            "status": order.status,
-            "subtotal": str(order.subtotal),
-            "tax": str(order.tax),
-            "total": str(order.total),
-            "items": items_data,
-        }
-
-        # 5️⃣ Return chat response (+ any extra UI payload like menu_items)
+        # 4️⃣ Return chat response (+ any extra UI payload like menu_items)
         payload = {
             "reply": reply_text,
             "session_id": session_id,
-            "order": order_data,
+            "order": build_order_data(order),
         }
         if extra:
             payload.update(extra)
@@ -136,6 +82,194 @@ class SimpleChatbotView(APIView):
         return Response(payload, status=status.HTTP_200_OK)
 
 
+def warming_up_response(restaurant, session_id):
+    """
+    503 + Retry-After for a message that needs the embedding model while
+    this worker is still loading it (nothing was applied to the cart).
+    """
+    response = Response(
+        {
+            "reply": "I'm still getting ready. Please send that again in a few seconds.",
+            "session_id": session_id,
+            "order": build_order_data(get_or_create_open_order(restaurant, session_id)),
+            "ready": False,
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = str(CHAT_WARMING_UP_RETRY_AFTER)
+    return response
+
+
+def confirm_order_payload(request, restaurant, session_id):
+    """
+    CONFIRM_ORDER: create the Razorpay payment for the session's open order.
+    Returns (payload, http_status).
+    """
+    order = Order.objects.filter(
+        restaurant=restaurant,
+        session_id=session_id,
+        status=Order.OrderStatus.PENDING,
+    ).first()
+
+    if not order:
+        return (
+            {"reply": "No open order found to confirm.", "session_id": session_id},
+            status.HTTP_200_OK,
+        )
+
+    payments_api = request.build_absolute_uri("/api/payments/create/")
+    try:
+        r = requests.post(payments_api, json={"order_id": order.id})
+        if r.status_code != 200:
+            # Razorpay create failed → reply politely instead of KeyError
+            msg = r.json().get("detail", "Unable to create payment.")
+            return (
+                {
+                    "reply": f"⚠️ Cannot process payment — there should be atleast one order.",
+                    "session_id": session_id,
+                },
+                status.HTTP_200_OK,
+            )
+
+        data = r.json()
+
+        return (
+            {
+                "reply": "Please complete your payment to confirm the order.",
+                "session_id": session_id,
+                "payment": {
+                    "key": data["key"],
+                    "order_id": data["razorpay_order_id"],
+                    "amount": data["amount"],
+                    "currency": data["currency"],
+                },
+            },
+            status.HTTP_200_OK,
+        )
+    except Exception as e:
+        print("Payment creation error:", e)
+        return (
+            {"reply": "Something went wrong creating the payment."},
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
+def build_order_data(order):
+    """Order snapshot sent back to the widget after every message."""
+    items_data = [
+        {
+            "id": item.menu_item.id,
+            "name": item.name,
+            "quantity": item.quantity,
+            "unit_price": str(item.unit_price),
+            "total_price": str(item.total_price),
+        }
+        for item in order.items.select_related("menu_item").all()
+    ]
+
+    return {
+        "id": order.id,
+        "status": order.status,
+        "subtotal": str(order.subtotal),
+        "tax": str(order.tax),
+        "total": str(order.total),
+        "items": items_data,
+    }
+
+
+def sse_event(event: str, data) -> str:
+    """One server-sent event frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class SimpleChatbotStreamView(APIView):
+    """
+    Streaming variant of SimpleChatbotView (server-sent events).
+
+    POST /api/chatbot/simple/stream/   (same body as /simple/)
+
+    Events:
+        token  {"text": "..."}  reply chunks as the LLM produces them
+        done   same payload as /simple/ (reply, session_id, order, menu_items, payment)
+
+    Cart actions run before the stream starts; only the LLM-written reply
+    is streamed, every other intent sends a single `done` event. While the
+    embedding model is loading it answers like /simple/ (503 JSON).
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        start_warm_up()
+
+        serializer = ChatRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        restaurant_id = serializer.validated_data["restaurant_id"]
+        session_id = serializer.validated_data.get("session_id") or ""
+        message = serializer.validated_data["message"]
+
+        restaurant = get_object_or_404(Restaurant, id=restaurant_id)
+        if not session_id:
+            session_id = f"sess_{uuid.uuid4().hex[:16]}"
+
+        try:
+            result = parse_message(
+                message, restaurant_id=restaurant.id, stream=True, wait_for_model=False
+            )
+        except RagWarmingUp:
+            return warming_up_response(restaurant, session_id)
+
+        if result.intent == "CONFIRM_ORDER":
+            payload, _ = confirm_order_payload(request, restaurant, session_id)
+            reply_stream = None
+        else:
+            reply_text, order, extra = apply_intent(restaurant, session_id, result)
+            payload = {
+                "reply": reply_text,
+                "session_id": session_id,
+                "order": build_order_data(order),
+            }
+            if extra:
+                payload.update(extra)
+            reply_stream = result.reply_stream
+
+        def events():
+            if reply_stream is not None:
+                parts = []
+                for chunk in reply_stream:
+                    parts.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+                payload["reply"] = "".join(parts).strip()
+            yield sse_event("done", payload)
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+        return response
+
+
+class ChatbotReadyView(APIView):
+    """
+    Readiness probe for the chatbot engine in this worker.
+
+    GET /api/chatbot/ready/
+
+    Returns 200 {"ready": true} once the embedding model is loaded,
+    otherwise starts the background warm-up and returns 503 {"ready": false}.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):
+        if is_rag_ready():
+            return Response({"ready": True}, status=status.HTTP_200_OK)
+
+        start_warm_up()
+        return Response({"ready": False}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 class PopularItemsView(APIView):
     """
     Returns a list of most-ordered menu items for a restaurant.
@@ -1,7 +1,7 @@
 # menu/admin.py
 from django.contrib import admin
 from .models import MenuItem
-from .tasks import regenerate_menu_embeddings  # 👈 NEW
+from .tasks import schedule_menu_regen
 
 
 @admin.register(MenuItem)
@@ -16,10 +16,10 @@ class MenuItemAdmin(admin.ModelAdmin):
     def _trigger_embeddings(self, restaurant_id):
         """
         Schedule a background task to regenerate embeddings
-        for the given restaurant.
+        for the given restaurant (coalesced with other recent edits).
         """
         if restaurant_id:
-            regenerate_menu_embeddings.delay(restaurant_id)
+            schedule_menu_regen(restaurant_id)
 
     # ---------- queryset scoping ----------
     def get_queryset(self, request):
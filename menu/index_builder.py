@@ -0,0 +1,330 @@
+# menu/index_builder.py
+"""
+Build the per-restaurant menu indexes from the DB.
+
+build_menu_index() is the one entry point: the regen Celery task calls it
+directly and the generate_embeddings command delegates to it.
+
+The embedding model is loaded once per process and kept resident
+(get_build_model), so a rebuild in a long-lived Celery worker pays for
+encoding only, not for loading the model. Encoding runs in batches of
+MENU_INDEX_BATCH_SIZE.
+
+Builds are incremental: every row stores a content hash of the embedded
+text and model id, and only new or changed items are re-encoded; vectors
+of unchanged items are copied from the current build and deleted items
+drop out. full=True re-encodes everything.
+
+Builds are streamed, so memory stays flat however large the menu:
+items are read with .iterator() and handled in chunks of
+MENU_INDEX_CHUNK_SIZE, and each chunk's vectors are appended to the new
+build on disk as soon as they are ready. With workers > 1 (a full
+multi-restaurant rebuild, e.g. `generate_embeddings --workers 4`) chunks
+are encoded in a pool of CPU processes, each loading its own model copy;
+the default (0) encodes in-process with the resident model. Progress,
+throughput (items/s) and peak RSS are reported.
+"""
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from chatbot.embedders import EMBEDDING_BACKEND, embedding_model_id, load_embedding_model
+from chatbot.index_events import publish_index_update
+from chatbot.menu_index import (
+    MENU_INDEX_DIR,
+    RestaurantIndexBuild,
+    build_chunk_text,
+    columns_from_rows,
+    content_hash,
+    indexed_restaurant_ids,
+    reusable_vectors,
+)
+
+# ============================================
+# Configuration
+# ============================================
+MENU_INDEX_MODEL = os.getenv("MENU_INDEX_MODEL", "sentence-transformers/all-mpnet-base-v2")
+MENU_INDEX_BATCH_SIZE = int(os.getenv("MENU_INDEX_BATCH_SIZE", "64"))
+MENU_INDEX_CHUNK_SIZE = int(os.getenv("MENU_INDEX_CHUNK_SIZE", "1024"))
+MENU_INDEX_BUILD_WORKERS = int(os.getenv("MENU_INDEX_BUILD_WORKERS", "0"))
+
+MENU_ITEM_FIELDS = (
+    "id", "name", "category", "price", "is_vegetarian", "is_vegan", "available", "ingredients",
+)
+
+_build_models: Dict[str, object] = {}
+_build_model_lock = threading.Lock()
+
+
+def get_build_model(model_name: str = MENU_INDEX_MODEL):
+    """
+    The process-wide embedding model for index builds, loaded on first use.
+    Returns (model, seconds spent loading it in this call).
+    """
+    key = embedding_model_id(model_name)
+    model = _build_models.get(key)
+    if model is not None:
+        return model, 0.0
+
+    with _build_model_lock:
+        model = _build_models.get(key)
+        if model is not None:
+            return model, 0.0
+        started = time.perf_counter()
+        print(f"[RAG] Loading build model: {model_name} ({EMBEDDING_BACKEND} backend)...")
+        model = load_embedding_model(model_name)
+        _build_models[key] = model
+        return model, time.perf_counter() - started
+
+
+# ============================================
+# Encoder pool (one model per worker process)
+# ============================================
+_pool_model = None
+
+
+def _init_pool_worker(model_name: str, threads: int):
+    global _pool_model
+    # Split the cores between the workers instead of oversubscribing them
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    _pool_model = load_embedding_model(model_name)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def _encode(model, texts: List[str], batch_size: int):
+    started = time.perf_counter()
+    vectors = np.asarray(
+        model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False),
+        dtype=np.float32,
+    )
+    return vectors, time.perf_counter() - started
+
+
+def _pool_encode(texts: List[str], batch_size: int):
+    return _encode(_pool_model, texts, batch_size)
+
+
+class ChunkEncoder:
+    """
+    encode(texts) -> Future of (float32 matrix, seconds spent encoding).
+    With workers > 1 the
+    chunks run in a process pool; otherwise in-process (resident model),
+    returning already-completed futures.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, workers: int = 0):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model_load_seconds = 0.0
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.model = None
+        if workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # spawn: forking a process that already runs torch threads can deadlock
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_pool_worker,
+                initargs=(model_name, threads),
+            )
+        else:
+            self.model, self.model_load_seconds = get_build_model(model_name)
+
+    @property
+    def max_in_flight(self) -> int:
+        return 2 * self.workers if self.pool is not None else 1
+
+    def encode(self, texts: List[str]) -> Future:
+        if self.pool is not None:
+            return self.pool.submit(_pool_encode, texts, self.batch_size)
+        future: Future = Future()
+        future.set_result(_encode(self.model, texts, self.batch_size))
+        return future
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Peak resident set size of this process (or of its finished child
+    processes) in MB; None where the resource module is unavailable.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss / scale
+
+
+def _iter_row_chunks(qs, chunk_size: int) -> Iterator[List[Dict]]:
+    rows = []
+    for item in qs.order_by("id").values(*MENU_ITEM_FIELDS).iterator(chunk_size=chunk_size):
+        item["item_id"] = item.pop("id")
+        rows.append(item)
+        if len(rows) >= chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def build_menu_index(
+    restaurant_id: Optional[int] = None,
+    output_dir: Optional[Path] = None,
+    model_name: str = MENU_INDEX_MODEL,
+    full: bool = False,
+    batch_size: int = MENU_INDEX_BATCH_SIZE,
+    chunk_size: int = MENU_INDEX_CHUNK_SIZE,
+    workers: int = MENU_INDEX_BUILD_WORKERS,
+    publish: bool = True,
+    log: Callable[[str], None] = print,
+) -> Dict:
+    """
+    (Re)build the index of one restaurant, or of every restaurant with
+    available items or an existing index, and publish the new generations
+    to the web workers.
+
+    Returns a summary: restaurant_ids, items, encoded, dim, the time spent
+    loading the model / encoding (summed over pool workers) / overall
+    (seconds), items_per_second and peak RSS (MB) of this process and of
+    the encoder pool.
+    """
+    from menu.models import MenuItem
+
+    started = time.perf_counter()
+    output_dir = Path(output_dir if output_dir is not None else MENU_INDEX_DIR)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    chunk_size = max(1, chunk_size)
+
+    qs = MenuItem.objects.filter(available=True)
+    if restaurant_id:
+        qs = qs.filter(restaurant_id=restaurant_id)
+
+    # Each restaurant gets its own index, so rebuilding one
+    # never invalidates the others. Restaurants that still have an index
+    # but no available items (last item deleted or disabled) get an empty
+    # build, so their old items stop matching.
+    restaurant_ids = set(qs.values_list("restaurant_id", flat=True))
+    if restaurant_id:
+        restaurant_ids.add(int(restaurant_id))
+    else:
+        restaurant_ids.update(indexed_restaurant_ids(output_dir))
+    restaurant_ids = sorted(restaurant_ids)
+    summary = {
+        "restaurant_ids": restaurant_ids,
+        "items": 0,
+        "encoded": 0,
+        "dim": None,
+        "model_load_seconds": 0.0,
+        "encode_seconds": 0.0,
+        "total_seconds": 0.0,
+        "items_per_second": 0.0,
+        "peak_rss_mb": None,
+        "peak_worker_rss_mb": None,
+    }
+    if not restaurant_ids:
+        return summary
+
+    model_id = embedding_model_id(model_name)
+    encoder = ChunkEncoder(model_name, batch_size, workers)
+    summary["model_load_seconds"] = encoder.model_load_seconds
+    try:
+        for rid in restaurant_ids:
+            restaurant_qs = qs.filter(restaurant_id=rid)
+            total = restaurant_qs.count()
+            metadata = {"model": model_id, "restaurant_id": rid}
+
+            # One build per restaurant at a time (concurrent regen tasks
+            # queue on its lock instead of racing on the CURRENT pointer);
+            # the DB is read inside the lock so the last build has the
+            # newest data.
+            with RestaurantIndexBuild(rid, metadata, root=output_dir) as build:
+                # Reuse the vectors of unchanged items from the current build
+                previous = {} if full else reusable_vectors(rid, model_id, root=output_dir)
+                restaurant_started = time.perf_counter()
+                encoded_count = 0
+                pending = deque()
+
+                def flush_chunk():
+                    rows, stale, future = pending.popleft()
+                    encoded = None
+                    if future is not None:
+                        encoded, seconds = future.result()
+                        summary["encode_seconds"] += seconds
+                    dim = encoded.shape[1] if encoded is not None else len(next(iter(previous.values())))
+
+                    embeddings = np.empty((len(rows), dim), dtype=np.float32)
+                    for i, row in enumerate(rows):
+                        if row["content_hash"] in previous:
+                            embeddings[i] = previous[row["content_hash"]]
+                    if stale:
+                        embeddings[stale] = encoded
+                    # Parallel columns: row i ↔ embeddings[i] ↔ MenuItem.id
+                    build.append(embeddings, columns_from_rows(rows))
+                    summary["dim"] = dim
+
+                    elapsed = time.perf_counter() - restaurant_started
+                    if total > chunk_size:
+                        log(
+                            f"restaurant_id={rid}: {build.rows}/{total} items "
+                            f"({build.rows / max(elapsed, 1e-9):.0f} items/s)"
+                        )
+
+                for rows in _iter_row_chunks(restaurant_qs, chunk_size):
+                    chunks = []
+                    for row in rows:
+                        chunk = build_chunk_text(row["category"], row["name"], row["price"])
+                        row["content_hash"] = content_hash(model_id, chunk)
+                        chunks.append(chunk)
+                    stale = [i for i, row in enumerate(rows) if row["content_hash"] not in previous]
+                    future = encoder.encode([chunks[i] for i in stale]) if stale else None
+                    pending.append((rows, stale, future))
+                    encoded_count += len(stale)
+                    # Bounded look-ahead keeps the pool busy without
+                    # buffering the whole menu
+                    while len(pending) >= encoder.max_in_flight:
+                        flush_chunk()
+                while pending:
+                    flush_chunk()
+
+                build.metadata["total_items"] = build.rows
+                index_dir = build.commit()
+
+            log(
+                f"restaurant_id={rid}: saved {index_dir} ({build.rows} items, "
+                f"{encoded_count} encoded, {build.rows - encoded_count} reused)"
+            )
+            summary["items"] += build.rows
+            summary["encoded"] += encoded_count
+    finally:
+        encoder.close()
+
+    if publish:
+        # Tell web workers to swap in the new indexes
+        try:
+            publish_index_update(restaurant_ids)
+        except Exception as e:
+            log(f"Could not publish index update: {e}")
+
+    summary["total_seconds"] = time.perf_counter() - started
+    summary["items_per_second"] = summary["items"] / max(summary["total_seconds"], 1e-9)
+    summary["peak_rss_mb"] = peak_rss_mb()
+    if workers > 1:
+        summary["peak_worker_rss_mb"] = peak_rss_mb(children=True)
+    return summary
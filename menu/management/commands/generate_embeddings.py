@@ -5,16 +5,28 @@ Django management command to generate embeddings from MenuItem database.
 Usage:
     python manage.py generate_embeddings
     python manage.py generate_embeddings --restaurant-id 1
-    python manage.py generate_embeddings --output-dir /path/to/embeddings
+    python manage.py generate_embeddings --output-dir /path/to/menu_index
+    python manage.py generate_embeddings --full
+    python manage.py generate_embeddings --full --workers 4 --chunk-size 2048
+
+Each restaurant is written to its own <output-dir>/restaurant_<id>/ folder.
+The build is menu/index_builder.build_menu_index(): incremental (only new
+or changed items are re-encoded; --full re-encodes everything), streamed
+in chunks (--workers N encodes them in N processes), and published so running web workers swap in the new index (see
+chatbot/index_events.py).
 """
 
-import json
-import numpy as np
 from pathlib import Path
-from django.core.management.base import BaseCommand, CommandError
-from sentence_transformers import SentenceTransformer
+from django.core.management.base import BaseCommand
 
-from menu.models import MenuItem
+from chatbot.menu_index import MENU_INDEX_DIR
+from menu.index_builder import (
+    MENU_INDEX_BATCH_SIZE,
+    MENU_INDEX_BUILD_WORKERS,
+    MENU_INDEX_CHUNK_SIZE,
+    MENU_INDEX_MODEL,
+    build_menu_index,
+)
 
 
 class Command(BaseCommand):
@@ -29,43 +41,60 @@ class Command(BaseCommand):
         parser.add_argument(
             '--output-dir',
             type=str,
-            default='.',
-            help='Directory to save embeddings (default: project root)',
+            default=str(MENU_INDEX_DIR),
+            help=f'Root directory of the per-restaurant indexes (default: {MENU_INDEX_DIR})',
         )
         parser.add_argument(
             '--model',
             type=str,
-            default='sentence-transformers/all-mpnet-base-v2',
+            default=MENU_INDEX_MODEL,
             help='Sentence transformer model to use',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=MENU_INDEX_BATCH_SIZE,
+            help=f'Encode batch size (default: {MENU_INDEX_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=MENU_INDEX_CHUNK_SIZE,
+            help=f'Items read, encoded and written per chunk (default: {MENU_INDEX_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=MENU_INDEX_BUILD_WORKERS,
+            help='Encoder processes; 0 or 1 encodes in this process (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-encode every item instead of reusing unchanged vectors',
+        )
 
     def handle(self, *args, **options):
         restaurant_id = options.get('restaurant_id')
         output_dir = Path(options['output_dir'])
-        model_name = options['model']
-
-        # Create output directory if needed
-        output_dir.mkdir(parents=True, exist_ok=True)
 
-        # Build queryset
-        qs = MenuItem.objects.filter(available=True)
-        self.stdout.write("yes")
         if restaurant_id:
-            qs = qs.filter(restaurant_id=restaurant_id)
             self.stdout.write(f"Filtering by restaurant_id={restaurant_id}")
-            self.stdout.write("yes")
 
-        # Extract text chunks
-        self.stdout.write("Extracting menu items...")
-        chunks = []
-        item_ids = []
-        
-        for item in qs.select_related('restaurant'):
-            text = f"Category: {item.category}. Item: {item.name}. Price: {item.price}"
-            chunks.append(text)
-            item_ids.append(item.id)
+        # The build itself lives in menu/index_builder.py (shared with the
+        # Celery regen task, which keeps the model resident)
+        summary = build_menu_index(
+            restaurant_id=restaurant_id,
+            output_dir=output_dir,
+            model_name=options['model'],
+            full=options['full'],
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
 
-        if not chunks:
+        if not summary["restaurant_ids"]:
             msg = (
                 "No menu items found for embeddings! "
                 "This may happen if no MenuItem.objects.filter(available=True)"
@@ -75,49 +104,27 @@ class Command(BaseCommand):
             # Don't crash – just skip
             return
 
-        self.stdout.write(self.style.SUCCESS(f"✓ Extracted {len(chunks)} menu items"))
-
-        # Load model and generate embeddings
-        self.stdout.write(f"Loading model: {model_name}...")
-        model = SentenceTransformer(model_name)
-        
-        self.stdout.write("Generating embeddings...")
-        embeddings = model.encode(chunks, convert_to_numpy=True, show_progress_bar=True)
-
-        # Save embeddings
-        embeddings_path = output_dir / "menu_embeddings.npy"
-        np.save(embeddings_path, embeddings)
-        self.stdout.write(self.style.SUCCESS(f"✓ Saved: {embeddings_path}"))
-        self.stdout.write(f"  Shape: {embeddings.shape}")
-
-        # Save text chunks
-        chunks_path = output_dir / "text_chunks.json"
-        with open(chunks_path, "w", encoding="utf-8") as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
-        self.stdout.write(self.style.SUCCESS(f"✓ Saved: {chunks_path}"))
-
-        # Save metadata (mapping chunk index to MenuItem ID)
-        metadata_path = output_dir / "embedding_metadata.json"
-        metadata = {
-            "model": model_name,
-            "total_items": len(chunks),
-            "restaurant_id": restaurant_id,
-            "item_ids": item_ids,  # Maps index → MenuItem.id
-        }
-        with open(metadata_path, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
-        self.stdout.write(self.style.SUCCESS(f"✓ Saved: {metadata_path}"))
-
         # Summary
         self.stdout.write("\n" + "="*50)
         self.stdout.write(self.style.SUCCESS("✅ Embeddings generated successfully!"))
         self.stdout.write("="*50)
-        self.stdout.write(f"Items processed: {len(chunks)}")
-        self.stdout.write(f"Embedding dimensions: {embeddings.shape[1]}")
+        self.stdout.write(f"Restaurants processed: {len(summary['restaurant_ids'])}")
+        self.stdout.write(f"Items processed: {summary['items']} ({summary['encoded']} encoded)")
+        self.stdout.write(f"Embedding dimensions: {summary['dim']}")
+        self.stdout.write(
+            f"Time: {summary['total_seconds']:.1f}s "
+            f"(model load {summary['model_load_seconds']:.1f}s, encode {summary['encode_seconds']:.1f}s)"
+        )
+        self.stdout.write(f"Throughput: {summary['items_per_second']:.0f} items/s")
+        if summary['peak_rss_mb'] is not None:
+            rss = f"Peak RSS: {summary['peak_rss_mb']:.0f} MB"
+            if summary['peak_worker_rss_mb'] is not None:
+                rss += f" (encoder workers: {summary['peak_worker_rss_mb']:.0f} MB)"
+            self.stdout.write(rss)
         self.stdout.write(f"Output directory: {output_dir.absolute()}")
         self.stdout.write("\nNext steps:")
         self.stdout.write("1. Make sure GROQ_API_KEY is set in your .env")
-        self.stdout.write("2. Update chatbot/engine.py paths if needed")
+        self.stdout.write("2. Set MENU_INDEX_DIR if you used a custom --output-dir")
         self.stdout.write("3. Test: python manage.py runserver")
         self.stdout.write("4. Try: curl -X POST http://localhost:8000/api/chatbot/simple/ \\")
         self.stdout.write('     -H "Content-Type: application/json" \\')
@@ -1,45 +1,180 @@
 # menu/tasks.py
+"""
+Menu index rebuild tasks.
+
+Menu edits don't enqueue a rebuild each; they call schedule_menu_regen(),
+which coalesces every trigger for a restaurant into one rebuild:
+
+- each trigger bumps a pending counter and the "last trigger" time
+- only the first trigger of a burst enqueues flush_menu_regen (dedup key)
+- flush_menu_regen waits until the restaurant has been quiet for
+  MENU_REGEN_QUIET_SECONDS, but never longer than
+  MENU_REGEN_MAX_DELAY_SECONDS after the first trigger
+- the rebuild itself is single-flight per restaurant (lock key); triggers
+  that arrive while it runs start the next burst
+
+The keys live in the "chatbot" cache alias, i.e. Redis when
+CHATBOT_CACHE_URL is set. Without it the cache is per-process: the
+Celery worker would never see the web process's keys (and its
+"scheduled" key would swallow every later trigger), so each trigger
+just enqueues an uncoalesced regenerate_menu_embeddings instead.
+"""
+import os
+import time
+
 from celery import shared_task
-from django.core.management import call_command
-from django.core.management.base import CommandError
+from celery.signals import worker_process_init
+
+# ============================================
+# Configuration
+# ============================================
+MENU_REGEN_QUIET_SECONDS = float(os.getenv("MENU_REGEN_QUIET_SECONDS", "10"))
+MENU_REGEN_MAX_DELAY_SECONDS = float(os.getenv("MENU_REGEN_MAX_DELAY_SECONDS", "60"))
+MENU_REGEN_LOCK_TIMEOUT = int(os.getenv("MENU_REGEN_LOCK_TIMEOUT", "900"))
+MENU_REGEN_CACHE_ALIAS = "chatbot"
+# Load the build model when a worker process starts, not on its first rebuild
+MENU_INDEX_PRELOAD_MODEL = os.getenv("MENU_INDEX_PRELOAD_MODEL", "True") == "True"
+
+REGEN_KEY = "chatbot:menu-regen:{restaurant_id}:{part}"
+
+
+def _regen_cache():
+    from django.core.cache import caches
+    return caches[MENU_REGEN_CACHE_ALIAS]
+
+
+def _regen_key(restaurant_id, part: str) -> str:
+    return REGEN_KEY.format(restaurant_id=int(restaurant_id), part=part)
+
+
+def _regen_cache_is_shared(cache) -> bool:
+    """
+    Whether web and Celery processes see the same keys (not a
+    per-process local-memory or dummy cache).
+    """
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+    return not isinstance(cache, (LocMemCache, DummyCache))
 
 
 @shared_task
 def regenerate_menu_embeddings(restaurant_id=None):
     """
-    Regenerate menu_embeddings.npy + text_chunks.json from the DB
-    and reload them into the chatbot RAG engine.
+    Regenerate the per-restaurant menu index (menu_embeddings.vec +
+    menu_columns.npz) from the DB with build_menu_index(), which reuses
+    this worker's resident model and publishes the new index generation;
+    every web worker's listener swaps it in.
 
-    Usually called after menu extraction (PDF -> MenuItem) completes.
-    """
-    from chatbot.engine import reload_rag_system
-    from menu.models import MenuItem
+    Only the given restaurant's index is rebuilt; other restaurants keep
+    their files and in-memory indexes untouched.
 
-    # 🔹 Safety: if a restaurant_id is provided but has no available items,
-    # just skip instead of raising CommandError from the management command.
-    if restaurant_id is not None:
-        has_items = MenuItem.objects.filter(
-            restaurant_id=restaurant_id,
-            available=True,
-        ).exists()
-        if not has_items:
-            print(
-                f"[Celery] Skip regen: no available MenuItem for restaurant_id={restaurant_id}"
-            )
-            return
+    Usually run by flush_menu_regen (see schedule_menu_regen) after menu
+    edits or menu extraction (PDF -> MenuItem); call it directly for an
+    immediate, uncoalesced rebuild.
+    """
+    from menu.index_builder import build_menu_index
 
+    # A restaurant without available items still gets (an empty) build,
+    # otherwise its last deleted / disabled items would keep matching.
     try:
-        # 1) Regenerate embeddings file from DB
-        call_command(
-            "generate_embeddings",
-            restaurant_id=restaurant_id,
-            output_dir=".",  # same as your EMBEDDINGS_PATH/CHUNKS_PATH
-        )
-    except CommandError as e:
+        # Regenerate the index from DB (same root the engine reads from)
+        summary = build_menu_index(restaurant_id=restaurant_id)
+    except Exception as e:
         # Don't crash the worker, just log and exit
-        print(f"[Celery] generate_embeddings failed: {e}")
+        print(f"[Celery] Index build failed: {e}")
+        return
+
+    print(
+        f"[Celery] Regenerated embeddings for restaurant_id={restaurant_id} "
+        f"({summary['encoded']}/{summary['items']} items encoded in "
+        f"{summary['encode_seconds']:.2f}s, model load {summary['model_load_seconds']:.2f}s, "
+        f"total {summary['total_seconds']:.2f}s)"
+    )
+
+
+@worker_process_init.connect
+def preload_build_model(**kwargs):
+    if not MENU_INDEX_PRELOAD_MODEL:
         return
+    from menu.index_builder import get_build_model
+
+    try:
+        get_build_model()
+    except Exception as e:
+        print(f"[Celery] Could not preload the embedding model: {e}")
+
+
+def schedule_menu_regen(restaurant_id):
+    """
+    Request a (debounced, coalesced) index rebuild for one restaurant.
+    Cheap enough to call once per edited item. Returns the number of
+    triggers pending for the restaurant, including this one (always 1
+    without a shared cache, where every trigger enqueues its own rebuild).
+    """
+    if not restaurant_id:
+        return 0
+
+    cache = _regen_cache()
+    if not _regen_cache_is_shared(cache):
+        # No cross-process state to coalesce in: rebuild per trigger
+        regenerate_menu_embeddings.delay(restaurant_id)
+        return 1
+
+    now = time.time()
+    # Keys outlive the longest possible wait, so a lost task can't wedge them
+    ttl = int(MENU_REGEN_MAX_DELAY_SECONDS + MENU_REGEN_LOCK_TIMEOUT)
+
+    cache.add(_regen_key(restaurant_id, "first"), now, ttl)
+    cache.set(_regen_key(restaurant_id, "last"), now, ttl)
+    cache.add(_regen_key(restaurant_id, "count"), 0, ttl)
+    pending = cache.incr(_regen_key(restaurant_id, "count"))
+
+    # Only the first trigger of a burst enqueues the flush task
+    if cache.add(_regen_key(restaurant_id, "scheduled"), 1, ttl):
+        flush_menu_regen.apply_async(args=[restaurant_id], countdown=MENU_REGEN_QUIET_SECONDS)
+
+    return pending
+
+
+@shared_task
+def flush_menu_regen(restaurant_id):
+    """
+    Run the coalesced rebuild once the restaurant's edits have settled.
+    Re-schedules itself while edits keep arriving (up to the max delay)
+    or while another rebuild for the restaurant holds the lock.
+    """
+    cache = _regen_cache()
+    now = time.time()
+    # No state (e.g. a per-process cache the trigger didn't share): run now
+    first = cache.get(_regen_key(restaurant_id, "first"), 0)
+    last = cache.get(_regen_key(restaurant_id, "last"), 0)
+
+    quiet_left = MENU_REGEN_QUIET_SECONDS - (now - last)
+    cap_left = MENU_REGEN_MAX_DELAY_SECONDS - (now - first)
+    if quiet_left > 0 and cap_left > 0:
+        flush_menu_regen.apply_async(args=[restaurant_id], countdown=min(quiet_left, cap_left))
+        return None
+
+    lock_key = _regen_key(restaurant_id, "lock")
+    if not cache.add(lock_key, os.getpid(), MENU_REGEN_LOCK_TIMEOUT):
+        # Another rebuild is running; it read the DB before these edits
+        flush_menu_regen.apply_async(args=[restaurant_id], countdown=MENU_REGEN_QUIET_SECONDS)
+        return None
+
+    try:
+        merged = cache.get(_regen_key(restaurant_id, "count"), 0)
+        # Triggers from here on start a new burst (and a new task),
+        # which waits for this lock
+        cache.delete_many([
+            _regen_key(restaurant_id, part)
+            for part in ("first", "last", "count", "scheduled")
+        ])
+        print(
+            f"[Celery] Rebuilding index for restaurant_id={restaurant_id} "
+            f"(merged {merged} triggers)"
+        )
+        regenerate_menu_embeddings(restaurant_id)
+    finally:
+        cache.delete(lock_key)
 
-    # 2) Reload into memory for chatbot
-    reload_rag_system()
-    print(f"[Celery] Regenerated embeddings for restaurant_id={restaurant_id}")
+    return {"restaurant_id": restaurant_id, "merged_triggers": merged}
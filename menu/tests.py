@@ -1,3 +1,188 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from chatbot.menu_index import load_restaurant_index
+from menu import index_builder, tasks
+from menu.index_builder import build_menu_index
+from menu.models import MenuItem
+from restaurants.models import Restaurant
+
+
+class FakeEncoder:
+    """Deterministic stand-in for the sentence-transformers model."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.stack([self.vector(t) for t in texts])
+
+    @staticmethod
+    def vector(text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return np.frombuffer(digest, dtype=np.uint8)[:16].astype(np.float32) + 1.0
+
+
+class IncrementalIndexBuildTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+        self.encoder = FakeEncoder()
+        patches = [
+            mock.patch.object(index_builder, "load_embedding_model", lambda name: self.encoder),
+            mock.patch.object(index_builder, "embedding_model_id", lambda name: "fake-model"),
+            mock.patch.dict(index_builder._build_models, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.restaurant = Restaurant.objects.create(name="Test Kitchen", phone="1")
+        for i in range(6):
+            MenuItem.objects.create(
+                restaurant=self.restaurant, name=f"Dish {i}", category="Mains", price=100 + i
+            )
+
+    def build(self, **kwargs):
+        self.encoder.encoded.clear()
+        return build_menu_index(
+            restaurant_id=self.restaurant.id, output_dir=self.root, publish=False, log=lambda message: None, **kwargs
+        )
+
+    def load(self):
+        return load_restaurant_index(self.restaurant.id, self.root)
+
+    def assertVectorsMatchFreshEncode(self, index):
+        expected = np.stack([FakeEncoder.vector(index.chunk_text(i)) for i in range(len(index))])
+        expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+        np.testing.assert_allclose(np.asarray(index.embeddings, dtype=np.float32), expected, rtol=1e-5)
+
+    def test_only_changed_items_are_reencoded(self):
+        summary = self.build()
+        self.assertEqual((summary["items"], summary["encoded"]), (6, 6))
+
+        # Nothing changed: everything is reused
+        self.assertEqual(self.build()["encoded"], 0)
+
+        changed = MenuItem.objects.get(restaurant=self.restaurant, name="Dish 1")
+        changed.price = 999
+        changed.save()
+        MenuItem.objects.filter(restaurant=self.restaurant, name="Dish 2").delete()
+        MenuItem.objects.create(restaurant=self.restaurant, name="Dish 9", category="Mains", price=150)
+
+        summary = self.build()
+        self.assertEqual((summary["items"], summary["encoded"]), (6, 2))
+        self.assertEqual(len(self.encoder.encoded), 2)
+
+        index = self.load()
+        names = {index.row(i)["name"] for i in range(len(index))}
+        self.assertNotIn("Dish 2", names)
+        self.assertIn("Dish 9", names)
+        # Reused rows are exactly what a full re-encode would produce
+        self.assertVectorsMatchFreshEncode(index)
+
+    def test_full_rebuild_reencodes_everything(self):
+        self.build()
+        summary = self.build(full=True)
+        self.assertEqual(summary["encoded"], 6)
+        self.assertVectorsMatchFreshEncode(self.load())
+
+    def test_small_chunks_keep_rows_and_vectors_aligned(self):
+        self.build(chunk_size=4)
+        MenuItem.objects.filter(restaurant=self.restaurant, name="Dish 4").update(price=500)
+        summary = self.build(chunk_size=4)
+        self.assertEqual(summary["encoded"], 1)
+        self.assertVectorsMatchFreshEncode(self.load())
+
+    def test_restaurant_without_available_items_gets_empty_build(self):
+        self.build()
+        MenuItem.objects.filter(restaurant=self.restaurant).update(available=False)
+        summary = self.build()
+        self.assertEqual(summary["restaurant_ids"], [self.restaurant.id])
+        self.assertEqual(len(self.load()), 0)
+
+
+class CoalescedRegenTests(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        self.cache = LocMemCache("menu-regen-tests", {})
+        self.cache.clear()
+        self.apply_async = mock.Mock()
+        self.regenerate = mock.Mock()
+        patches = [
+            mock.patch.object(tasks, "_regen_cache", lambda: self.cache),
+            # Stand in for Redis: the web and worker "processes" share self.cache
+            mock.patch.object(tasks, "_regen_cache_is_shared", lambda cache: True),
+            mock.patch.object(tasks.flush_menu_regen, "apply_async", self.apply_async),
+            mock.patch.object(tasks, "regenerate_menu_embeddings", self.regenerate),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def settle(self, restaurant_id=1):
+        """Pretend the last trigger was long enough ago."""
+        past = time.time() - tasks.MENU_REGEN_QUIET_SECONDS - 1
+        self.cache.set(tasks._regen_key(restaurant_id, "last"), past)
+
+    def test_burst_enqueues_one_flush(self):
+        pending = [tasks.schedule_menu_regen(1) for _ in range(3)]
+        self.assertEqual(pending, [1, 2, 3])
+        self.apply_async.assert_called_once_with(args=[1], countdown=tasks.MENU_REGEN_QUIET_SECONDS)
+        # Another restaurant has its own burst
+        tasks.schedule_menu_regen(2)
+        self.assertEqual(self.apply_async.call_count, 2)
+
+    def test_flush_waits_for_quiet_then_rebuilds_once(self):
+        for _ in range(3):
+            tasks.schedule_menu_regen(1)
+        self.apply_async.reset_mock()
+
+        # Edits just arrived: re-schedule, don't rebuild yet
+        self.assertIsNone(tasks.flush_menu_regen(1))
+        self.regenerate.assert_not_called()
+        self.apply_async.assert_called_once()
+
+        self.settle()
+        result = tasks.flush_menu_regen(1)
+        self.assertEqual(result, {"restaurant_id": 1, "merged_triggers": 3})
+        self.regenerate.assert_called_once_with(1)
+
+        # The next edit starts a new burst
+        self.apply_async.reset_mock()
+        self.assertEqual(tasks.schedule_menu_regen(1), 1)
+        self.apply_async.assert_called_once()
+
+    def test_max_delay_caps_a_busy_burst(self):
+        tasks.schedule_menu_regen(1)
+        self.cache.set(tasks._regen_key(1, "first"), time.time() - tasks.MENU_REGEN_MAX_DELAY_SECONDS - 1)
+        tasks.schedule_menu_regen(1)  # still editing
+        tasks.flush_menu_regen(1)
+        self.regenerate.assert_called_once_with(1)
+
+    def test_running_rebuild_defers_the_flush(self):
+        tasks.schedule_menu_regen(1)
+        self.settle()
+        self.cache.add(tasks._regen_key(1, "lock"), 12345)
+        self.apply_async.reset_mock()
+
+        self.assertIsNone(tasks.flush_menu_regen(1))
+        self.regenerate.assert_not_called()
+        self.apply_async.assert_called_once_with(args=[1], countdown=tasks.MENU_REGEN_QUIET_SECONDS)
+
+    def test_per_process_cache_rebuilds_per_trigger(self):
+        with mock.patch.object(tasks, "_regen_cache_is_shared", lambda cache: False):
+            self.assertEqual(tasks.schedule_menu_regen(1), 1)
+            self.assertEqual(tasks.schedule_menu_regen(1), 1)
+        self.assertEqual(self.regenerate.delay.call_count, 2)
+        self.apply_async.assert_not_called()
@@ -97,10 +97,11 @@ class MenuItemViewSet(viewsets.ModelViewSet):
     def _trigger_embedding_regen(self, restaurant_id: int):
         """
         Small helper so we don't repeat imports everywhere.
-        Triggers Celery to rebuild embeddings for this restaurant.
+        Triggers Celery to rebuild embeddings for this restaurant;
+        bursts of edits are coalesced into one rebuild.
         """
-        from menu.tasks import regenerate_menu_embeddings
-        regenerate_menu_embeddings.delay(restaurant_id=restaurant_id)
+        from menu.tasks import schedule_menu_regen
+        schedule_menu_regen(restaurant_id)
 
     def perform_create(self, serializer):
         """
@@ -87,11 +87,11 @@ def build_menu_from_json(json_filename: str, restaurant: Union[Restaurant, int])
 
         # Only trigger embeddings regen if we actually have items
         if total_items > 0:
-            from menu.tasks import regenerate_menu_embeddings
+            from menu.tasks import schedule_menu_regen
 
             def _trigger():
                 # Run in background via Celery AFTER this transaction commits
-                regenerate_menu_embeddings.delay(restaurant.id)
+                schedule_menu_regen(restaurant.id)
 
             transaction.on_commit(_trigger)
 
@@ -188,6 +188,33 @@ load_dotenv()
 RAZORPAY_KEY_ID = "rzp_test_RhzCeosclaUqxF"  
 RAZORPAY_KEY_SECRET = "XX96bIHIZSD7gIc1vrIovw5U"
 
+# Caches
+# The "chatbot" cache is shared by all web/Celery processes (intent
+# classifications, menu regen coalescing keys). Point CHATBOT_CACHE_URL at
+# Redis in production, e.g. redis://localhost:6379/1; without it every
+# process falls back to its own local memory. Index generations don't go
+# through this cache: chatbot/index_events.py keeps them in Redis directly
+# (INDEX_INVALIDATION_REDIS_URL, defaulting to CHATBOT_CACHE_URL) or in
+# files under MENU_INDEX_DIR.
+CHATBOT_CACHE_URL = os.getenv('CHATBOT_CACHE_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'chatbot': (
+        {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CHATBOT_CACHE_URL,
+        }
+        if CHATBOT_CACHE_URL
+        else {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'chatbot',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    ),
+}
+
 # Celery Settings
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
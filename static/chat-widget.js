@@ -24,6 +24,13 @@
 
   const baseApiUrl = apiBaseUrl.replace(/\/$/, '');
   const apiUrl = baseApiUrl + '/api/chatbot/simple/';
+  const streamUrl = baseApiUrl + '/api/chatbot/simple/stream/';
+  // Stream replies token-by-token (SSE) unless data-stream="false";
+  // switched off for the session once the stream endpoint fails
+  let useStreaming =
+    currentScript.getAttribute('data-stream') !== 'false' &&
+    typeof ReadableStream !== 'undefined' &&
+    typeof TextDecoder !== 'undefined';
   const categoriesUrl = baseApiUrl + '/api/chatbot/categories/';
   const SESSION_KEY = 'rb_chat_session_id';
 
@@ -517,6 +524,103 @@
     div.textContent = text;
     messagesEl.appendChild(div);
     messagesEl.scrollTop = messagesEl.scrollHeight;
+    return div;
+  }
+
+  // 🔹 Plain JSON POST (no streaming)
+  async function postChat(body) {
+    const res = await fetch(apiUrl, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+    return await res.json();
+  }
+
+  // Error for a stream that failed before anything was rendered, so the
+  // message can safely be sent again through the plain endpoint
+  function streamUnavailable(message) {
+    const err = new Error(message);
+    err.retryWithoutStream = true;
+    return err;
+  }
+
+  // 🔹 POST to the SSE endpoint: render "token" events into one bot bubble
+  //    as they arrive, resolve with the final "done" payload.
+  async function postChatStreaming(body) {
+    let res;
+    try {
+      res = await fetch(streamUrl, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Accept: 'text/event-stream',
+        },
+        body: JSON.stringify(body),
+      });
+    } catch (err) {
+      throw streamUnavailable('Stream request failed: ' + err);
+    }
+    const contentType = res.headers.get('Content-Type') || '';
+    if (res.status === 503 && contentType.includes('application/json')) {
+      // Server still warming up: a normal reply, streaming stays on
+      return { data: await res.json(), bubble: null };
+    }
+    if (!res.ok || !res.body) {
+      throw streamUnavailable('Stream request failed: ' + res.status);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let bubble = null;
+    let donePayload = null;
+
+    function handleEvent(frame) {
+      let event = 'message';
+      const dataLines = [];
+      frame.split('\n').forEach(function (line) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trim());
+        }
+      });
+      if (!dataLines.length) return;
+      const data = JSON.parse(dataLines.join('\n'));
+
+      if (event === 'token') {
+        if (!bubble) {
+          bubble = addMessage('', 'bot');
+        }
+        bubble.textContent += data.text;
+        messagesEl.scrollTop = messagesEl.scrollHeight;
+      } else if (event === 'done') {
+        donePayload = data;
+      }
+    }
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) !== -1) {
+        handleEvent(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+      }
+    }
+    if (buffer.trim()) {
+      handleEvent(buffer);
+    }
+
+    if (!donePayload) {
+      // Nothing rendered (e.g. a proxy that swallowed the events): retry
+      const message = 'Stream ended without a final event';
+      throw bubble ? new Error(message) : streamUnavailable(message);
+    }
+    return { data: donePayload, bubble: bubble };
   }
 
   // 🔹 Render clickable menu items from backend "menu_items" with + / – / Add
@@ -686,17 +790,32 @@
     sendBtn.disabled = true;
 
     try {
-      const res = await fetch(apiUrl, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          restaurant_id: parseInt(restaurantId, 10),
-          session_id: sessionId,
-          message: trimmed,
-        }),
-      });
-
-      const data = await res.json();
+      const body = {
+        restaurant_id: parseInt(restaurantId, 10),
+        session_id: sessionId,
+        message: trimmed,
+      };
+
+      let data;
+      let streamedBubble = null;
+      if (useStreaming) {
+        try {
+          const streamed = await postChatStreaming(body);
+          data = streamed.data;
+          streamedBubble = streamed.bubble;
+        } catch (err) {
+          if (!err.retryWithoutStream) {
+            throw err;
+          }
+          // SSE blocked or failing: retry once through /simple/ and
+          // stop streaming for this session
+          console.warn('[ChatWidget] streaming unavailable, falling back:', err);
+          useStreaming = false;
+          data = await postChat(body);
+        }
+      } else {
+        data = await postChat(body);
+      }
       console.log('[ChatWidget] response:', data);
 
       if (data.session_id && data.session_id !== sessionId) {
@@ -704,8 +823,12 @@
         localStorage.setItem(SESSION_KEY, sessionId);
       }
 
-      // Show reply
-      addMessage(data.reply ?? 'No reply received from server.', 'bot');
+      // Show reply (already rendered token-by-token when streamed)
+      if (streamedBubble) {
+        streamedBubble.textContent = data.reply || streamedBubble.textContent;
+      } else {
+        addMessage(data.reply ?? 'No reply received from server.', 'bot');
+      }
 
       // If backend sent structured menu items, show them as clickable cards with qty
       if (Array.isArray(data.menu_items) && data.menu_items.length > 0) {